@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for the FastAPI service (run:app).
+
+The app is served by uvicorn on a background thread of this process and driven
+over real HTTP, so SSE streams, background tasks and the event bus behave as in
+production while resource usage of the whole service can be sampled in-process.
+LLM calls go to the offline fake backend by default (see llm_runtime.fake), so
+no API key or network access is needed.
+
+Each stage runs N concurrent clients; every client submits sessions one after
+another, alternating over the selected endpoints, and keeps the session's SSE
+stream open until the final session_completed event. Per stage it reports:
+
+- submit latency (POST round trip) p50/p95/p99
+- time to first event (from submit start to the first SSE event) p50/p95/p99
+- session duration p50/p95/p99, events received and events/sec
+- peak RSS and peak thread count of the process
+
+/api/reflection only publishes its final event, so its time to first event is the
+session duration; the per-endpoint breakdown keeps it apart from the realtime
+endpoint. The agents' console output is discarded while the stages run.
+
+Usage:
+    python benchmarks/load_test.py --stages 1,10,50 --sessions-per-client 2 --output bench.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+ENDPOINTS = {
+    "reflection": "/api/reflection",
+    "reflection-realtime": "/api/reflection-realtime",
+}
+
+QUERIES = [
+    "如何改善術後病患的傷口照護與追蹤流程？",
+    "急診檢傷分級常因人力不足而延誤，有哪些改善機會？",
+    "高齡慢性病患者在家中用藥依從性不佳，如何協助？",
+    "加護病房的儀器警報過多造成警報疲勞，該如何處理？",
+]
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """Nearest-rank p50/p95/p99 and max, in milliseconds"""
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return round(ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] * 1000, 1)
+
+    return {"p50": rank(50), "p95": rank(95), "p99": rank(99), "max": round(ordered[-1] * 1000, 1)}
+
+
+def process_usage() -> Dict[str, float]:
+    """Current RSS (MB) and OS thread count of this process"""
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return {"rss_mb": int(fields["VmRSS"].split()[0]) / 1024, "threads": int(fields["Threads"])}
+    except (OSError, KeyError, ValueError):
+        # Non-Linux: peak RSS from getrusage (bytes on macOS) and Python-level threads
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rss_mb = maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+        return {"rss_mb": rss_mb, "threads": threading.active_count()}
+
+
+class ResourceSampler:
+    """Samples RSS and thread count on an interval and keeps the peaks"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_rss_mb = 0.0
+        self.peak_threads = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def sample(self):
+        usage = process_usage()
+        self.peak_rss_mb = max(self.peak_rss_mb, usage["rss_mb"])
+        self.peak_threads = max(self.peak_threads, usage["threads"])
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+        self.sample()
+
+
+async def run_session(client: httpx.AsyncClient, endpoint: str, query: str, max_rounds: int) -> Dict[str, Any]:
+    """Submit one session and follow its SSE stream to the end"""
+    result: Dict[str, Any] = {"endpoint": endpoint, "ok": False, "events": 0, "ttfe": None}
+    started = time.perf_counter()
+    try:
+        response = await client.post(ENDPOINTS[endpoint], json={"query": query, "max_rounds": max_rounds})
+        result["submit"] = time.perf_counter() - started
+        response.raise_for_status()
+        session_id = response.json()["session_id"]
+
+        async with client.stream("GET", f"/api/reflection-stream/{session_id}") as stream:
+            stream.raise_for_status()
+            async for line in stream.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                if result["ttfe"] is None:
+                    result["ttfe"] = time.perf_counter() - started
+                result["events"] += 1
+                event = json.loads(line[len("data: "):])
+                if event.get("event_type") == "session_completed":
+                    result["ok"] = event.get("data", {}).get("status") == "completed"
+                    break
+    except (httpx.HTTPError, ValueError, KeyError) as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["duration"] = time.perf_counter() - started
+    return result
+
+
+async def run_stage(client: httpx.AsyncClient, concurrency: int, sessions_per_client: int,
+                    endpoints: List[str], max_rounds: int) -> Dict[str, Any]:
+    """Run one ramp stage: `concurrency` clients, each submitting sessions back to back"""
+    async def worker(worker_id: int) -> List[Dict[str, Any]]:
+        results = []
+        for i in range(sessions_per_client):
+            n = worker_id * sessions_per_client + i
+            query = f"{QUERIES[n % len(QUERIES)]}（案例 {n}）"
+            results.append(await run_session(client, endpoints[n % len(endpoints)], query, max_rounds))
+        return results
+
+    with ResourceSampler() as sampler:
+        started = time.perf_counter()
+        per_worker = await asyncio.gather(*(worker(w) for w in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    results = [r for rs in per_worker for r in rs]
+    events = sum(r["events"] for r in results)
+    errors = [r.get("error", "session failed") for r in results if not r["ok"]]
+    by_endpoint = {}
+    for endpoint in endpoints:
+        subset = [r for r in results if r["endpoint"] == endpoint]
+        by_endpoint[endpoint] = {
+            "sessions": len(subset),
+            "submit_latency_ms": percentiles([r["submit"] for r in subset if "submit" in r]),
+            "time_to_first_event_ms": percentiles([r["ttfe"] for r in subset if r["ttfe"] is not None]),
+        }
+    return {
+        "concurrency": concurrency,
+        "sessions": len(results),
+        "failed": len(errors),
+        "errors": sorted(set(errors))[:5],
+        "elapsed_s": round(elapsed, 3),
+        "submit_latency_ms": percentiles([r["submit"] for r in results if "submit" in r]),
+        "time_to_first_event_ms": percentiles([r["ttfe"] for r in results if r["ttfe"] is not None]),
+        "session_duration_ms": percentiles([r["duration"] for r in results]),
+        "events": events,
+        "events_per_sec": round(events / elapsed, 1) if elapsed else 0.0,
+        "sessions_per_sec": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "peak_rss_mb": round(sampler.peak_rss_mb, 1),
+        "peak_threads": sampler.peak_threads,
+        "by_endpoint": by_endpoint,
+    }
+
+
+def configure_environment(args: argparse.Namespace):
+    """Must run before run.py is imported: the agents build their LLM at import time"""
+    os.environ["LLM_BACKEND"] = args.backend
+    os.environ["FAKE_LLM_LATENCY"] = args.latency
+    os.environ["FAKE_LLM_TOKENS_PER_SECOND"] = str(args.tokens_per_second)
+    os.environ["FAKE_LLM_SEED"] = str(args.seed)
+    # Every session should exercise the full pipeline: no response cache, no session DB on disk
+    os.environ.setdefault("LLM_CACHE", "0")
+    os.environ.setdefault("SESSION_DB_PATH", "")
+
+
+def start_server(app, log_level: str):
+    """Serve app with uvicorn on a background thread; returns (server, thread, base_url)"""
+    import uvicorn
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level.lower(), access_log=False))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn failed to start")
+        time.sleep(0.01)
+    return server, thread, f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    configure_environment(args)
+    os.chdir(ROOT)  # run.py logs to logs/api.log relative to the working directory
+    from loguru import logger
+    import run
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    server, thread, base_url = start_server(run.app, args.log_level)
+    report: Dict[str, Any] = {
+        "started_at": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {
+            "backend": args.backend, "latency": args.latency, "tokens_per_second": args.tokens_per_second,
+            "seed": args.seed, "stages": args.stages, "sessions_per_client": args.sessions_per_client,
+            "endpoints": args.endpoints, "max_rounds": args.max_rounds,
+        },
+        "baseline": process_usage(),
+        "stages": [],
+    }
+    try:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            async with httpx.AsyncClient(base_url=base_url, timeout=httpx.Timeout(args.timeout), limits=limits) as client:
+                for concurrency in args.stages:
+                    stage = await run_stage(client, concurrency, args.sessions_per_client, args.endpoints, args.max_rounds)
+                    report["stages"].append(stage)
+                    print(f"[stage c={concurrency}] sessions={stage['sessions']} failed={stage['failed']} "
+                          f"submit p95={stage['submit_latency_ms']['p95']}ms "
+                          f"ttfe p95={stage['time_to_first_event_ms']['p95']}ms "
+                          f"events/s={stage['events_per_sec']} rss={stage['peak_rss_mb']}MB "
+                          f"threads={stage['peak_threads']}", file=sys.stderr)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+    return report
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test run:app with the offline fake LLM")
+    parser.add_argument("--stages", type=lambda s: [int(x) for x in s.split(",")], default=[1, 5, 20],
+                        help="comma-separated concurrency levels to ramp through (default 1,5,20)")
+    parser.add_argument("--sessions-per-client", type=int, default=2)
+    parser.add_argument("--endpoints", type=lambda s: s.split(","), default=list(ENDPOINTS),
+                        help=f"comma-separated subset of: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--max-rounds", type=int, default=3)
+    parser.add_argument("--backend", default="fake", help="LLM backend (default fake)")
+    parser.add_argument("--latency", default="lognormal:0.3,0.5", help="fake LLM first-token latency distribution")
+    parser.add_argument("--tokens-per-second", type=float, default=200, help="fake LLM output rate, 0 = unthrottled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300, help="per-request timeout in seconds")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    report = asyncio.run(run_benchmark(args))
+    payload = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload, encoding="utf-8")
+    else:
+        print(payload)
+    if any(stage["failed"] for stage in report["stages"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import argparse
+import json
+from src.prompts import AGENT_ROLES
+from src.scoring_bench import IMPLEMENTATIONS, make_dataset, run_benchmarks, format_report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="scoring.py 微基準測試（合成投票）")
+    parser.add_argument("--concepts", type=int, default=2000, help="概念數（預設 2000）")
+    parser.add_argument("--roles", type=int, default=len(AGENT_ROLES), help="投票角色數（預設為 AGENT_ROLES 數量）")
+    parser.add_argument("--repeat", type=int, default=5, help="每個函式重複次數，取最小值與中位數")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--impl", action="append", choices=sorted(IMPLEMENTATIONS),
+                        help="只比較指定實作（可重複；預設全部）")
+    parser.add_argument("--json", help="另存 JSON 報告的路徑")
+    args = parser.parse_args()
+
+    dataset = make_dataset(args.concepts, args.roles, args.seed)
+    report = run_benchmarks(dataset, repeat=args.repeat, implementations=args.impl)
+    print(format_report(report))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
@@ -1,29 +1,69 @@
-from typing import List, Dict, Any
-from langchain_openai import ChatOpenAI
+import sys
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
 from langchain_core.prompts import ChatPromptTemplate
-from .prompts import AGENT_ROLES, POSITION_TMPL, CRITIQUE_TMPL, REVISE_VOTE_TMPL, DELPHI_TMPL
+from .prompts import AGENT_ROLES, POSITION_TMPL, CRITIQUE_TMPL, REVISE_VOTE_TMPL, DELPHI_ROUND_TMPL
+from .vote_stream import VoteCallback, VoteStreamParser
+
+# 與主專案共用的 LLM 基礎設施（回應快取、限流等）位於專案根目錄的 llm_runtime 套件
+_REPO_ROOT = str(Path(__file__).resolve().parents[2])
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
+
+from llm_runtime import (astream_message, bypass_cache as llm_cache_bypass, create_chat_model,
+                         get_usage_tracker, usage_labels)
 
 def get_llm(model_name: str = "gpt-4.1-mini", temperature: float = 0.3):
-    return ChatOpenAI(model=model_name, temperature=temperature)
+    return create_chat_model(model_name, temperature)
 
+# --------- Prompts ---------
+# 模板只編譯一次，變數於呼叫時帶入（先 format 再 from_template 會把 JSON 範例的大括號誤判為變數）
+POSITION_PROMPT = ChatPromptTemplate.from_template(POSITION_TMPL)
+CRITIQUE_PROMPT = ChatPromptTemplate.from_template(CRITIQUE_TMPL)
+REVISE_VOTE_PROMPT = ChatPromptTemplate.from_template(REVISE_VOTE_TMPL)
+DELPHI_ROUND_PROMPT = ChatPromptTemplate.from_template(DELPHI_ROUND_TMPL)
+
+# --------- 同步呼叫 ---------
 def call_position(llm, role: str, need_text: str) -> str:
-    prompt = ChatPromptTemplate.from_template(POSITION_TMPL.format(need=need_text, role=role))
-    return (prompt | llm).invoke({}).content
+    return (POSITION_PROMPT | llm).invoke({"need": need_text, "role": role}).content
 
 def call_critique(llm, role: str, need_text: str, concepts_digest: str) -> str:
-    prompt = ChatPromptTemplate.from_template(CRITIQUE_TMPL.format(
-        need=need_text, role=role, concepts_digest=concepts_digest
-    ))
-    return (prompt | llm).invoke({}).content
+    return (CRITIQUE_PROMPT | llm).invoke({
+        "need": need_text, "role": role, "concepts_digest": concepts_digest
+    }).content
 
 def call_revise_vote(llm, role: str, need_text: str, concepts_and_critiques: str) -> str:
-    prompt = ChatPromptTemplate.from_template(REVISE_VOTE_TMPL.format(
-        need=need_text, role=role, concepts_and_critiques=concepts_and_critiques
-    ))
-    return (prompt | llm).invoke({}).content
-
-def call_delphi(llm, need_text: str, disputed: List[str]) -> str:
-    prompt = ChatPromptTemplate.from_template(DELPHI_TMPL.format(
-        need=need_text, disputed_criteria=", ".join(disputed)
-    ))
-    return (prompt | llm).invoke({}).content 
\ No newline at end of file
+    return (REVISE_VOTE_PROMPT | llm).invoke({
+        "need": need_text, "role": role, "concepts_and_critiques": concepts_and_critiques
+    }).content
+
+# --------- 非同步呼叫（供各角色並行 fan-out） ---------
+async def acall_position(llm, role: str, need_text: str) -> str:
+    return (await (POSITION_PROMPT | llm).ainvoke({"need": need_text, "role": role})).content
+
+async def acall_critique(llm, role: str, need_text: str, concepts_digest: str) -> str:
+    return (await (CRITIQUE_PROMPT | llm).ainvoke({
+        "need": need_text, "role": role, "concepts_digest": concepts_digest
+    })).content
+
+# --------- 串流投票（邊生成邊解析，每個投票物件閉合即可計分） ---------
+# 回傳 (parser, 本次呼叫的 token 數)；token 數取自 usage_metadata，沒有時為 0
+async def _astream_votes(chain, inputs: Dict[str, Any], role: str,
+                         on_vote: Optional[VoteCallback]) -> Tuple[VoteStreamParser, int]:
+    parser = VoteStreamParser(role, on_vote)
+    message = await astream_message(chain, inputs, lambda delta, _: parser.feed(delta), interval_ms=0)
+    parser.close()
+    usage = getattr(message, "usage_metadata", None) or {}
+    return parser, usage.get("total_tokens", 0)
+
+async def astream_revise_vote(llm, role: str, need_text: str, concepts_and_critiques: str,
+                              on_vote: Optional[VoteCallback] = None) -> Tuple[VoteStreamParser, int]:
+    return await _astream_votes(REVISE_VOTE_PROMPT | llm, {
+        "need": need_text, "role": role, "concepts_and_critiques": concepts_and_critiques
+    }, role, on_vote)
+
+async def astream_delphi(llm, role: str, need_text: str, disputed_items: str, round_no: int,
+                         on_vote: Optional[VoteCallback] = None) -> Tuple[VoteStreamParser, int]:
+    return await _astream_votes(DELPHI_ROUND_PROMPT | llm, {
+        "need": need_text, "role": role, "disputed_items": disputed_items, "round": round_no
+    }, role, on_vote)
@@ -0,0 +1,101 @@
+import re
+import sys
+from itertools import islice
+from typing import Dict, Iterable, List, Optional
+
+# 未指明概念的評論在輸出時放在此鍵下（不再複製到每個概念）
+GENERAL_CRITIQUES = "（整體評論）"
+
+_MARKER = re.compile(r"^\s*(?:[-•*#>]+|\d+[.、)）])\s*")
+_COLON = re.compile(r"[:：]")
+
+
+def _strip_markers(line: str) -> str:
+    # 去除條列符號、編號與 markdown 標記
+    prev = None
+    while prev != line:
+        prev, line = line, _MARKER.sub("", line)
+    return line.strip().strip("*_`「」【】\"'").strip()
+
+
+def _key(text: str) -> str:
+    return _strip_markers(text).rstrip(":： ").casefold()
+
+
+class CritiqueStore:
+    """
+    批評的索引儲存：所有行去重後 intern 在同一個 pool，每個概念只保存行索引。
+    行依標題指派給概念：「標題」單獨成行時其後各行歸屬該概念，「標題：內容」則直接歸屬；
+    未提及任何概念的行放入 general，不再廣播到每個概念。
+    標題比對只做雜湊查詢，時間與記憶體隨行數與概念數線性成長。
+    """
+
+    def __init__(self, titles: Iterable[str]):
+        self.lines: List[str] = []
+        self._line_index: Dict[str, int] = {}
+        self._by_title: Dict[str, Dict[int, None]] = {}   # dict 作為保序集合
+        self._title_keys: Dict[str, str] = {}
+        self.general: Dict[int, None] = {}
+        for title in titles:
+            self._by_title.setdefault(title, {})
+            self._title_keys.setdefault(_key(title), title)
+
+    def _intern(self, line: str) -> int:
+        idx = self._line_index.get(line)
+        if idx is None:
+            idx = self._line_index[line] = len(self.lines)
+            self.lines.append(sys.intern(line))
+        return idx
+
+    def match_title(self, line: str) -> Optional[tuple]:
+        """回傳 (標題, 標題後的內容) 或 None；由長到短嘗試整行與每個冒號前的前綴"""
+        title = self._title_keys.get(_key(line))
+        if title is not None:
+            return title, ""
+        cuts = [m.start() for m in _COLON.finditer(line)]
+        for cut in reversed(cuts):
+            title = self._title_keys.get(_key(line[:cut]))
+            if title is not None:
+                return title, line[cut + 1:]
+        return None
+
+    def add(self, line: str, title: Optional[str] = None):
+        line = _strip_markers(line)
+        if not line:
+            return
+        idx = self._intern(line)
+        target = self._by_title.get(title) if title is not None else None
+        (target if target is not None else self.general)[idx] = None
+
+    def add_text(self, text: str):
+        """加入一位專家的評論輸出；標題行決定其後各行歸屬的概念"""
+        current = None
+        for raw in text.splitlines():
+            if not raw.strip():
+                continue
+            matched = self.match_title(raw)
+            if matched is not None:
+                current, rest = matched
+                if _strip_markers(rest):
+                    self.add(rest, current)
+                continue
+            self.add(raw, current)
+
+    def lines_for(self, title: str) -> List[str]:
+        return [self.lines[i] for i in self._by_title.get(title, ())]
+
+    def summary_lines(self, title: str, limit: int = 3) -> List[str]:
+        """供修訂投票摘要：優先取針對該概念的評論，沒有時以整體評論補足"""
+        out = [self.lines[i] for i in islice(self._by_title.get(title, ()), limit)]
+        if len(out) < limit:
+            out.extend(self.lines[i] for i in islice(self.general, limit - len(out)))
+        return out
+
+    def to_dict(self) -> Dict[str, List[str]]:
+        out = {title: [self.lines[i] for i in idxs] for title, idxs in self._by_title.items()}
+        if self.general:
+            out[GENERAL_CRITIQUES] = [self.lines[i] for i in self.general]
+        return out
+
+    def __len__(self) -> int:
+        return len(self.lines)
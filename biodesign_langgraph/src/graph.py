@@ -1,28 +1,62 @@
-from typing import List, Dict, Any
+import asyncio
+import uuid
+from typing import List, Dict, Any, Awaitable, Callable, Optional, Tuple, TypedDict
 from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import HumanMessage
-from .types import NeedItem, Concept, ConceptScore, DebateOutput
+from .types import NeedItem, Concept, ConceptScore, DebateOutput, DelphiRound, VoteError
 from .prompts import AGENT_ROLES
-from .agents import get_llm, call_position, call_critique, call_revise_vote, call_delphi
-from .scoring import parse_revise_vote_json, aggregate_scores, weighted_total, sensitivity_note, find_disputed_criteria, ScoreItem, ConceptScore
+from .agents import (get_llm, get_usage_tracker, llm_cache_bypass, usage_labels, acall_position, acall_critique,
+                     astream_revise_vote, astream_delphi)
+from .critiques import CritiqueStore
+from .scoring import sensitivity_note, ScoreMatrix
 
-class DebateState(dict):
-    """in-memory 狀態；不落DB"""
-    pass
+class DebateState(TypedDict, total=False):
+    """in-memory 狀態；不落DB（欄位需宣告，LangGraph 依此建立 state channel）"""
+    need_text: str
+    top_n: int
+    concepts: List[Concept]
+    critiques: Dict[str, List[str]]
+    critique_store: CritiqueStore
+    scores: List[ConceptScore]
+    ranking: List[str]
+    revised_concepts: List[Concept]
+    vote_errors: List[VoteError]
+    delphi_rounds: List[DelphiRound]
+    delphi_stop_reason: str
+    output: Dict[str, Any]
 
 class BiodesignDebate:
-    def __init__(self, model_name: str = "gpt-4.1-mini", temperature: float = 0.3, rounds: int = 3, use_delphi: bool = True):
+    def __init__(self, model_name: str = "gpt-4.1-mini", temperature: float = 0.3, rounds: int = 3, use_delphi: bool = True,
+                 max_concurrency: int = len(AGENT_ROLES), delphi_rounds: int = 3, sd_threshold: float = 1.0,
+                 delphi_token_budget: Optional[int] = None):
         self.llm = get_llm(model_name, temperature)
         self.rounds = rounds
         self.use_delphi = use_delphi
+        # Delphi 最多輪數、分歧門檻（單格標準差）與 token 預算（None 為不限）
+        self.delphi_rounds = delphi_rounds
+        self.sd_threshold = sd_threshold
+        self.delphi_token_budget = delphi_token_budget
+        # 同一輪內各角色彼此獨立，可並行呼叫；此值限制同時進行的 LLM 請求數
+        self.max_concurrency = max_concurrency
         self.graph = self._build_graph()
 
+    async def _fan_out(self, call: Callable[[str], Awaitable[str]]) -> List[str]:
+        """對每個角色並行呼叫 call(role)，結果依 AGENT_ROLES 順序回傳"""
+        sem = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(role: str) -> str:
+            async with sem:
+                with usage_labels(role=role):
+                    return await call(role)
+
+        return await asyncio.gather(*(run(role) for role, _ in AGENT_ROLES))
+
     def _build_graph(self):
         builder = StateGraph(DebateState)
-        builder.add_node("position", self._position_round)
-        builder.add_node("critique", self._critique_round)
-        builder.add_node("revise_vote", self._revise_vote_round)
-        builder.add_node("aggregate", self._aggregate_node)
+        builder.add_node("position", self._labelled("position", self._position_round))
+        builder.add_node("critique", self._labelled("critique", self._critique_round))
+        builder.add_node("revise_vote", self._labelled("revise_vote", self._revise_vote_round))
+        builder.add_node("aggregate", self._labelled("aggregate", self._aggregate_node))
         builder.add_edge(START, "position")
         builder.add_edge("position", "critique")
         builder.add_edge("critique", "revise_vote")
@@ -30,12 +64,20 @@ class BiodesignDebate:
         builder.add_edge("aggregate", END)
         return builder.compile()
 
+    @staticmethod
+    def _labelled(node: str, fn: Callable[[DebateState], Awaitable[DebateState]]):
+        """節點內的 LLM 呼叫以節點名稱歸屬用量"""
+        async def run(state: DebateState) -> DebateState:
+            with usage_labels(node=node):
+                return await fn(state)
+        return run
+
     # --------- Nodes ---------
-    def _position_round(self, state: DebateState) -> DebateState:
+    async def _position_round(self, state: DebateState) -> DebateState:
         need_text: str = state["need_text"]
         concepts: List[Concept] = []
-        for role, sys in AGENT_ROLES:
-            txt = call_position(self.llm, role, need_text)
+        texts = await self._fan_out(lambda role: acall_position(self.llm, role, need_text))
+        for (role, _), txt in zip(AGENT_ROLES, texts):
             # 解析：簡單規則，抓每個「- 標題」開頭；也可改為結構化輸出
             for block in [b.strip() for b in txt.split("\n- ") if b.strip()]:
                 # 取第一行為標題，後續為說明
@@ -46,58 +88,97 @@ class BiodesignDebate:
                     concepts.append(Concept(title=title, description=desc, source_agent=role))
         return {**state, "concepts": concepts}
 
-    def _critique_round(self, state: DebateState) -> DebateState:
+    async def _critique_round(self, state: DebateState) -> DebateState:
         need_text: str = state["need_text"]
         concepts: List[Concept] = state["concepts"]
         digest = "\n".join([f"- {c.title}: {c.description[:120]}" for c in concepts[:10]])  # 避免過長
-        critiques: Dict[str, List[str]] = {c.title: [] for c in concepts}
-        for role, _ in AGENT_ROLES:
-            txt = call_critique(self.llm, role, need_text, digest)
-            # 粗略切條列
-            for line in [l.strip("-• ").strip() for l in txt.splitlines() if l.strip()]:
-                # 直接掛到全部概念；若要更精細，可建立「針對某標題的批評」抽取
-                for c in concepts:
-                    if line and line not in critiques[c.title]:
-                        critiques[c.title].append(line)
-        return {**state, "critiques": critiques}
-
-    def _revise_vote_round(self, state: DebateState) -> DebateState:
+        store = CritiqueStore(c.title for c in concepts)
+        texts = await self._fan_out(lambda role: acall_critique(self.llm, role, need_text, digest))
+        for txt in texts:
+            # 依標題指派給對應概念；未指明概念者歸入整體評論
+            store.add_text(txt)
+        critiques = store.to_dict()
+        return {**state, "critiques": critiques, "critique_store": store}
+
+    async def _revise_vote_round(self, state: DebateState) -> DebateState:
         need_text = state["need_text"]
         concepts: List[Concept] = state["concepts"]
-        critiques: Dict[str, List[str]] = state["critiques"]
-        summary = "\n".join([f"- {c.title}: 批評重點={'; '.join(critiques.get(c.title, [])[:3])}" for c in concepts])
+        store: CritiqueStore = state["critique_store"]
+        summary = "\n".join([f"- {c.title}: 批評重點={'; '.join(store.summary_lines(c.title))}" for c in concepts])
+
+        # 每個角色為 matrix 的一個 voter 層：concept × criterion × voter
+        # 投票以串流解析，每個物件閉合即寫入該角色的層，不必等整段輸出結束
+        roles = [role for role, _ in AGENT_ROLES]
+        matrix = ScoreMatrix(titles=[c.title for c in concepts], voters=len(roles))
 
-        all_votes = []
-        for role, _ in AGENT_ROLES:
-            payload = call_revise_vote(self.llm, role, need_text, summary)
-            parsed = parse_revise_vote_json(payload)
-            all_votes.extend(parsed)
+        def add_to(layer: int):
+            return lambda vote: matrix.add_votes([vote], voter=layer)
 
-        store = aggregate_scores(all_votes)    # concept_title -> [ScoreItem...]
+        results = await self._fan_out(
+            lambda role: astream_revise_vote(self.llm, role, need_text, summary, on_vote=add_to(roles.index(role))))
+        vote_errors = [err for parser, _ in results for err in parser.errors]
 
-        # 可選 Delphi 收斂
+        # 可選 Delphi 收斂（多輪，各角色就地重評仍分歧的格）
+        delphi_rounds, stop_reason = [], ""
         if self.use_delphi:
-            disputed = find_disputed_criteria(store, sd_threshold=1.0)
-            if disputed:
-                delphi_payload = call_delphi(self.llm, need_text, disputed)
-                delphi_votes = parse_revise_vote_json(delphi_payload)
-                dv = aggregate_scores(delphi_votes)
-                for title, add_scores in dv.items():
-                    store.setdefault(title, []).extend(add_scores)
-
-        # 計總分
-        totals = {title: weighted_total(items) for title, items in store.items()}
-        ranking = [k for k, _ in sorted(totals.items(), key=lambda x: x[1], reverse=True)]
-
-        # 回組 ConceptScore
-        concept_scores = []
-        for title, items in store.items():
-            concept_scores.append(ConceptScore(concept_title=title, by_criterion=items, total=totals[title]))
+            delphi_rounds, stop_reason, delphi_errors = await self._delphi(matrix, need_text, roles)
+            vote_errors.extend(delphi_errors)
+
+        # 概念列依提案順序預先建立，輸出順序不受串流到達先後影響；未獲投票的概念不列入排名
+        matrix.drop_unvoted()
+        # 計總分與排名皆為向量運算；ConceptScore 只在此輸出時建立
+        ranking = matrix.ranking()
+        concept_scores = matrix.to_concept_scores()
 
         # 概念修訂（示意：在此不做二次生成；若要真正修訂，可再呼叫一次 LLM）
-        return {**state, "scores": concept_scores, "ranking": ranking, "revised_concepts": concepts}
+        return {**state, "scores": concept_scores, "ranking": ranking, "revised_concepts": concepts,
+                "vote_errors": vote_errors, "delphi_rounds": delphi_rounds, "delphi_stop_reason": stop_reason}
+
+    async def _delphi(self, matrix: ScoreMatrix, need_text: str,
+                      roles: List[str]) -> Tuple[List[DelphiRound], str, List[VoteError]]:
+        """
+        多輪 Delphi：每輪只詢問單格標準差仍 >= sd_threshold 的 (概念, 面向)，
+        各角色參考群體中位數/四分位距重評，新分數就地取代該角色原分數（matrix 不重建），
+        之後只重算本輪詢問過的格。分歧消失、達 delphi_rounds 或 token 預算不足下一輪時停止。
+        """
+        rounds: List[DelphiRound] = []
+        errors: List[VoteError] = []
+        cells = matrix.disputed_cells(self.sd_threshold)
+        ranking = matrix.ranking()
+        spent = last = 0
+        for round_no in range(1, self.delphi_rounds + 1):
+            if not cells:
+                return rounds, "converged", errors
+            # 以上一輪的花費估計下一輪，預算不足就不再開始
+            if self.delphi_token_budget is not None and spent + last >= self.delphi_token_budget:
+                return rounds, "token_budget", errors
+            queried = cells
+            feedback = {(t, c): matrix.cell_summary(t, c) for t, criteria in queried.items() for c in criteria}
+
+            def ask(role: str):
+                layer = roles.index(role)
+                lines = []
+                for (title, criterion), (median, q1, q3) in feedback.items():
+                    mine = matrix.score_of(title, criterion, layer)
+                    lines.append(f"- {title} | {criterion}：群體中位數 {median:g}，四分位距 {q1:g}–{q3:g}，"
+                                 f"你上一輪 {'未評' if mine is None else f'{mine:g}'}")
+                return astream_delphi(self.llm, role, need_text, "\n".join(lines), round_no,
+                                      on_vote=lambda vote: matrix.replace_votes([vote], layer, queried))
 
-    def _aggregate_node(self, state: DebateState) -> DebateState:
+            with usage_labels(node="delphi", round=round_no):
+                results = await self._fan_out(ask)
+            last = sum(tokens for _, tokens in results)
+            spent += last
+            errors.extend(err for parser, _ in results for err in parser.errors)
+
+            cells = matrix.disputed_cells(self.sd_threshold, cells=queried)
+            new_ranking = matrix.ranking()
+            rounds.append(DelphiRound(round=round_no, queried=queried, still_disputed=sum(map(len, cells.values())),
+                                      tokens=last, ranking_changed=new_ranking != ranking))
+            ranking = new_ranking
+        return rounds, ("converged" if not cells else "max_rounds"), errors
+
+    async def _aggregate_node(self, state: DebateState) -> DebateState:
         top_n = state.get("top_n", 3)
         ranking: List[str] = state["ranking"]
         scores: List[ConceptScore] = state["scores"]
@@ -109,7 +190,8 @@ class BiodesignDebate:
         prompt = ChatPromptTemplate.from_template(DECISION_TMPL.format(top_n=topn))
         need_text = state["need_text"]
         ctx = f"Need: {need_text}\n排名：{ranking[:topn]}\n分數：{[(s.concept_title, s.total) for s in scores]}"
-        decision = (prompt | self.llm).invoke({"input": ctx}).content
+        with usage_labels(role="decision"):
+            decision = (await (prompt | self.llm).ainvoke({"input": ctx})).content
 
         out = {
             "proposed_concepts": state["concepts"],
@@ -119,11 +201,27 @@ class BiodesignDebate:
             "ranking": ranking,
             "sensitivity_note": note,
             "decision_summary": decision,
+            "vote_errors": state.get("vote_errors", []),
+            "delphi_rounds": state.get("delphi_rounds", []),
+            "delphi_stop_reason": state.get("delphi_stop_reason", ""),
         }
         return {**state, "output": out}
 
     # --------- 執行介面 ---------
-    def run(self, need: NeedItem, top_n: int = 3) -> DebateOutput:
+    async def arun(self, need: NeedItem, top_n: int = 3, bypass_cache: bool = False) -> DebateOutput:
         init = DebateState(need_text=need.need, top_n=top_n)
-        result = self.graph.invoke(init)
-        return DebateOutput(**result["output"]) 
\ No newline at end of file
+        # 每次辯論以獨立的 session 標籤彙總各節點 / 角色 / Delphi 輪次的 token、成本與延遲
+        session_id = f"debate-{uuid.uuid4().hex}"
+        tracker = get_usage_tracker()
+        # bypass_cache=True 時本次辯論不讀寫 LLM 回應快取（刻意需要非確定性輸出時使用）
+        try:
+            with llm_cache_bypass(bypass_cache), usage_labels(session=session_id):
+                result = await self.graph.ainvoke(init)
+            usage = tracker.session_summary(session_id) or {}
+        finally:
+            tracker.discard(session_id)
+        return DebateOutput(**result["output"], usage=usage)
+
+    def run(self, need: NeedItem, top_n: int = 3, bypass_cache: bool = False) -> DebateOutput:
+        # 節點皆為 async（各角色並行），同步介面透過 asyncio.run 驅動
+        return asyncio.run(self.arun(need, top_n, bypass_cache)) 
\ No newline at end of file
@@ -75,11 +75,13 @@ REVISE_VOTE_TMPL = """[Need]
    "scores":[{{"criterion":"CLINICAL_VALUE","score":X,"rationale":"..."}}, ...]}} , ...
 ]"""
 
-DELPHI_TMPL = """[Need]
+DELPHI_ROUND_TMPL = """[Need]
 {need}
 
-下列面向的分歧較大（顯著標準差）：{disputed_criteria}
-請僅針對分歧面向，重新評分並給一句理由。輸出 JSON：[
+Delphi 第 {round} 輪：下列概念與面向的專家評分仍有分歧。每項附群體中位數、四分位距與你上一輪的分數：
+{disputed_items}
+
+請以「角色：{role}」參考群體回饋，僅針對上列項目重新評分並給一句理由（理由充分時可維持原分）。輸出 JSON：[
  {{"concept_title":"...", "scores":[{{"criterion":"TECH_FEAS","score":X,"rationale":"..."}}, ...]}}
 ]"""
 
@@ -1,15 +1,16 @@
-import json, statistics
-from typing import List, Dict, Tuple
+import statistics
+from typing import Iterable, List, Dict, Optional, Tuple
+import numpy as np
 from .types import CriteriaCode, CRITERIA_WEIGHTS, ConceptScore, ScoreItem
+from .vote_stream import check_score, parse_votes
+
+CRITERIA: List[CriteriaCode] = list(CRITERIA_WEIGHTS)
+_CRITERION_INDEX = {c: i for i, c in enumerate(CRITERIA)}
+_WEIGHTS = np.array([CRITERIA_WEIGHTS[c] for c in CRITERIA])
 
 def parse_revise_vote_json(payload: str) -> List[dict]:
-    # 容錯：去除代碼區塊或雜訊
-    try:
-        start = payload.find("[")
-        end = payload.rfind("]")
-        return json.loads(payload[start:end+1])
-    except Exception:
-        return []
+    # 容錯：去除代碼區塊或雜訊；單筆格式錯誤只略過該筆（逐筆錯誤見 vote_stream.parse_votes）
+    return parse_votes(payload).votes
 
 def aggregate_scores(items: List[dict]) -> Dict[str, List[ScoreItem]]:
     # concept_title -> [ScoreItem...]
@@ -61,4 +62,250 @@ def find_disputed_criteria(store: Dict[str, List[ScoreItem]], sd_threshold: floa
                     disputed.append(crit)
             except statistics.StatisticsError:
                 pass
-    return disputed 
\ No newline at end of file
+    return disputed 
+
+class ScoreMatrix:
+    """
+    以陣列保存的投票分數：scores[concept, criterion, voter]，缺值為 NaN。
+    直接由解析後的 JSON 建立；加權總分、各面向平均/標準差與分歧面向皆以 NumPy 向量運算，
+    pydantic 的 ConceptScore 只在輸出時建立。
+    可預先給定概念與投票者層數，讓串流解析出的投票逐筆加入指定的 voter 層。
+    """
+
+    def __init__(self, titles: Iterable[str] = (), voters: int = 0):
+        self.titles: List[str] = []
+        # 每個概念依投票順序保存 (voter, criterion, score, rationale)，僅供輸出 by_criterion
+        self._items: List[List[Tuple[int, str, float, str]]] = []
+        self._index: Dict[str, int] = {}
+        self._voted: List[bool] = []      # 預先建立的概念列是否收到過投票
+        # 底層陣列保留額外容量，逐筆加入時不必每次重新配置
+        self._data = np.full((0, len(CRITERIA), 0), np.nan)
+        self._voters = 0
+        # voter 層 -> 所屬投票者；同一格重複評分時放到額外的 overflow 層
+        self._owner: List[int] = []
+        self._overflow: Dict[int, List[int]] = {}
+        for title in titles:
+            self._row(title)
+        for _ in range(voters):
+            self.add_voter()
+
+    @classmethod
+    def from_votes(cls, votes_by_voter: List[List[dict]]) -> "ScoreMatrix":
+        matrix = cls()
+        for votes in votes_by_voter:
+            matrix.add_votes(votes)
+        return matrix
+
+    @property
+    def scores(self) -> np.ndarray:
+        return self._data[:len(self.titles), :, :self._voters]
+
+    @property
+    def voters(self) -> int:
+        return self._voters
+
+    def add_voter(self, owner: Optional[int] = None) -> int:
+        """新增一個 voter 層（一個角色或一輪 Delphi）並回傳其索引"""
+        layer = self._voters
+        self._voters += 1
+        self._owner.append(layer if owner is None else owner)
+        self._reserve(len(self.titles), self._voters)
+        return layer
+
+    def add_votes(self, votes: List[dict], voter: Optional[int] = None):
+        """
+        加入一位投票者的投票；voter 未指定時新增一層。
+        串流時同一投票者的投票可分多次加入；同一格重複評分時放到該投票者的 overflow 層。
+        """
+        fresh = voter is None
+        if fresh:
+            voter = self.add_voter()
+        rows, cols, values = [], [], []
+        for itm in votes:
+            if not isinstance(itm, dict):
+                continue
+            title = itm.get("concept_title", "")
+            if not title:
+                continue
+            row = self._row(title)
+            self._voted[row] = True
+            for sc in itm.get("scores", []):
+                # 與 ScoreItem 的驗證一致：未知面向、非數值或超出 0-5 的分數略過
+                try:
+                    criterion, value, rationale = check_score(sc)
+                except ValueError:
+                    continue
+                rows.append(row); cols.append(_CRITERION_INDEX[criterion]); values.append(value)
+                self._items[row].append((voter, criterion, value, rationale))
+
+        if fresh and len(set(zip(rows, cols))) == len(rows):
+            # 新的一層且沒有重複評分：一次寫入
+            self._data[rows, cols, voter] = values
+            return
+        for row, col, value in zip(rows, cols, values):
+            layer = self._free_layer(row, col, voter)   # 可能擴充 _data，須先於索引取得
+            self._data[row, col, layer] = value
+
+    def _row(self, title: str) -> int:
+        row = self._index.get(title)
+        if row is None:
+            row = self._index[title] = len(self.titles)
+            self.titles.append(title)
+            self._items.append([])
+            self._voted.append(False)
+            self._reserve(len(self.titles), self._voters)
+        return row
+
+    def drop_unvoted(self):
+        """移除預先建立但沒有收到任何投票的概念列（輸出與逐筆彙整一致）"""
+        keep = [i for i, voted in enumerate(self._voted) if voted]
+        if len(keep) == len(self.titles):
+            return
+        self._data = self._data[keep]
+        self.titles = [self.titles[i] for i in keep]
+        self._items = [self._items[i] for i in keep]
+        self._voted = [True] * len(keep)
+        self._index = {t: i for i, t in enumerate(self.titles)}
+
+    def _free_layer(self, row: int, col: int, voter: int) -> int:
+        layers = self._overflow.setdefault(voter, [])
+        for layer in (voter, *layers):
+            if np.isnan(self._data[row, col, layer]):
+                return layer
+        layers.append(self.add_voter(owner=voter))
+        return layers[-1]
+
+    def _reserve(self, concepts: int, voters: int):
+        # 容量不足時倍增，逐筆加入的配置成本攤銷為 O(1)
+        c, k, v = self._data.shape
+        if concepts <= c and voters <= v:
+            return
+        grown = np.full((max(concepts, 2 * c if concepts > c else c), k, max(voters, 2 * v if voters > v else v)), np.nan)
+        grown[:c, :, :v] = self._data
+        self._data = grown
+
+    # ---- 向量運算 ----
+    # rows 為概念列索引；給定時只計算這些列（Delphi 每輪只重算仍分歧的概念）
+    def _rows(self, rows: Optional[np.ndarray]) -> np.ndarray:
+        return self.scores if rows is None else self.scores[rows]
+
+    def counts(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """(concept, criterion) 的有效票數"""
+        return np.count_nonzero(~np.isnan(self._rows(rows)), axis=2)
+
+    def criterion_means(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """(concept, criterion) 的平均分；無票為 NaN"""
+        counts = self.counts(rows)
+        sums = np.nansum(self._rows(rows), axis=2)
+        return np.divide(sums, counts, out=np.full(sums.shape, np.nan), where=counts > 0)
+
+    def criterion_sds(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """(concept, criterion) 的樣本標準差；少於 2 票為 NaN"""
+        counts = self.counts(rows)
+        dev = np.nan_to_num(self._rows(rows) - self.criterion_means(rows)[:, :, None])
+        var = np.divide((dev ** 2).sum(axis=2), counts - 1, out=np.full(counts.shape, np.nan), where=counts > 1)
+        return np.sqrt(var)
+
+    def weighted_totals(self) -> np.ndarray:
+        # 取相同面向的平均後加權；無票的面向不計分
+        return np.round(np.nan_to_num(self.criterion_means()) @ _WEIGHTS, 4)
+
+    def disputed_criteria(self, sd_threshold: float = 1.0, min_votes: int = 3) -> List[str]:
+        """各面向跨所有概念與投票者的標準差 >= 門檻者（同 find_disputed_criteria）"""
+        flat = self.scores.transpose(1, 0, 2).reshape(len(CRITERIA), -1)
+        valid = ~np.isnan(flat)
+        n = valid.sum(axis=1)
+        mean = np.divide(np.where(valid, flat, 0).sum(axis=1), n, out=np.zeros(len(CRITERIA)), where=n > 0)
+        ss = np.where(valid, flat - mean[:, None], 0) ** 2
+        sd = np.sqrt(np.divide(ss.sum(axis=1), n - 1, out=np.zeros(len(CRITERIA)), where=n > 1))
+        return [CRITERIA[k] for k in np.flatnonzero((n >= min_votes) & (sd >= sd_threshold))]
+
+    def disputed_cells(self, sd_threshold: float = 1.0, min_votes: int = 3,
+                       cells: Optional[Dict[str, List[str]]] = None) -> Dict[str, List[str]]:
+        """
+        逐 (概念, 面向) 的標準差 >= 門檻者：concept_title -> [criterion...]（依概念與 CRITERIA 順序）。
+        給定 cells 時只重算這些格，分歧只會在其中持續（Delphi 只改動被詢問的格）。
+        """
+        if cells is None:
+            rows = np.arange(len(self.titles))
+            mask = None
+        else:
+            rows = np.array([self._index[t] for t in cells], dtype=int)
+            mask = np.zeros((len(rows), len(CRITERIA)), dtype=bool)
+            for i, criteria in enumerate(cells.values()):
+                mask[i, [_CRITERION_INDEX[c] for c in criteria]] = True
+        hit = (self.counts(rows) >= min_votes) & (self.criterion_sds(rows) >= sd_threshold)
+        if mask is not None:
+            hit &= mask
+        out: Dict[str, List[str]] = {}
+        for r, k in zip(*np.nonzero(hit)):
+            out.setdefault(self.titles[rows[r]], []).append(CRITERIA[k])
+        return out
+
+    def cell_summary(self, title: str, criterion: str) -> Tuple[float, float, float]:
+        """該格的 (中位數, Q1, Q3)，作為 Delphi 的群體回饋"""
+        values = self.scores[self._index[title], _CRITERION_INDEX[criterion]]
+        q1, median, q3 = np.percentile(values[~np.isnan(values)], [25, 50, 75])
+        return float(median), float(q1), float(q3)
+
+    def score_of(self, title: str, criterion: str, voter: int) -> Optional[float]:
+        value = self.scores[self._index[title], _CRITERION_INDEX[criterion], voter]
+        return None if np.isnan(value) else float(value)
+
+    def replace_votes(self, votes: List[dict], voter: int, cells: Optional[Dict[str, List[str]]] = None) -> int:
+        """
+        以投票者的新評分就地取代其原評分（Delphi 重評），回傳更新的格數。
+        同一格在 overflow 層也有評分時一併取代，該投票者的票數不變、不殘留舊分。
+        給定 cells 時只接受其中的格；不新增概念。
+        """
+        updated = 0
+        layers = (voter, *self._overflow.get(voter, ()))
+        for itm in votes:
+            if not isinstance(itm, dict):
+                continue
+            title = itm.get("concept_title", "")
+            row = self._index.get(title)
+            if row is None or (cells is not None and title not in cells):
+                continue
+            allowed = cells[title] if cells is not None else CRITERIA
+            for sc in itm.get("scores", []):
+                try:
+                    criterion, value, rationale = check_score(sc)
+                except ValueError:
+                    continue
+                if criterion not in allowed:
+                    continue
+                col = _CRITERION_INDEX[criterion]
+                for layer in layers:
+                    if layer == voter or not np.isnan(self._data[row, col, layer]):
+                        self._data[row, col, layer] = value
+                self._voted[row] = True
+                items = self._items[row]
+                entry = (voter, criterion, value, rationale)
+                positions = [i for i, it in enumerate(items) if it[0] == voter and it[1] == criterion]
+                for pos in positions:
+                    items[pos] = entry
+                if not positions:
+                    items.append(entry)
+                updated += 1
+        return updated
+
+    # ---- 輸出 ----
+    def totals(self) -> Dict[str, float]:
+        return dict(zip(self.titles, self.weighted_totals().tolist()))
+
+    def ranking(self) -> List[str]:
+        order = np.argsort(-self.weighted_totals(), kind="stable")
+        return [self.titles[i] for i in order]
+
+    def to_store(self) -> Dict[str, List[ScoreItem]]:
+        """轉回 aggregate_scores 的格式（concept_title -> [ScoreItem...]）"""
+        # 依投票者排序，串流時各角色交錯加入的順序不影響輸出
+        return {t: [ScoreItem.model_construct(criterion=c, score=v, rationale=r)
+                    for _, c, v, r in sorted(items, key=lambda it: it[0])]
+                for t, items in zip(self.titles, self._items)}
+
+    def to_concept_scores(self) -> List[ConceptScore]:
+        totals = self.weighted_totals().tolist()
+        return [ConceptScore(concept_title=t, by_criterion=items, total=total)
+                for (t, items), total in zip(self.to_store().items(), totals)]
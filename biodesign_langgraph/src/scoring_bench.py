@@ -0,0 +1,176 @@
+"""
+scoring.py 的微基準測試
+
+以合成的 revise-vote 投票（概念數 × 8 面向 × 角色數）量測 parse_revise_vote_json、
+aggregate_scores、weighted_total、find_disputed_criteria 的耗時與記憶體配置。
+每個實作登錄各函式在合成資料上的執行方式（可附不計時的前置準備，例如建好的
+ScoreMatrix，以及把輸出轉回 baseline 格式的轉換），在相同輸入上與 baseline 比較
+速度並檢查結果一致。目前登錄 baseline（逐筆 ScoreItem）與 vectorized（ScoreMatrix）。
+"""
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from .prompts import AGENT_ROLES
+from .types import CRITERIA_WEIGHTS
+from .scoring import (parse_revise_vote_json, aggregate_scores, weighted_total, find_disputed_criteria,
+                      ScoreMatrix)
+
+CRITERIA = list(CRITERIA_WEIGHTS)
+
+
+@dataclass
+class VoteDataset:
+    payloads: List[str]              # 每個角色一份 revise-vote JSON（含程式碼區塊雜訊）
+    votes: List[List[dict]]          # 解析後的投票，每個角色一份
+    items: List[dict]                # 所有角色的投票攤平
+    store: Dict[str, list]           # concept_title -> [ScoreItem...]
+    concepts: int
+    roles: int
+
+
+@dataclass
+class Implementation:
+    # 函式名稱 -> run(dataset, prepared)；缺少的函式在比較時略過
+    cases: Dict[str, Callable[[VoteDataset, Any], Any]]
+    # 不計時的前置準備（例如先建好 ScoreMatrix），結果以 prepared 傳給 run
+    prepare: Optional[Callable[[VoteDataset], Any]] = None
+    # 函式名稱 -> convert(output, prepared)，把輸出轉成 baseline 格式以檢查一致（不計時）
+    convert: Dict[str, Callable[[Any, Any], Any]] = field(default_factory=dict)
+
+
+IMPLEMENTATIONS: Dict[str, Implementation] = {}
+
+
+def register_implementation(name: str, implementation: Implementation):
+    IMPLEMENTATIONS[name] = implementation
+
+
+register_implementation("baseline", Implementation(cases={
+    "parse_revise_vote_json": lambda d, _: [parse_revise_vote_json(p) for p in d.payloads],
+    "aggregate_scores": lambda d, _: aggregate_scores(d.items),
+    "weighted_total": lambda d, _: {t: weighted_total(items) for t, items in d.store.items()},
+    "find_disputed_criteria": lambda d, _: find_disputed_criteria(d.store),
+}))
+
+register_implementation("vectorized", Implementation(
+    cases={
+        "aggregate_scores": lambda d, _: ScoreMatrix.from_votes(d.votes),
+        "weighted_total": lambda d, matrix: matrix.weighted_totals(),
+        "find_disputed_criteria": lambda d, matrix: matrix.disputed_criteria(),
+    },
+    prepare=lambda d: ScoreMatrix.from_votes(d.votes),
+    convert={
+        "aggregate_scores": lambda out, _: out.to_store(),
+        "weighted_total": lambda out, matrix: dict(zip(matrix.titles, out.tolist())),
+    },
+))
+
+
+def make_dataset(concepts: int = 2000, roles: int = len(AGENT_ROLES), seed: int = 0) -> VoteDataset:
+    """產生合成投票；每個概念有基準分，各角色加上雜訊，使部分面向出現分歧"""
+    rng = random.Random(seed)
+    titles = [f"概念 {i:05d}：{rng.choice(['床邊預警', '穿戴監測', '流程自動化', '遠距追蹤'])}" for i in range(concepts)]
+    base = {t: {c: rng.uniform(1, 4) for c in CRITERIA} for t in titles}
+    payloads = []
+    for r in range(roles):
+        spread = 0.3 if r % 2 == 0 else 1.5
+        votes = [{
+            "concept_title": t,
+            "revisions": [f"修訂建議 {k}" for k in range(rng.randint(1, 3))],
+            "scores": [{
+                "criterion": c,
+                "score": round(min(5.0, max(0.0, base[t][c] + rng.gauss(0, spread)))),
+                "rationale": f"理由 {rng.randint(0, 999)}",
+            } for c in CRITERIA],
+        } for t in titles]
+        payloads.append(f"```json\n{json.dumps(votes, ensure_ascii=False)}\n```")
+    votes = [parse_revise_vote_json(p) for p in payloads]
+    items = [v for vs in votes for v in vs]
+    return VoteDataset(payloads=payloads, votes=votes, items=items, store=aggregate_scores(items),
+                       concepts=concepts, roles=roles)
+
+
+def _score_tuples(store: Dict[str, list]) -> Dict[str, list]:
+    return {t: [(s.criterion, s.score, s.rationale) for s in items] for t, items in store.items()}
+
+
+# 函式名稱 -> 比較前的正規化（輸入為 baseline 格式）
+CASES = {
+    "parse_revise_vote_json": lambda out: out,
+    "aggregate_scores": _score_tuples,
+    "weighted_total": lambda out: {t: round(v, 4) for t, v in out.items()},
+    "find_disputed_criteria": sorted,
+}
+
+
+def time_case(run: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return {"min_ms": round(min(times) * 1000, 3), "median_ms": round(statistics.median(times) * 1000, 3)}
+
+
+def measure_allocations(run: Callable[[], Any]) -> Dict[str, float]:
+    """tracemalloc 量測單次執行的峰值配置與執行後仍保留的記憶體（結果本身也算在內）"""
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = run()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return {"peak_kb": round((peak - before) / 1024, 1), "retained_kb": round((current - before) / 1024, 1)}
+
+
+def run_benchmarks(dataset: VoteDataset, repeat: int = 5, implementations: Optional[List[str]] = None) -> Dict[str, Any]:
+    names = implementations or list(IMPLEMENTATIONS)
+    report: Dict[str, Any] = {
+        "concepts": dataset.concepts,
+        "roles": dataset.roles,
+        "criteria": len(CRITERIA),
+        "votes": len(dataset.items),
+        "payload_kb": round(sum(len(p.encode("utf-8")) for p in dataset.payloads) / 1024, 1),
+        "results": {},
+    }
+    prepared = {name: IMPLEMENTATIONS[name].prepare(dataset) if IMPLEMENTATIONS[name].prepare else None
+                for name in set(names) | {"baseline"}}
+    for case, normalize in CASES.items():
+        expected = normalize(IMPLEMENTATIONS["baseline"].cases[case](dataset, None))
+        rows = {}
+        for name in names:
+            impl = IMPLEMENTATIONS[name]
+            if case not in impl.cases:
+                continue
+            run = lambda: impl.cases[case](dataset, prepared[name])
+            row = {**time_case(run, repeat), **measure_allocations(run)}
+            output = run()
+            if case in impl.convert:
+                output = impl.convert[case](output, prepared[name])
+            row["matches_baseline"] = normalize(output) == expected
+            rows[name] = row
+        base_ms = rows["baseline"]["min_ms"] if "baseline" in rows else None
+        for row in rows.values():
+            row["speedup"] = round(base_ms / row["min_ms"], 2) if base_ms and row["min_ms"] else None
+        report["results"][case] = rows
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"概念 {report['concepts']} × 面向 {report['criteria']} × 角色 {report['roles']}"
+             f"（{report['votes']} 筆投票，payload {report['payload_kb']} KB）"]
+    header = f"{'函式':<24}{'實作':<14}{'min ms':>10}{'median ms':>12}{'peak KB':>12}{'保留 KB':>10}{'加速':>8}  一致"
+    lines.append(header)
+    for case, rows in report["results"].items():
+        for name, row in rows.items():
+            lines.append(f"{case:<24}{name:<14}{row['min_ms']:>10.2f}{row['median_ms']:>12.2f}"
+                         f"{row['peak_kb']:>12.1f}{row['retained_kb']:>10.1f}{str(row['speedup']):>8}  "
+                         f"{'✅' if row['matches_baseline'] else '❌'}")
+    return "\n".join(lines)
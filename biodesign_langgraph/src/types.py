@@ -1,4 +1,4 @@
-from typing import List, Dict, Literal, Optional, TypedDict
+from typing import Any, List, Dict, Literal, Optional, TypedDict
 from pydantic import BaseModel, Field
 
 # 你原本的 NeedItem 如果已有，可直接沿用
@@ -42,11 +42,29 @@ class ConceptScore(BaseModel):
     total: float
     notes: str = ""
 
+class VoteError(BaseModel):
+    role: str = ""                        # 投票的專家角色（Delphi 為 "delphi"）
+    index: int                            # 該角色輸出中第幾個投票物件（0 起算）
+    concept_title: str = ""
+    error: str
+    snippet: str = ""                     # 出錯片段（截斷）
+
+class DelphiRound(BaseModel):
+    round: int
+    queried: Dict[str, List[str]]         # 本輪重新詢問的 concept_title -> [criterion...]
+    still_disputed: int                   # 本輪後仍分歧的格數
+    tokens: int = 0
+    ranking_changed: bool = False
+
 class DebateOutput(BaseModel):
     proposed_concepts: List[Concept]
-    critiques: Dict[str, List[str]]       # concept_title -> list of critiques
+    critiques: Dict[str, List[str]]       # concept_title -> list of critiques（「（整體評論）」為未指明概念者）
     revised_concepts: List[Concept]
     scores: List[ConceptScore]
     ranking: List[str]                    # ordered concept_title
     sensitivity_note: str                 # 簡易敏感度說明
-    decision_summary: str                 # 決策與下一步 
\ No newline at end of file
+    decision_summary: str                 # 決策與下一步 
+    vote_errors: List[VoteError] = []     # 逐筆的投票解析/驗證錯誤（不影響其他投票計分）
+    delphi_rounds: List[DelphiRound] = []
+    delphi_stop_reason: str = ""          # converged / max_rounds / token_budget；未啟用時為空
+    usage: Dict[str, Any] = {}            # LLM token / 成本 / 延遲：totals 與 by_node、by_role、by_round 分項
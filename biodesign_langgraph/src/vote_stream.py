@@ -0,0 +1,184 @@
+"""
+revise-vote / Delphi 輸出的串流 JSON 解析
+
+模型輸出常夾雜程式碼區塊、說明文字，或在尾端被截斷；整段 json.loads 失敗時
+原本會丟棄整位專家的投票。VoteStreamParser 在 token 到達時逐字掃描，
+只追蹤頂層 {...} 物件的括號深度與字串狀態，每個物件一閉合就獨立解析與驗證：
+單一物件或單一評分格式錯誤只記錄該筆錯誤，其餘投票照常計分，
+且評分可在生成結束前開始。
+"""
+import json
+import re
+from typing import Callable, List, Optional, Tuple
+
+from .types import CRITERIA_WEIGHTS, VoteError
+
+# 字串內的跳脫序列整組略過；其餘只關心會改變括號深度或字串狀態的字元
+_TOKEN = re.compile(r'\\.|[{}"\\]', re.S)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_SNIPPET_CHARS = 120
+
+VoteCallback = Callable[[dict], None]
+
+
+def check_score(sc) -> Tuple[str, float, str]:
+    """驗證單一評分並回傳 (criterion, score, rationale)；規則與 ScoreItem 一致，不符時拋出 ValueError"""
+    if not isinstance(sc, dict):
+        raise ValueError("評分不是物件")
+    criterion = sc.get("criterion")
+    if criterion not in CRITERIA_WEIGHTS:
+        raise ValueError(f"未知面向 {criterion!r}")
+    try:
+        value = float(sc["score"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"{criterion} 分數不是數值：{sc.get('score')!r}")
+    if not (0 <= value <= 5):
+        raise ValueError(f"{criterion} 分數超出 0-5：{value}")
+    rationale = sc.get("rationale", "")
+    if not isinstance(rationale, str):
+        raise ValueError(f"{criterion} 理由不是字串")
+    return criterion, value, rationale
+
+
+class VoteStreamParser:
+    """
+    逐段 feed 模型輸出，回傳其中新閉合且通過驗證的投票物件。
+    votes 保存所有有效投票（評分已去除無效項），errors 保存逐筆的 VoteError；
+    有 on_vote 時每筆有效投票在閉合當下即回調（例如直接加入 ScoreMatrix）。
+    """
+
+    def __init__(self, role: str = "", on_vote: Optional[VoteCallback] = None):
+        self.role = role
+        self.on_vote = on_vote
+        self.votes: List[dict] = []
+        self.errors: List[VoteError] = []
+        self._parts: List[str] = []      # 尚未閉合的頂層物件內容
+        self._depth = 0
+        self._in_string = False
+        self._escape = False             # 上一段以單獨的反斜線結尾
+        self._objects = 0                # 已閉合的頂層物件數（作為錯誤的 index）
+
+    def feed(self, text: str) -> List[dict]:
+        new: List[dict] = []
+        pos = 0
+        if self._escape and text:
+            self._escape, pos = False, 1
+        start = 0 if self._depth else None
+        for m in _TOKEN.finditer(text, pos):
+            ch = m.group()
+            if not self._depth:
+                # 物件之外的程式碼區塊標記、說明文字、陣列括號與逗號一律略過
+                if ch == "{":
+                    self._depth, start = 1, m.start()
+                continue
+            if self._in_string:
+                if ch == '"':
+                    self._in_string = False
+                elif ch == "\\":
+                    self._escape = True
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if not self._depth:
+                    self._parts.append(text[start:m.end()])
+                    raw, self._parts = "".join(self._parts), []
+                    vote = self._emit(raw)
+                    if vote is not None:
+                        new.append(vote)
+        if self._depth:
+            self._parts.append(text[start:])
+        return new
+
+    def close(self) -> List[VoteError]:
+        """輸出結束；尚未閉合的物件記為截斷錯誤。回傳全部錯誤"""
+        if self._depth:
+            raw = "".join(self._parts)
+            self._error(self._objects, _title_hint(raw), "輸出在物件中途截斷", raw)
+            self._objects += 1
+            self._parts, self._depth, self._in_string, self._escape = [], 0, False, False
+        return self.errors
+
+    def add_object(self, obj) -> Optional[dict]:
+        """驗證一個已解析的頂層物件（整段可直接 json.loads 時的快速路徑）"""
+        index = self._objects
+        self._objects += 1
+        return self._accept(obj, index)
+
+    def _emit(self, raw: str) -> Optional[dict]:
+        index = self._objects
+        self._objects += 1
+        try:
+            obj = json.loads(raw)
+        except ValueError as exc:
+            # 常見的尾端逗號可修復；其他格式錯誤只影響這一筆
+            try:
+                obj = json.loads(_TRAILING_COMMA.sub(r"\1", raw))
+            except ValueError:
+                self._error(index, _title_hint(raw), f"JSON 格式錯誤：{exc}", raw)
+                return None
+        return self._accept(obj, index, raw)
+
+    def _accept(self, obj, index: int, raw: str = "") -> Optional[dict]:
+        if not isinstance(obj, dict):
+            self._error(index, "", "投票不是物件", raw)
+            return None
+        title = obj.get("concept_title")
+        if not isinstance(title, str) or not title.strip():
+            self._error(index, "", "缺少 concept_title", raw or json.dumps(obj, ensure_ascii=False))
+            return None
+        scores = obj.get("scores", [])
+        if not isinstance(scores, list):
+            self._error(index, title, "scores 不是陣列", raw)
+            scores = []
+        valid = []
+        for k, sc in enumerate(scores):
+            try:
+                check_score(sc)
+            except ValueError as exc:
+                self._error(index, title, f"第 {k + 1} 個評分無效：{exc}", json.dumps(sc, ensure_ascii=False))
+                continue
+            valid.append(sc)
+        # 全部有效時沿用原物件，否則複製一份只含有效評分
+        vote = obj if valid == obj.get("scores") else {**obj, "scores": valid}
+        self.votes.append(vote)
+        if self.on_vote is not None:
+            self.on_vote(vote)
+        return vote
+
+    def _error(self, index: int, title: str, error: str, snippet: str):
+        self.errors.append(VoteError(role=self.role, index=index, concept_title=title, error=error,
+                                     snippet=snippet[:_SNIPPET_CHARS]))
+
+
+_TITLE_HINT = re.compile(r'"concept_title"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def _title_hint(raw: str) -> str:
+    # 無法解析的物件仍盡量標出所屬概念，方便追查
+    m = _TITLE_HINT.search(raw)
+    return m.group(1) if m else ""
+
+
+def parse_votes(payload: str, role: str = "") -> VoteStreamParser:
+    """
+    解析完整的 revise-vote / Delphi 輸出，回傳含 votes 與 errors 的 parser。
+    方括號之間可直接 json.loads 時逐筆驗證（快速路徑）；否則交給串流掃描逐物件回收。
+    """
+    parser = VoteStreamParser(role)
+    start, end = payload.find("["), payload.rfind("]")
+    if 0 <= start < end:
+        try:
+            items = json.loads(payload[start:end + 1])
+        except ValueError:
+            items = None
+        if isinstance(items, list):
+            for obj in items:
+                parser.add_object(obj)
+            return parser
+    parser.feed(payload)
+    parser.close()
+    return parser
@@ -79,6 +79,208 @@ def test_scoring():
         print(f"❌ 評分邏輯測試失敗: {e}")
         return False
 
+def test_score_matrix():
+    """測試向量化評分矩陣與逐筆實作結果一致"""
+    try:
+        from src.scoring import ScoreMatrix, aggregate_scores, weighted_total, find_disputed_criteria
+        
+        votes = [
+            [{"concept_title": "A", "scores": [{"criterion": "UX", "score": 1, "rationale": "r"},
+                                               {"criterion": "UX", "score": 5, "rationale": "重複"},
+                                               {"criterion": "BAD", "score": 3, "rationale": "未知面向"},
+                                               {"criterion": "MARKET", "score": 9, "rationale": "超出範圍"}]}],
+            [{"concept_title": "A", "scores": [{"criterion": "UX", "score": 2, "rationale": "r"}]},
+             {"concept_title": "B", "scores": []}],
+            [{"concept_title": "C", "scores": [{"criterion": "TECH_FEAS", "score": 4, "rationale": "Delphi 新增"}]}],
+        ]
+        store = aggregate_scores([v for vs in votes for v in vs])
+        matrix = ScoreMatrix.from_votes(votes)
+        
+        assert matrix.titles == list(store)
+        assert matrix.totals() == {t: weighted_total(items) for t, items in store.items()}
+        assert matrix.disputed_criteria() == find_disputed_criteria(store) == ["UX"]
+        assert [len(s.by_criterion) for s in matrix.to_concept_scores()] == [3, 0, 1]
+        assert matrix.ranking()[0] == "C"
+        
+        print("✅ 向量化評分矩陣測試通過")
+        return True
+    except Exception as e:
+        print(f"❌ 向量化評分矩陣測試失敗: {e}")
+        return False
+
+def test_vote_stream():
+    """測試串流投票解析：分段輸入、程式碼區塊、單筆錯誤不影響其他投票、截斷"""
+    try:
+        import json
+        from src.vote_stream import VoteStreamParser, parse_votes
+        from src.scoring import ScoreMatrix, parse_revise_vote_json
+        
+        good = {"concept_title": "A {穿戴}", "revisions": ["加入\"警示\""],
+                "scores": [{"criterion": "UX", "score": 4, "rationale": "r"},
+                           {"criterion": "MARKET", "score": 7, "rationale": "超出範圍"}]}
+        payload = ("說明文字 {不是 JSON}\n```json\n[" + json.dumps(good, ensure_ascii=False)
+                   + ', {"concept_title": "B", "scores": [{"criterion": "UX" "score": 1}]}'
+                   + ', {"concept_title": "C", "scores": [{"criterion": "TECH_FEAS", "score": 3, "rationale": "r"},],}'
+                   + ', {"concept_title": "D", "scores": [{"criterion": "UX", "sc')
+        
+        matrix = ScoreMatrix(titles=["A {穿戴}", "B", "C", "D"], voters=1)
+        parser = VoteStreamParser("clinical", on_vote=lambda v: matrix.add_votes([v], voter=0))
+        arrived = []
+        for i in range(0, len(payload), 3):
+            arrived.append(len(parser.feed(payload[i:i + 3])))
+        errors = parser.close()
+        
+        assert [v["concept_title"] for v in parser.votes] == ["A {穿戴}", "C"]
+        assert parser.votes[0]["scores"] == good["scores"][:1]
+        assert arrived.index(1) < len(arrived) - 1          # 第一筆在輸出結束前即可計分
+        # 說明文字中的大括號也會被當成物件，記錄錯誤後略過
+        assert [(e.index, e.concept_title) for e in errors] == [(0, ""), (1, "A {穿戴}"), (2, "B"), (4, "D")]
+        assert all(e.role == "clinical" for e in errors) and "截斷" in errors[-1].error
+        matrix.drop_unvoted()
+        assert matrix.titles == ["A {穿戴}", "C"]
+        
+        # 完整輸出的快速路徑與串流結果一致；整段無法解析時不再全部丟棄
+        fenced = "```json\n" + json.dumps([good], ensure_ascii=False) + "\n```"
+        assert parse_votes(fenced).votes == VoteStreamParser().feed(fenced)
+        assert [v["concept_title"] for v in parse_revise_vote_json(payload)] == ["A {穿戴}", "C"]
+        
+        print("✅ 串流投票解析測試通過")
+        return True
+    except Exception as e:
+        print(f"❌ 串流投票解析測試失敗: {e}")
+        return False
+
+def test_delphi_cells():
+    """測試逐格分歧、Delphi 就地重評與增量重算"""
+    try:
+        from src.scoring import ScoreMatrix
+        
+        def vote(title, **scores):
+            return {"concept_title": title, "scores": [{"criterion": c, "score": v, "rationale": "r"} for c, v in scores.items()]}
+        
+        matrix = ScoreMatrix(titles=["A", "B"], voters=3)
+        for layer, (ux, market) in enumerate([(1, 3), (5, 3), (3, 4)]):
+            matrix.add_votes([vote("A", UX=ux, MARKET=market), vote("B", UX=3)], voter=layer)
+        
+        cells = matrix.disputed_cells()
+        assert cells == {"A": ["UX"]}
+        assert matrix.cell_summary("A", "UX") == (3.0, 2.0, 4.0)
+        
+        # 重評只接受被詢問的格，且取代原分數而非新增 voter 層
+        assert matrix.replace_votes([vote("A", UX=3, MARKET=0), vote("B", UX=0)], voter=0, cells=cells) == 1
+        assert matrix.voters == 3 and matrix.score_of("A", "UX", 0) == 3.0 and matrix.score_of("A", "MARKET", 0) == 3.0
+        matrix.replace_votes([vote("A", UX=4)], voter=1, cells=cells)
+        assert matrix.disputed_cells(cells=cells) == {}
+        assert [s.score for s in matrix.to_store()["A"] if s.criterion == "UX"] == [3.0, 4.0, 3.0]
+        
+        print("✅ Delphi 逐格收斂測試通過")
+        return True
+    except Exception as e:
+        print(f"❌ Delphi 逐格收斂測試失敗: {e}")
+        return False
+
+def test_delphi_overflow_votes():
+    """測試同一角色對同一格多次評分（overflow 層）時，Delphi 重評取代所有舊分"""
+    try:
+        import numpy as np
+        from src.scoring import ScoreMatrix
+        
+        def vote(title, **scores):
+            return {"concept_title": title, "scores": [{"criterion": c, "score": v, "rationale": "r"} for c, v in scores.items()]}
+        
+        matrix = ScoreMatrix(titles=["A", "B"], voters=3)
+        # 角色 0 對 A 重複評分，第二筆放到其 overflow 層
+        matrix.add_votes([vote("A", UX=1), vote("A", UX=1), vote("B", UX=3)], voter=0)
+        matrix.add_votes([vote("A", UX=5), vote("B", UX=3)], voter=1)
+        matrix.add_votes([vote("A", UX=5), vote("B", UX=3)], voter=2)
+        assert matrix.voters == 4 and matrix.counts()[0].max() == 4
+        
+        cells = matrix.disputed_cells()
+        assert cells == {"A": ["UX"]}
+        assert matrix.replace_votes([vote("A", UX=5)], voter=0, cells=cells) == 1
+        # 主層與 overflow 層都更新，票數不變；總分與排名不再混入重評前的分數
+        a_scores = matrix.scores[0]
+        assert matrix.counts()[0].max() == 4 and a_scores[~np.isnan(a_scores)].tolist() == [5.0] * 4
+        assert matrix.disputed_cells(cells=cells) == {}
+        assert [s.score for s in matrix.to_store()["A"] if s.criterion == "UX"] == [5.0, 5.0, 5.0, 5.0]
+        assert matrix.ranking() == ["A", "B"]
+        
+        print("✅ Delphi overflow 層重評測試通過")
+        return True
+    except Exception as e:
+        print(f"❌ Delphi overflow 層重評測試失敗: {e}")
+        return False
+
+def test_critique_store():
+    """測試批評依標題指派、去重與整體評論"""
+    try:
+        from src.critiques import CritiqueStore, GENERAL_CRITIQUES
+        
+        store = CritiqueStore(["A：床邊預警", "B 穿戴監測"])
+        store.add_text("整體而言證據不足\n- **A：床邊預警**\n  - 警報疲勞\n  - 需臨床驗證\n2. B 穿戴監測：電池續航不足")
+        store.add_text("整體而言證據不足\n- A：床邊預警\n  - 警報疲勞")
+        
+        critiques = store.to_dict()
+        assert critiques["A：床邊預警"] == ["警報疲勞", "需臨床驗證"]
+        assert critiques["B 穿戴監測"] == ["電池續航不足"]
+        assert critiques[GENERAL_CRITIQUES] == ["整體而言證據不足"]
+        assert len(store) == 4
+        assert store.summary_lines("B 穿戴監測") == ["電池續航不足", "整體而言證據不足"]
+        
+        print("✅ 批評索引測試通過")
+        return True
+    except Exception as e:
+        print(f"❌ 批評索引測試失敗: {e}")
+        return False
+
+def test_scoring_bench():
+    """測試評分微基準（小型合成資料）"""
+    try:
+        from src.scoring_bench import make_dataset, run_benchmarks
+        
+        dataset = make_dataset(concepts=20, roles=7, seed=1)
+        assert len(dataset.items) == 140
+        report = run_benchmarks(dataset, repeat=1)
+        assert set(report["results"]) == {"parse_revise_vote_json", "aggregate_scores", "weighted_total", "find_disputed_criteria"}
+        assert all(row["matches_baseline"] for rows in report["results"].values() for row in rows.values())
+        
+        print("✅ 評分微基準測試通過")
+        return True
+    except Exception as e:
+        print(f"❌ 評分微基準測試失敗: {e}")
+        return False
+
+def test_usage_labels():
+    """測試各角色並行呼叫的用量歸屬標籤"""
+    try:
+        import asyncio
+        from llm_runtime.usage import current_labels
+        from src.agents import usage_labels
+        from src.graph import BiodesignDebate
+        from src.prompts import AGENT_ROLES
+        
+        debate = BiodesignDebate.__new__(BiodesignDebate)
+        debate.max_concurrency = 3
+        
+        async def call(role):
+            await asyncio.sleep(0)
+            return current_labels()
+        
+        async def scenario():
+            with usage_labels(session="debate-1"):
+                node = BiodesignDebate._labelled("critique", lambda state: debate._fan_out(call))
+                return await node({})
+        
+        labels = asyncio.run(scenario())
+        assert [l["role"] for l in labels] == [role for role, _ in AGENT_ROLES]
+        assert all(l["node"] == "critique" and l["session"] == "debate-1" for l in labels)
+        
+        print("✅ 用量歸屬標籤測試通過")
+        return True
+    except Exception as e:
+        print(f"❌ 用量歸屬標籤測試失敗: {e}")
+        return False
+
 def test_prompts():
     """測試提示詞模板"""
     try:
@@ -110,6 +312,13 @@ def main():
         test_imports,
         test_types,
         test_scoring,
+        test_score_matrix,
+        test_vote_stream,
+        test_delphi_cells,
+        test_delphi_overflow_votes,
+        test_critique_store,
+        test_scoring_bench,
+        test_usage_labels,
         test_prompts
     ]
     
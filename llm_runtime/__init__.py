@@ -0,0 +1,68 @@
+"""
+src/agents 與 biodesign_langgraph 共用的 LLM 執行期基礎設施
+"""
+
+from llm_runtime.cache import (
+    LLMResponseCache,
+    SQLiteResponseStore,
+    alookup_message,
+    aupdate_message,
+    bypass_cache,
+    cache_bypassed,
+    get_response_cache,
+)
+from llm_runtime.factory import available_backends, chat_model_kwargs, create_chat_model, register_backend
+from llm_runtime.fake import FakeChatModel
+from llm_runtime.streaming import DeltaCallback, DeltaCoalescer, astream_message
+from llm_runtime.ratelimit import (
+    PRIORITIES,
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    ProviderRateLimiter,
+    RateLimitedAsyncTransport,
+    RateLimitedTransport,
+    get_rate_limiter,
+    llm_priority,
+    rate_limited_client_kwargs,
+)
+from llm_runtime.usage import (
+    UsageCallbackHandler,
+    UsageTracker,
+    get_usage_handler,
+    get_usage_tracker,
+    record_cached_message,
+    usage_labels,
+)
+
+__all__ = [
+    "PRIORITIES",
+    "PRIORITY_BATCH",
+    "PRIORITY_INTERACTIVE",
+    "DeltaCallback",
+    "DeltaCoalescer",
+    "FakeChatModel",
+    "LLMResponseCache",
+    "ProviderRateLimiter",
+    "RateLimitedAsyncTransport",
+    "RateLimitedTransport",
+    "SQLiteResponseStore",
+    "UsageCallbackHandler",
+    "UsageTracker",
+    "alookup_message",
+    "astream_message",
+    "available_backends",
+    "aupdate_message",
+    "bypass_cache",
+    "cache_bypassed",
+    "chat_model_kwargs",
+    "create_chat_model",
+    "get_rate_limiter",
+    "get_response_cache",
+    "get_usage_handler",
+    "get_usage_tracker",
+    "llm_priority",
+    "rate_limited_client_kwargs",
+    "record_cached_message",
+    "register_backend",
+    "usage_labels",
+]
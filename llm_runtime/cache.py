@@ -0,0 +1,323 @@
+"""
+內容定址的 LLM 回應快取
+
+相同的 prompt 會被反覆送出（同一需求的 call_position、重複的需求清單評估、
+重新送出的查詢）。此快取實作 LangChain 的 BaseCache 介面，透過模型的
+``cache=`` 參數掛上即可生效：
+
+- 快取鍵為 sha256(llm_string + 渲染後訊息)。llm_string 含模型名稱、temperature
+  等呼叫參數；parser 的 format instructions 已渲染在訊息中，因此同樣納入鍵值。
+- 兩層儲存：記憶體 LRU（依筆數與位元組上限淘汰）與 SQLite（依位元組上限，
+  淘汰最久未存取者）。記憶體未命中時會從 SQLite 載回並提升至記憶體層。
+  非同步介面只在事件迴圈上查記憶體層，SQLite 的讀寫（含命中時更新存取時間的
+  commit）以 ``asyncio.to_thread`` 執行。
+- ``bypass_cache()`` 以 contextvar 在單一請求範圍內略過快取（不讀也不寫），
+  供刻意需要非確定性輸出的執行使用。
+
+LangChain 的 astream 不經過模型快取，串流路徑請使用 ``alookup_message`` /
+``aupdate_message`` 自行查詢與回寫。
+"""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os import getenv
+from typing import Any, Dict, Iterator, Optional, Sequence
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.messages import BaseMessage, message_chunk_to_message
+from langchain_core.outputs import ChatGeneration
+from langchain_core._api import LangChainBetaWarning
+
+
+_bypass: ContextVar[bool] = ContextVar("llm_cache_bypass", default=False)
+
+
+@contextmanager
+def bypass_cache(enabled: bool = True) -> Iterator[None]:
+    """在此區塊（含其中建立的 asyncio task）內略過 LLM 快取"""
+    token = _bypass.set(enabled)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def cache_bypassed() -> bool:
+    return _bypass.get()
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+class SQLiteResponseStore:
+    """磁碟層：依位元組上限淘汰最久未存取的項目；自帶鎖，可在 worker thread 上存取"""
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache(accessed_at)")
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, value: str) -> int:
+        """寫入一筆並回傳因超出上限而淘汰的筆數"""
+        with self._lock:
+            return self._put(key, value)
+
+    def _put(self, key: str, value: str) -> int:
+        size = len(value.encode("utf-8"))
+        row = self._conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, value, size, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, value, size, time.time()),
+        )
+        self.total_bytes += size - (row[0] if row else 0)
+
+        evicted = 0
+        while self.total_bytes > self.max_bytes:
+            oldest = self._conn.execute(
+                "SELECT key, size FROM llm_cache WHERE key != ? ORDER BY accessed_at LIMIT 1", (key,)
+            ).fetchone()
+            if oldest is None:
+                break
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (oldest[0],))
+            self.total_bytes -= oldest[1]
+            evicted += 1
+        self._conn.commit()
+        return evicted
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self.total_bytes = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+class LLMResponseCache(BaseCache):
+    """記憶體 LRU + SQLite 兩層的 LLM 回應快取"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024,
+                 disk: Optional[SQLiteResponseStore] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            "memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0,
+            "writes": 0, "memory_evictions": 0, "disk_evictions": 0,
+        }
+
+    # ---- BaseCache 介面 ----
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if self._bypassed():
+            return None
+        key = cache_key(prompt, llm_string)
+        value = self._memory_get(key)
+        if value is None:
+            value = self._disk_get(key)
+        return None if value is None else _decode(value)
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if cache_bypassed():
+            return
+        key = cache_key(prompt, llm_string)
+        value = dumps(list(return_val))
+        self._memory_put(key, value)
+        self._disk_put(key, value)
+
+    # 記憶體層直接在事件迴圈上處理，省去 executor 切換；只有 SQLite 層的讀寫改到 thread
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if self._bypassed():
+            return None
+        key = cache_key(prompt, llm_string)
+        value = self._memory_get(key)
+        if value is None:
+            value = self._disk_get(key) if self.disk is None else await asyncio.to_thread(self._disk_get, key)
+        return None if value is None else _decode(value)
+
+    async def aupdate(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if cache_bypassed():
+            return
+        key = cache_key(prompt, llm_string)
+        value = dumps(list(return_val))
+        self._memory_put(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self._disk_put, key, value)
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self.disk is not None:
+            self.disk.clear()
+
+    # ---- 兩層存取 ----
+    def _bypassed(self) -> bool:
+        if not cache_bypassed():
+            return False
+        with self._lock:
+            self._counters["bypassed"] += 1
+        return True
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+            return value
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        """記憶體未命中後查 SQLite，命中則提升至記憶體層；磁碟 I/O 不持有記憶體層的鎖"""
+        value = self.disk.get(key) if self.disk is not None else None
+        with self._lock:
+            if value is None:
+                self._counters["misses"] += 1
+            else:
+                self._counters["disk_hits"] += 1
+                self._remember(key, value)
+        return value
+
+    def _memory_put(self, key: str, value: str):
+        with self._lock:
+            self._counters["writes"] += 1
+            self._remember(key, value)
+
+    def _disk_put(self, key: str, value: str):
+        if self.disk is None:
+            return
+        evicted = self.disk.put(key, value)
+        with self._lock:
+            self._counters["disk_evictions"] += evicted
+
+    # ---- 記憶體 LRU ----
+    def _remember(self, key: str, value: str):
+        size = len(value)
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = value
+        self._memory_bytes += size
+        while len(self._memory) > 1 and (
+            len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes
+        ):
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._counters["memory_evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+            if self.disk is not None:
+                stats["disk_entries"] = len(self.disk)
+                stats["disk_bytes"] = self.disk.total_bytes
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_ratio"] = hits / lookups if lookups else 0.0
+        return stats
+
+
+def _decode(value: str) -> RETURN_VAL_TYPE:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", LangChainBetaWarning)
+        return loads(value, allowed_objects="core")
+
+
+# ---- 串流路徑 ----
+def _model_cache(llm) -> Optional[BaseCache]:
+    cache = getattr(llm, "cache", None)
+    return cache if isinstance(cache, BaseCache) else None
+
+
+def _prompt_string(messages: Sequence[BaseMessage]) -> str:
+    # 與 LangChain 的 _agenerate_with_cache 相同：去除訊息 id 後序列化
+    return dumps([
+        message.model_copy(update={"id": None}) if getattr(message, "id", None) is not None else message
+        for message in messages
+    ])
+
+
+async def alookup_message(llm, messages: Sequence[BaseMessage], **kwargs: Any) -> Optional[BaseMessage]:
+    """以與 ainvoke 相同的快取鍵查詢；kwargs 為 bind() 綁定的呼叫參數。命中時回傳快取的訊息"""
+    cache = _model_cache(llm)
+    if cache is None:
+        return None
+    generations = await cache.alookup(_prompt_string(messages), llm._get_llm_string(**kwargs))
+    if not generations:
+        return None
+    generation = generations[0]
+    return generation.message if isinstance(generation, ChatGeneration) else None
+
+
+async def aupdate_message(llm, messages: Sequence[BaseMessage], message: BaseMessage, **kwargs: Any) -> None:
+    """將串流組合出的完整訊息寫回快取，之後的 ainvoke 亦可命中"""
+    cache = _model_cache(llm)
+    if cache is None:
+        return
+    generation = ChatGeneration(message=message_chunk_to_message(message))
+    await cache.aupdate(_prompt_string(messages), llm._get_llm_string(**kwargs), [generation])
+
+
+_shared_cache: Optional[LLMResponseCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[LLMResponseCache]:
+    """
+    取得全程式共用的快取；LLM_CACHE=0 時回傳 None（模型不使用快取）
+
+    環境變數：
+        LLM_CACHE: 1 | 0（預設 1）
+        LLM_CACHE_MEMORY_ENTRIES: 記憶體層筆數上限（預設 1024）
+        LLM_CACHE_MEMORY_MB: 記憶體層容量上限（預設 64）
+        LLM_CACHE_DB_PATH: SQLite 路徑，設為空字串則只用記憶體層（預設 data/llm_cache.db）
+        LLM_CACHE_DB_MB: SQLite 層容量上限（預設 512）
+    """
+    global _shared_cache
+    if getenv("LLM_CACHE", "1") == "0":
+        return None
+    with _shared_lock:
+        if _shared_cache is None:
+            db_path = getenv("LLM_CACHE_DB_PATH", "data/llm_cache.db")
+            _shared_cache = LLMResponseCache(
+                max_entries=int(getenv("LLM_CACHE_MEMORY_ENTRIES", "1024")),
+                max_bytes=int(getenv("LLM_CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+                disk=SQLiteResponseStore(
+                    db_path, max_bytes=int(getenv("LLM_CACHE_DB_MB", "512")) * 1024 * 1024
+                ) if db_path else None,
+            )
+        return _shared_cache
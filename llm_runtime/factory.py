@@ -0,0 +1,63 @@
+"""
+聊天模型的建立與後端登錄
+
+各 agent 模組以 ``create_chat_model()`` 取得模型，實際後端由 LLM_BACKEND 決定：
+
+- ``openai``（預設）：ChatOpenAI，帶入 ``chat_model_kwargs()`` 共用回應快取、限流 transport
+  與用量統計 callback。
+- ``fake``：離線、確定性的 ``FakeChatModel``（見 llm_runtime.fake），供壓力測試使用，
+  不需 API 金鑰也不連網；同樣掛上回應快取與用量統計。
+
+其他後端可透過 ``register_backend(name, factory)`` 加入。
+"""
+
+from os import getenv
+from typing import Any, Callable, Dict, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_openai import ChatOpenAI
+
+from llm_runtime.cache import get_response_cache
+from llm_runtime.fake import FakeChatModel
+from llm_runtime.ratelimit import rate_limited_client_kwargs
+from llm_runtime.usage import get_usage_handler
+
+# factory(model=..., temperature=..., **kwargs) -> BaseChatModel
+BackendFactory = Callable[..., BaseChatModel]
+
+_backends: Dict[str, BackendFactory] = {}
+
+
+def chat_model_kwargs() -> Dict[str, Any]:
+    """回應快取 + 共用限流器（各自可由環境變數關閉）+ 用量統計 callback"""
+    return {"cache": get_response_cache(), "callbacks": [get_usage_handler()], **rate_limited_client_kwargs()}
+
+
+def register_backend(name: str, factory: BackendFactory) -> None:
+    _backends[name] = factory
+
+
+def available_backends() -> List[str]:
+    return sorted(_backends)
+
+
+def create_chat_model(model: str = "gpt-4.1-mini", temperature: float = 0.7, backend: str = None,
+                      **kwargs: Any) -> BaseChatModel:
+    """依 backend（未指定時讀取環境變數 LLM_BACKEND，預設 openai）建立聊天模型"""
+    name = backend or getenv("LLM_BACKEND", "openai")
+    if name not in _backends:
+        raise ValueError(f"未知的 LLM 後端: {name}（可用：{', '.join(available_backends())}）")
+    return _backends[name](model=model, temperature=temperature, **kwargs)
+
+
+def _openai_backend(model: str, temperature: float, **kwargs: Any) -> BaseChatModel:
+    return ChatOpenAI(model=model, temperature=temperature, stream_usage=True, **{**chat_model_kwargs(), **kwargs})
+
+
+def _fake_backend(model: str, temperature: float, **kwargs: Any) -> BaseChatModel:
+    return FakeChatModel.from_env(model_name=model, temperature=temperature,
+                                  **{"cache": get_response_cache(), "callbacks": [get_usage_handler()], **kwargs})
+
+
+register_backend("openai", _openai_backend)
+register_backend("fake", _fake_backend)
@@ -0,0 +1,347 @@
+"""
+離線、可重現的假 LLM（供壓力測試與無網路環境使用）
+
+``FakeChatModel`` 實作 BaseChatModel，依 prompt 內容套用腳本產生回應：
+
+- 輸出與延遲皆由 sha256(seed + 模型參數 + prompt) 種子的亂數決定，同一 prompt 必得同一結果。
+- 延遲分佈以字串描述：``fixed:0.2``、``uniform:0.1,0.5``、``lognormal:0.8,0.5``
+  （中位數秒數, sigma）、``exponential:0.5``（平均秒數）。延遲為首 token 前的等待，
+  之後依 ``tokens_per_second`` 逐 token 輸出（0 表示不限速）。
+- 內建腳本產生符合 ``NeedsOutput``、``NeedEvaluation``/``NeedsEvaluationOutput``、
+  revise-vote / Delphi JSON 陣列（多輪 Delphi 的分數向群體中位數靠攏）、依概念分段的批評，以及路由判斷（medical | engineering）的輸出；
+  其餘 prompt 回傳條列文字。可用 FAKE_LLM_SCRIPTS 指向 JSON 檔加入自訂回應。
+- 回應帶 usage_metadata，token 數以簡易切分估算。
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from os import getenv
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field
+
+# (名稱, 比對函式(prompt, 呼叫參數), 產生函式(prompt, 亂數)) ；依序比對，第一個符合者生效
+Matcher = Callable[[str, Dict[str, Any]], bool]
+Responder = Callable[[str, random.Random], str]
+FakeScript = Tuple[str, Matcher, Responder]
+
+CRITERIA = ["CLINICAL_VALUE", "TECH_FEAS", "UX", "REG_PATH", "MARKET", "FINANCE", "IP_FTO", "PAYER"]
+
+NEED_TOPICS = [
+    "術後傷口遠距監測", "高齡用藥提醒與依從性追蹤", "急診檢傷分級輔助", "居家復健動作回饋",
+    "住院跌倒風險預警", "慢性腎病飲食管理", "門診病歷摘要自動化", "加護病房警報疲勞改善",
+]
+
+PROSE_LINES = [
+    "臨床流程：需確認介入點與現行照護路徑的銜接，並定義可量測的成效指標",
+    "病患觀點：操作步驟應精簡，降低學習成本與使用錯誤",
+    "技術架構：以模組化設計分離感測、資料傳輸與分析，兼顧資安與隱私",
+    "驗證策略：先以台架測試與模擬情境驗證，再進入小規模觀察性研究",
+    "法規考量：初步判定醫療器材分類並規劃對應的臨床證據需求",
+    "商業可行性：釐清付費者與採購流程，評估導入成本與效益",
+    "資料治理：建立資料標註與品質監控流程，確保模型可追溯",
+    "風險：感測訊號受環境干擾，需設計異常偵測與人工覆核機制",
+]
+
+
+# ---- 延遲分佈 ----
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """將延遲描述字串轉為取樣函式（回傳秒數）"""
+    kind, _, args = spec.partition(":")
+    params = [float(value) for value in args.split(",") if value.strip()]
+    if kind == "fixed":
+        return lambda rng: params[0] if params else 0.0
+    if kind == "uniform":
+        low, high = params
+        return lambda rng: rng.uniform(low, high)
+    if kind == "lognormal":
+        median, sigma = params
+        return lambda rng: median * math.exp(rng.gauss(0.0, sigma)) if median > 0 else 0.0
+    if kind == "exponential":
+        mean = params[0]
+        return lambda rng: rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+    raise ValueError(f"未知的延遲分佈: {spec}")
+
+
+_TOKEN = re.compile(r"[㐀-鿿＀-￯　-〿]|[A-Za-z0-9_]{1,4}|\s+|.", re.S)
+
+
+def split_tokens(text: str) -> List[str]:
+    """粗略切分 token：中日文字與全形標點各一個，英數每 4 字元一個"""
+    return _TOKEN.findall(text)
+
+
+# ---- 內建腳本 ----
+def _need_titles(prompt: str) -> List[str]:
+    return [title.strip() for title in re.findall(r"需求 \d+: (.+)", prompt)]
+
+
+def _concept_titles(prompt: str) -> List[str]:
+    return [title.strip() for title in re.findall(r"^- (.+?): 批評重點=", prompt, re.M)]
+
+
+def _need_evaluation(title: str, rng: random.Random) -> Dict[str, Any]:
+    scores = {name: round(rng.uniform(4, 9.5), 1) for name in
+              ("feasibility_score", "impact_score", "innovation_score", "resource_score")}
+    return {
+        "need_title": title,
+        **scores,
+        "overall_score": round(sum(scores.values()) / len(scores), 1),
+        "strengths": rng.sample(PROSE_LINES, 2),
+        "weaknesses": rng.sample(PROSE_LINES, 2),
+        "recommendations": rng.sample(PROSE_LINES, 2),
+    }
+
+
+def needs_output(prompt: str, rng: random.Random) -> str:
+    needs = [{
+        "need": topic,
+        "summary": f"針對{topic}的臨床痛點，建立可量測成效的解決方案",
+        "medical_insights": rng.choice(PROSE_LINES),
+        "tech_insights": rng.choice(PROSE_LINES),
+        "strategy": rng.choice(PROSE_LINES),
+    } for topic in rng.sample(NEED_TOPICS, 3)]
+    return json.dumps({"needs": needs}, ensure_ascii=False)
+
+
+def need_evaluation(prompt: str, rng: random.Random) -> str:
+    titles = _need_titles(prompt) or [rng.choice(NEED_TOPICS)]
+    return json.dumps(_need_evaluation(titles[0], rng), ensure_ascii=False)
+
+
+def needs_evaluation_output(prompt: str, rng: random.Random) -> str:
+    evaluations = [_need_evaluation(title, rng) for title in _need_titles(prompt) or [rng.choice(NEED_TOPICS)]]
+    ranked = sorted(evaluations, key=lambda item: item["overall_score"], reverse=True)
+    return json.dumps({
+        "evaluations": evaluations,
+        "summary": "整體而言各需求皆具臨床價值，建議優先投入可行性與影響力兼具者",
+        "top_priority_needs": [item["need_title"] for item in ranked[:3]],
+    }, ensure_ascii=False)
+
+
+def revise_vote(prompt: str, rng: random.Random) -> str:
+    # revise-vote 與 Delphi 共用格式；Delphi 只重評 prompt 中列出的分歧面向
+    disputed = [c for c in CRITERIA if re.search(rf"分歧.*{c}", prompt)]
+    with_revisions = '"revisions"' in prompt
+    items = []
+    for title in _concept_titles(prompt):
+        item: Dict[str, Any] = {"concept_title": title}
+        if with_revisions:
+            item["revisions"] = rng.sample(PROSE_LINES, 2)
+        item["scores"] = [
+            {"criterion": criterion, "score": rng.randint(1, 5), "rationale": rng.choice(PROSE_LINES)}
+            for criterion in (disputed or CRITERIA)
+        ]
+        items.append(item)
+    return json.dumps(items, ensure_ascii=False)
+
+
+_DELPHI_ITEM = re.compile(r"^- (.+) \| ([A-Z_]+)：群體中位數 ([\d.]+)", re.M)
+
+
+def delphi_round(prompt: str, rng: random.Random) -> str:
+    # 多輪 Delphi：只重評列出的 (概念, 面向)，分數向群體中位數靠攏
+    items: Dict[str, List[Dict[str, Any]]] = {}
+    for title, criterion, median in _DELPHI_ITEM.findall(prompt):
+        score = min(5, max(0, round(float(median)) + rng.choice([-1, 0, 0, 0, 1])))
+        items.setdefault(title, []).append(
+            {"criterion": criterion, "score": score, "rationale": rng.choice(PROSE_LINES)})
+    return json.dumps([{"concept_title": t, "scores": scores} for t, scores in items.items()], ensure_ascii=False)
+
+
+def route_topic(prompt: str, rng: random.Random) -> str:
+    return rng.choice(["medical", "engineering"])
+
+
+def position_concepts(prompt: str, rng: random.Random) -> str:
+    role = (re.findall(r"角色：(\w+)", prompt) or ["expert"])[-1]
+    blocks = []
+    for index, topic in enumerate(rng.sample(NEED_TOPICS, 2), 1):
+        lines = rng.sample(PROSE_LINES, 3)
+        blocks.append(f"- {role} 概念 {index}：{topic}\n  " + "\n  ".join(lines))
+    return "\n".join(blocks)
+
+
+def critique_by_concept(prompt: str, rng: random.Random) -> str:
+    # 依摘要中的概念標題分段，每個概念 2 點批評
+    titles = re.findall(r"^- (.+?): ", prompt, re.M)
+    return "\n".join(f"- {title}\n" + "\n".join(f"  - {line}" for line in rng.sample(PROSE_LINES, 2))
+                     for title in titles) or prose(prompt, rng)
+
+
+def prose(prompt: str, rng: random.Random) -> str:
+    return "\n".join(f"- {line}" for line in rng.sample(PROSE_LINES, rng.randint(3, 5)))
+
+
+def _response_format_name(kwargs: Dict[str, Any]) -> str:
+    response_format = kwargs.get("response_format")
+    if isinstance(response_format, dict):
+        return response_format.get("json_schema", {}).get("name", "")
+    return getattr(response_format, "__name__", "")
+
+
+DEFAULT_SCRIPTS: List[FakeScript] = [
+    ("needs_output", lambda p, kw: _response_format_name(kw) == "NeedsOutput", needs_output),
+    ("needs_evaluation_output", lambda p, kw: "top_priority_needs" in p, needs_evaluation_output),
+    ("need_evaluation", lambda p, kw: "need_title" in p, need_evaluation),
+    ("delphi_round", lambda p, kw: "群體中位數" in p, delphi_round),
+    ("revise_vote", lambda p, kw: '"concept_title"' in p, revise_vote),
+    ("route", lambda p, kw: '"medical" 或 "engineering"' in p, route_topic),
+    ("position", lambda p, kw: "個概念，每個概念需含" in p, position_concepts),
+    ("critique", lambda p, kw: "就每一概念提出" in p, critique_by_concept),
+    ("prose", lambda p, kw: True, prose),
+]
+
+
+def load_scripts(path: str) -> List[FakeScript]:
+    """
+    從 JSON 檔載入自訂腳本：[{"contains": "...", "response": "..." | {...}}, ...]
+    prompt 含 contains 子字串時回傳 response（非字串者序列化為 JSON）
+    """
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    scripts: List[FakeScript] = []
+    for entry in entries:
+        response = entry["response"]
+        text = response if isinstance(response, str) else json.dumps(response, ensure_ascii=False)
+        scripts.append((
+            f"file:{entry['contains']}",
+            lambda p, kw, needle=entry["contains"]: needle in p,
+            lambda p, rng, text=text: text,
+        ))
+    return scripts
+
+
+class FakeChatModel(BaseChatModel):
+    """依腳本回應、模擬延遲與 token 輸出速率的確定性聊天模型"""
+
+    model_name: str = "fake-llm"
+    temperature: float = 0.0
+    latency: str = "fixed:0"
+    tokens_per_second: float = 0.0
+    seed: int = 0
+    scripts: List[Any] = Field(default_factory=lambda: list(DEFAULT_SCRIPTS))
+
+    @classmethod
+    def from_env(cls, **kwargs: Any) -> "FakeChatModel":
+        """
+        依環境變數建立（kwargs 優先）
+
+        環境變數：
+            FAKE_LLM_LATENCY: 首 token 延遲分佈（預設 lognormal:0.8,0.5）
+            FAKE_LLM_TOKENS_PER_SECOND: 輸出速率，0 表示不限速（預設 80）
+            FAKE_LLM_SEED: 亂數種子（預設 0）
+            FAKE_LLM_SCRIPTS: 自訂腳本 JSON 檔路徑，優先於內建腳本
+        """
+        params: Dict[str, Any] = {
+            "latency": getenv("FAKE_LLM_LATENCY", "lognormal:0.8,0.5"),
+            "tokens_per_second": float(getenv("FAKE_LLM_TOKENS_PER_SECOND", "80")),
+            "seed": int(getenv("FAKE_LLM_SEED", "0")),
+        }
+        if getenv("FAKE_LLM_SCRIPTS"):
+            params["scripts"] = load_scripts(getenv("FAKE_LLM_SCRIPTS")) + list(DEFAULT_SCRIPTS)
+        params.update(kwargs)
+        return cls(**params)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {
+            "model_name": self.model_name, "temperature": self.temperature, "latency": self.latency,
+            "tokens_per_second": self.tokens_per_second, "seed": self.seed,
+        }
+
+    # ---- 回應產生 ----
+    def script_for(self, messages: Sequence[BaseMessage], **kwargs: Any) -> Tuple[str, str, float]:
+        """回傳 (腳本名稱, 回應文字, 首 token 延遲秒數)"""
+        prompt = "\n".join(str(message.content) for message in messages)
+        digest = hashlib.sha256(f"{self.seed}\x00{self.model_name}\x00{self.temperature}\x00{prompt}".encode("utf-8"))
+        rng = random.Random(digest.hexdigest())
+        # 延遲另用獨立亂數，調整延遲分佈不會改變回應內容
+        delay = max(0.0, parse_latency(self.latency)(random.Random(f"latency:{digest.hexdigest()}")))
+        for name, match, respond in self.scripts:
+            if match(prompt, kwargs):
+                return name, respond(prompt, rng), delay
+        return "empty", "", delay
+
+    def _usage(self, messages: Sequence[BaseMessage], output_tokens: int) -> Dict[str, int]:
+        input_tokens = sum(len(split_tokens(str(message.content))) for message in messages)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _result(self, messages: Sequence[BaseMessage], text: str, tokens: List[str]) -> ChatResult:
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, len(tokens)),
+                            response_metadata={"model_name": self.model_name, "finish_reason": "stop"})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _total_delay(self, delay: float, tokens: List[str]) -> float:
+        return delay + (len(tokens) / self.tokens_per_second if self.tokens_per_second > 0 else 0.0)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        _, text, delay = self.script_for(messages, **kwargs)
+        tokens = split_tokens(text)
+        time.sleep(self._total_delay(delay, tokens))
+        return self._result(messages, text, tokens)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        _, text, delay = self.script_for(messages, **kwargs)
+        tokens = split_tokens(text)
+        await asyncio.sleep(self._total_delay(delay, tokens))
+        return self._result(messages, text, tokens)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        _, text, delay = self.script_for(messages, **kwargs)
+        tokens = split_tokens(text)
+        time.sleep(delay)
+        for token in tokens:
+            if self.tokens_per_second > 0:
+                time.sleep(1 / self.tokens_per_second)
+            yield self._chunk(token, run_manager)
+        yield self._final_chunk(messages, len(tokens))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        _, text, delay = self.script_for(messages, **kwargs)
+        tokens = split_tokens(text)
+        await asyncio.sleep(delay)
+        started = time.monotonic()
+        for index, token in enumerate(tokens):
+            if self.tokens_per_second > 0:
+                # 依排程時間補睡，避免大量 session 時每個 token 都切換一次事件迴圈
+                lag = started + index / self.tokens_per_second - time.monotonic()
+                if lag > 0.005:
+                    await asyncio.sleep(lag)
+            chunk = self._chunk(token, None)
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        remaining = started + len(tokens) / self.tokens_per_second - time.monotonic() if self.tokens_per_second > 0 else 0
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+        yield self._final_chunk(messages, len(tokens))
+
+    def _chunk(self, token: str, run_manager: Any) -> ChatGenerationChunk:
+        chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+        if run_manager:
+            run_manager.on_llm_new_token(token, chunk=chunk)
+        return chunk
+
+    def _final_chunk(self, messages: Sequence[BaseMessage], output_tokens: int) -> ChatGenerationChunk:
+        return ChatGenerationChunk(message=AIMessageChunk(
+            content="", usage_metadata=self._usage(messages, output_tokens),
+            response_metadata={"model_name": self.model_name, "finish_reason": "stop"},
+        ))
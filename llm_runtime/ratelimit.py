@@ -0,0 +1,389 @@
+"""
+供應商感知的速率限制與重試排程
+
+所有 ChatOpenAI 實例共用一個限流器，掛在 OpenAI SDK 底層的 httpx transport 上：
+每一次 HTTP 請求（包含重試）送出前都要先取得額度，因此不論呼叫來自 need_finder、
+evaluator 或 biodesign 的 get_llm，都在同一份預算內排隊。
+
+- 雙 token bucket：requests/min 與 tokens/min（依請求內容估計 prompt token，
+  再加上 max_tokens 或預設的輸出估計）。
+- 供應商回應的 x-ratelimit-remaining-* 標頭會同步回 bucket，避免本地估計過於樂觀。
+- 收到 429 時全域暫停（優先採用 Retry-After，否則指數退避加 jitter），
+  所有呼叫者一起等待；5xx 與連線錯誤只讓該請求自行退避重試。
+- 優先等級：interactive 高於 batch。有 interactive 請求在等待時，batch 請求讓出額度。
+  等級以 contextvar 設定（``llm_priority("batch")``），會隨 asyncio task 傳遞。
+
+transport 只看 HTTP 層，因此可以直接對本機的假 LLM 伺服器測試（把 base_url 指向它）。
+非同步連線池綁定建立它的 event loop，因此每個執行中的 loop 各有一個
+（同步入口以 asyncio.run 建立的新 loop 不會沿用已關閉 loop 的連線）。
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from os import getenv
+from typing import Any, Dict, Iterator, Optional
+from weakref import WeakKeyDictionary
+
+import httpx
+
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BATCH)
+
+# 會觸發重試的狀態碼；429 另外觸發全域暫停
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_priority: ContextVar[str] = ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: str) -> Iterator[None]:
+    """在此區塊（含其中建立的 asyncio task）內以指定優先等級排隊"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"未知的優先等級: {priority}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+class TokenBucket:
+    """每分鐘補充 rate_per_minute 單位、容量為一分鐘額度的 token bucket"""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """還要等多久才有 amount 的額度（超過容量的請求以容量計，避免永遠等不到）"""
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+
+class ProviderRateLimiter:
+    """RPM + TPM 雙 bucket 的共用限流器，含全域退避與優先等級"""
+
+    def __init__(self, requests_per_minute: float = 500, tokens_per_minute: float = 200_000,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 default_completion_tokens: int = 1024):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.default_completion_tokens = default_completion_tokens
+        self._lock = threading.Lock()
+        self._waiting = {priority: 0 for priority in PRIORITIES}
+        self._backoff_until = 0.0
+        self._consecutive_429 = 0
+        self._counters = {
+            "requests": 0, "throttled": 0, "rate_limited": 0, "retries": 0, "wait_seconds": 0.0,
+        }
+        self._http_clients = None
+
+    def http_clients(self):
+        """共用的 (httpx.Client, httpx.AsyncClient)；AsyncClient 的連線池依 event loop 分開"""
+        with self._lock:
+            if self._http_clients is None:
+                self._http_clients = (
+                    httpx.Client(transport=RateLimitedTransport(self)),
+                    httpx.AsyncClient(transport=RateLimitedAsyncTransport(self)),
+                )
+            return self._http_clients
+
+    # ---- 取得額度 ----
+    def _reserve(self, tokens: int, priority: str) -> float:
+        """嘗試預留一次請求的額度；成功回傳 0，否則回傳建議等待秒數"""
+        now = time.monotonic()
+        if now < self._backoff_until:
+            return self._backoff_until - now
+        if priority != PRIORITY_INTERACTIVE and self._waiting[PRIORITY_INTERACTIVE]:
+            return 0.05
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+        if wait > 0:
+            return wait
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self._counters["requests"] += 1
+        return 0.0
+
+    async def acquire(self, tokens: int, priority: Optional[str] = None):
+        priority = priority or current_priority()
+        with self._lock:
+            self._waiting[priority] += 1
+        started = time.monotonic()
+        try:
+            while True:
+                with self._lock:
+                    wait = self._reserve(tokens, priority)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+        finally:
+            self._finish_wait(priority, started)
+
+    def acquire_sync(self, tokens: int, priority: Optional[str] = None):
+        priority = priority or current_priority()
+        with self._lock:
+            self._waiting[priority] += 1
+        started = time.monotonic()
+        try:
+            while True:
+                with self._lock:
+                    wait = self._reserve(tokens, priority)
+                if wait <= 0:
+                    break
+                time.sleep(wait)
+        finally:
+            self._finish_wait(priority, started)
+
+    def _finish_wait(self, priority: str, started: float):
+        waited = time.monotonic() - started
+        with self._lock:
+            self._waiting[priority] -= 1
+            if waited > 0.001:
+                self._counters["throttled"] += 1
+                self._counters["wait_seconds"] += waited
+
+    # ---- 回應回饋 ----
+    def observe(self, response: httpx.Response):
+        """依供應商回報的剩餘額度校正 bucket，並在 429 時設定全域暫停"""
+        headers = response.headers
+        with self._lock:
+            now = time.monotonic()
+            for bucket, header in ((self.requests, "x-ratelimit-remaining-requests"),
+                                   (self.tokens, "x-ratelimit-remaining-tokens")):
+                remaining = _number(headers.get(header))
+                if remaining is not None:
+                    bucket.refill(now)
+                    bucket.level = min(bucket.level, remaining)
+
+            if response.status_code == 429:
+                self._counters["rate_limited"] += 1
+                delay = retry_after_seconds(headers)
+                if delay is None:
+                    delay = self.backoff_delay(self._consecutive_429)
+                self._consecutive_429 += 1
+                self._backoff_until = max(self._backoff_until, now + delay)
+            elif response.status_code < 400:
+                self._consecutive_429 = 0
+
+    def backoff_delay(self, attempt: int) -> float:
+        """指數退避加 full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def record_retry(self):
+        with self._lock:
+            self._counters["retries"] += 1
+
+    def estimate_tokens(self, request: httpx.Request) -> int:
+        """由請求 JSON 估計本次會消耗的 token（prompt + 輸出上限）"""
+        try:
+            body = json.loads(request.content or b"{}")
+        except (ValueError, UnicodeDecodeError):
+            return self.default_completion_tokens
+        prompt_chars = sum(len(str(message.get("content") or "")) for message in body.get("messages", []))
+        # 中文約 1 字 1 token、英文約 4 字元 1 token，取保守的 2 字元 1 token
+        completion = body.get("max_completion_tokens") or body.get("max_tokens") or self.default_completion_tokens
+        return prompt_chars // 2 + int(completion)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            return {
+                **self._counters,
+                "waiting": dict(self._waiting),
+                "requests_available": self.requests.level,
+                "tokens_available": self.tokens.level,
+                "backoff_seconds": max(0.0, self._backoff_until - now),
+            }
+
+
+def retry_after_seconds(headers: httpx.Headers) -> Optional[float]:
+    """解析 retry-after-ms / Retry-After（秒數或 HTTP 日期）"""
+    milliseconds = _number(headers.get("retry-after-ms"))
+    if milliseconds is not None:
+        return milliseconds / 1000
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    seconds = _number(value)
+    if seconds is not None:
+        return seconds
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimitedAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    每次送出前向限流器取得額度，遇到可重試的錯誤依退避策略重送
+
+    未指定 transport 時，每個執行中的 event loop 各建立一個 AsyncHTTPTransport：
+    連線綁定建立它的 loop，跨 loop 重用會在 loop 關閉後失敗（RuntimeError，不會被重試）。
+    """
+
+    def __init__(self, limiter: ProviderRateLimiter, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.limiter = limiter
+        self._transport = transport
+        # loop 結束並被回收後，其連線池隨之釋放
+        self._transports: "WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncBaseTransport]" = WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @property
+    def transport(self) -> httpx.AsyncBaseTransport:
+        """目前 event loop 使用的底層 transport"""
+        if self._transport is not None:
+            return self._transport
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport()
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        tokens = self.limiter.estimate_tokens(request)
+        transport = self.transport
+        attempt = 0
+        while True:
+            await self.limiter.acquire(tokens)
+            try:
+                response = await transport.handle_async_request(request)
+            except httpx.TransportError:
+                if attempt >= self.limiter.max_retries:
+                    raise
+            else:
+                self.limiter.observe(response)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.limiter.max_retries:
+                    return response
+                await response.aclose()
+                if response.status_code == 429:
+                    # 全域暫停已由 observe 設定，下一輪 acquire 會等待
+                    attempt += 1
+                    self.limiter.record_retry()
+                    continue
+            await asyncio.sleep(self.limiter.backoff_delay(attempt))
+            attempt += 1
+            self.limiter.record_retry()
+
+    async def aclose(self):
+        """關閉目前 event loop 的連線池"""
+        if self._transport is not None:
+            await self._transport.aclose()
+            return
+        with self._lock:
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """同步版本，供 invoke 路徑使用"""
+
+    def __init__(self, limiter: ProviderRateLimiter, transport: Optional[httpx.BaseTransport] = None):
+        self.limiter = limiter
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        tokens = self.limiter.estimate_tokens(request)
+        attempt = 0
+        while True:
+            self.limiter.acquire_sync(tokens)
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError:
+                if attempt >= self.limiter.max_retries:
+                    raise
+            else:
+                self.limiter.observe(response)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.limiter.max_retries:
+                    return response
+                response.close()
+                if response.status_code == 429:
+                    attempt += 1
+                    self.limiter.record_retry()
+                    continue
+            time.sleep(self.limiter.backoff_delay(attempt))
+            attempt += 1
+            self.limiter.record_retry()
+
+    def close(self):
+        self.transport.close()
+
+
+_shared_limiter: Optional[ProviderRateLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter() -> Optional[ProviderRateLimiter]:
+    """
+    取得全程式共用的限流器；LLM_RATE_LIMIT=0 時回傳 None
+
+    環境變數：
+        LLM_RATE_LIMIT: 1 | 0（預設 1）
+        LLM_RATE_LIMIT_RPM: 每分鐘請求數（預設 500）
+        LLM_RATE_LIMIT_TPM: 每分鐘 token 數（預設 200000）
+        LLM_MAX_RETRIES: 429 / 5xx / 連線錯誤的最大重試次數（預設 5）
+        LLM_BACKOFF_BASE_SECONDS / LLM_BACKOFF_MAX_SECONDS: 指數退避的基準與上限（預設 1 / 60）
+    """
+    global _shared_limiter
+    if getenv("LLM_RATE_LIMIT", "1") == "0":
+        return None
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = ProviderRateLimiter(
+                requests_per_minute=float(getenv("LLM_RATE_LIMIT_RPM", "500")),
+                tokens_per_minute=float(getenv("LLM_RATE_LIMIT_TPM", "200000")),
+                max_retries=int(getenv("LLM_MAX_RETRIES", "5")),
+                base_delay=float(getenv("LLM_BACKOFF_BASE_SECONDS", "1")),
+                max_delay=float(getenv("LLM_BACKOFF_MAX_SECONDS", "60")),
+            )
+        return _shared_limiter
+
+
+def rate_limited_client_kwargs(limiter: Optional[ProviderRateLimiter] = None) -> Dict[str, Any]:
+    """
+    ChatOpenAI 使用限流 transport 所需的參數；沒有限流器時回傳空 dict
+
+    重試交由 transport 處理（每次重試都會重新排隊），因此關閉 SDK 內建重試。
+    """
+    limiter = limiter or get_rate_limiter()
+    if limiter is None:
+        return {}
+    http_client, http_async_client = limiter.http_clients()
+    return {"max_retries": 0, "http_client": http_client, "http_async_client": http_async_client}
@@ -0,0 +1,111 @@
+"""
+LLM 逐字串流輸出
+
+agent 節點改用 chain.astream 取得 token，將增量文字交給回調；為了避免事件
+列表暴增，增量會依時間間隔合併成批次（第一批立即送出以降低首字延遲）。
+interval_ms=0 時每個 token 立即送出（例如邊串流邊解析 JSON）。
+"""
+
+import time
+from os import getenv
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableBinding, RunnableSequence
+
+from llm_runtime.cache import alookup_message, aupdate_message
+from llm_runtime.usage import record_cached_message
+
+
+# 回調參數：(合併後的增量文字, 批次序號)
+DeltaCallback = Callable[[str, int], None]
+
+# token 增量合併的時間間隔（毫秒）
+TOKEN_DELTA_INTERVAL_MS = int(getenv("TOKEN_DELTA_INTERVAL_MS", "200"))
+
+
+class DeltaCoalescer:
+    """依時間間隔合併 token 增量"""
+
+    def __init__(self, on_delta: DeltaCallback, interval_ms: Optional[int] = None):
+        self.on_delta = on_delta
+        self.interval = (TOKEN_DELTA_INTERVAL_MS if interval_ms is None else interval_ms) / 1000
+        self.buffer: list = []
+        self.seq = 0
+        self.last_emit = 0.0
+
+    def feed(self, text: str):
+        if not text:
+            return
+        self.buffer.append(text)
+        if time.monotonic() - self.last_emit >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        self.on_delta("".join(self.buffer), self.seq)
+        self.buffer = []
+        self.seq += 1
+        self.last_emit = time.monotonic()
+
+
+def _chunk_text(chunk: Any) -> str:
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return ""
+
+
+async def astream_message(chain, inputs: Dict[str, Any], on_delta: Optional[DeltaCallback] = None,
+                          interval_ms: Optional[int] = None) -> BaseMessage:
+    """
+    執行 prompt | llm chain 並回傳完整訊息
+
+    有 on_delta 時改用串流介面，將合併後的增量文字即時交給回調；
+    沒有回調時直接 ainvoke，不增加額外開銷。
+
+    LangChain 的 astream 不經過模型快取，因此 prompt | llm 形式的 chain 會先
+    自行查詢 LLM 快取：命中時把完整內容當作單一增量送出並記入用量統計，
+    未命中則串流後回寫。
+    """
+    if on_delta is None:
+        return await chain.ainvoke(inputs)
+
+    llm, bound_kwargs = _chat_model(chain.last) if isinstance(chain, RunnableSequence) else (None, {})
+    if llm is not None:
+        prompt = RunnableSequence(*chain.steps[:-1]) if len(chain.steps) > 2 else chain.first
+        messages = (await prompt.ainvoke(inputs)).to_messages()
+        started = time.perf_counter()
+        cached = await alookup_message(llm, messages, **bound_kwargs)
+        if cached is not None:
+            record_cached_message(llm, cached, (time.perf_counter() - started) * 1000, **bound_kwargs)
+            on_delta(_chunk_text(cached), 0)
+            return cached
+        message = await _stream(chain.last, messages, on_delta, interval_ms)
+        await aupdate_message(llm, messages, message, **bound_kwargs)
+        return message
+
+    return await _stream(chain, inputs, on_delta, interval_ms)
+
+
+def _chat_model(step: Any) -> Tuple[Optional[BaseChatModel], Dict[str, Any]]:
+    """取出 chain 最後一步的 chat model 與 bind() 綁定的參數（如 response_format）"""
+    if isinstance(step, BaseChatModel):
+        return step, {}
+    if isinstance(step, RunnableBinding) and isinstance(step.bound, BaseChatModel):
+        return step.bound, dict(step.kwargs)
+    return None, {}
+
+
+async def _stream(runnable, inputs: Any, on_delta: DeltaCallback, interval_ms: Optional[int]) -> BaseMessage:
+    coalescer = DeltaCoalescer(on_delta, interval_ms)
+    message = None
+    async for chunk in runnable.astream(inputs):
+        message = chunk if message is None else message + chunk
+        coalescer.feed(_chunk_text(chunk))
+    coalescer.flush()
+    return message
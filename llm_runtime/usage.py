@@ -0,0 +1,349 @@
+"""
+LLM 用量、成本與延遲的歸屬統計
+
+工廠建立的每個聊天模型都掛上同一個 ``UsageCallbackHandler``（LangChain callback），
+每次呼叫結束時記錄 prompt / completion token、延遲、首字延遲與估算成本，
+並依 session、node、role、round 四個標籤彙總：
+
+- 標籤以 contextvar 設定（``usage_labels(session=..., node=..., role=..., round=...)``），
+  與 ``llm_priority`` 相同會隨 asyncio task 傳遞，巢狀區塊只覆寫指定的標籤。
+- 未設定 session / node 時改用 LangGraph 放在 callback metadata 的 thread_id 與 langgraph_node。
+- 命中 LangChain 模型快取的呼叫（usage_metadata.total_cost == 0）記為 cached，
+  token 照計但不計成本；astream_message 自行查詢快取命中時不經過模型，
+  改由 ``record_cached_message`` 交給模型上掛的 handler 記錄。
+
+另依 role 累計呼叫延遲分佈（LatencyHistogram），供 /metrics 以 histogram 輸出。
+
+成本以每百萬 token 的美元單價估算；未列於價目表的模型成本為 0。
+``LLM_PRICES`` 環境變數可用 JSON 覆寫或新增：``{"gpt-4.1-mini": [0.4, 1.6]}``。
+"""
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from os import getenv
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+
+# 每百萬 token 的美元單價 (input, output)
+DEFAULT_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4.1": (2.0, 8.0),
+    "gpt-4.1-mini": (0.4, 1.6),
+    "gpt-4.1-nano": (0.1, 0.4),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+}
+
+LABELS = ("session", "node", "role", "round")
+
+# 延遲分佈的桶上限（毫秒），供 Prometheus histogram 輸出
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (100, 250, 500, 1000, 2500, 5000, 10000, 20000, 30000, 60000, 120000)
+
+_labels: ContextVar[Dict[str, Any]] = ContextVar("llm_usage_labels", default={})
+
+
+@contextmanager
+def usage_labels(**labels: Any) -> Iterator[None]:
+    """在此區塊（含其中建立的 asyncio task）內的 LLM 呼叫都掛上這些歸屬標籤"""
+    unknown = set(labels) - set(LABELS)
+    if unknown:
+        raise ValueError(f"未知的用量標籤: {', '.join(sorted(unknown))}")
+    token = _labels.set({**_labels.get(), **{k: v for k, v in labels.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def current_labels() -> Dict[str, Any]:
+    return dict(_labels.get())
+
+
+def load_prices() -> Dict[str, Tuple[float, float]]:
+    prices = dict(DEFAULT_PRICES)
+    override = getenv("LLM_PRICES", "")
+    if override:
+        prices.update({model: (float(p[0]), float(p[1])) for model, p in json.loads(override).items()})
+    return prices
+
+
+@dataclass
+class UsageTotals:
+    """一組呼叫的加總"""
+    calls: int = 0
+    cached_calls: int = 0
+    errors: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    latency_ms: float = 0.0           # 延遲總和
+    max_latency_ms: float = 0.0
+
+    def add(self, call: "LLMCall"):
+        self.calls += 1
+        self.cached_calls += call.cached
+        self.errors += call.error
+        self.prompt_tokens += call.prompt_tokens
+        self.completion_tokens += call.completion_tokens
+        self.cost_usd += call.cost_usd
+        self.latency_ms += call.latency_ms
+        self.max_latency_ms = max(self.max_latency_ms, call.latency_ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "cached_calls": self.cached_calls,
+            "errors": self.errors,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "latency_ms": round(self.latency_ms, 1),
+            "avg_latency_ms": round(self.latency_ms / self.calls, 1) if self.calls else 0.0,
+            "max_latency_ms": round(self.max_latency_ms, 1),
+        }
+
+
+@dataclass
+class LatencyHistogram:
+    """固定桶的延遲分佈；counts 為各桶（含最後的 +Inf 桶）的非累計次數"""
+    bounds: Tuple[float, ...] = LATENCY_BUCKETS_MS
+    counts: List[int] = field(default_factory=list)
+    sum_ms: float = 0.0
+    count: int = 0
+
+    def __post_init__(self):
+        if not self.counts:
+            self.counts = [0] * (len(self.bounds) + 1)
+
+    def observe(self, latency_ms: float):
+        # 桶上限含等於（Prometheus 的 le 語意）
+        self.counts[bisect_left(self.bounds, latency_ms)] += 1
+        self.sum_ms += latency_ms
+        self.count += 1
+
+    def copy(self) -> "LatencyHistogram":
+        return LatencyHistogram(self.bounds, list(self.counts), self.sum_ms, self.count)
+
+
+@dataclass
+class LLMCall:
+    """單次 LLM 呼叫的紀錄"""
+    model: str
+    labels: Dict[str, Any]
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_ms: float = 0.0
+    first_token_ms: Optional[float] = None
+    cost_usd: float = 0.0
+    cached: bool = False
+    error: bool = False
+
+
+@dataclass
+class _SessionUsage:
+    totals: UsageTotals = field(default_factory=UsageTotals)
+    by_node: Dict[str, UsageTotals] = field(default_factory=dict)
+    by_role: Dict[str, UsageTotals] = field(default_factory=dict)
+    by_round: Dict[str, UsageTotals] = field(default_factory=dict)
+
+
+def _add_to(breakdown: Dict[str, UsageTotals], key: Any, call: LLMCall):
+    key = "unlabeled" if key is None else str(key)
+    totals = breakdown.get(key)
+    if totals is None:
+        totals = breakdown[key] = UsageTotals()
+    totals.add(call)
+
+
+def _breakdown(totals: UsageTotals, **groups: Dict[str, UsageTotals]) -> Dict[str, Any]:
+    return {"totals": totals.to_dict(),
+            **{name: {k: v.to_dict() for k, v in group.items()} for name, group in groups.items()}}
+
+
+class UsageTracker:
+    """
+    彙總所有 LLM 呼叫：process 總計、依 node / role / model 的分項、依 role 的延遲分佈，
+    以及每個 session 依 node / role / round 的分項（session 數有上限，最舊的先丟棄）
+    """
+
+    def __init__(self, prices: Optional[Dict[str, Tuple[float, float]]] = None, max_sessions: int = 10000,
+                 latency_buckets_ms: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.prices = load_prices() if prices is None else prices
+        self.max_sessions = max_sessions
+        self.latency_buckets_ms = tuple(latency_buckets_ms)
+        self.totals = UsageTotals()
+        self.by_node: Dict[str, UsageTotals] = {}
+        self.by_role: Dict[str, UsageTotals] = {}
+        self.by_model: Dict[str, UsageTotals] = {}
+        self.latency_by_role: Dict[str, LatencyHistogram] = {}
+        self._sessions: "OrderedDict[str, _SessionUsage]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        price = self.prices.get(model)
+        if price is None:
+            # 帶日期版本的模型名稱（例如 gpt-4.1-mini-2025-04-14）沿用基礎型號的單價
+            base = max((m for m in self.prices if model.startswith(m + "-")), key=len, default=None)
+            price = self.prices.get(base) if base else None
+        if price is None:
+            return 0.0
+        return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+    def record(self, call: LLMCall):
+        labels = call.labels
+        with self._lock:
+            self.totals.add(call)
+            _add_to(self.by_node, labels.get("node"), call)
+            _add_to(self.by_role, labels.get("role"), call)
+            _add_to(self.by_model, call.model, call)
+            role = str(labels.get("role", "unlabeled"))
+            histogram = self.latency_by_role.get(role)
+            if histogram is None:
+                histogram = self.latency_by_role[role] = LatencyHistogram(self.latency_buckets_ms)
+            histogram.observe(call.latency_ms)
+            session_id = labels.get("session")
+            if session_id is None:
+                return
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _SessionUsage()
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            session.totals.add(call)
+            _add_to(session.by_node, labels.get("node"), call)
+            _add_to(session.by_role, labels.get("role"), call)
+            _add_to(session.by_round, labels.get("round"), call)
+
+    def session_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """單一 session 的總計與依 node / role / round 的分項；沒有紀錄時為 None"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            return _breakdown(session.totals, by_node=session.by_node, by_role=session.by_role,
+                              by_round=session.by_round)
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def latency_histograms(self) -> Dict[str, LatencyHistogram]:
+        """依 role 的呼叫延遲分佈（複本）"""
+        with self._lock:
+            return {role: histogram.copy() for role, histogram in self.latency_by_role.items()}
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**_breakdown(self.totals, by_node=self.by_node, by_role=self.by_role, by_model=self.by_model),
+                    "sessions_tracked": len(self._sessions)}
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """把每次聊天模型呼叫的用量與延遲交給 UsageTracker"""
+
+    # 同步處理即可（只做加總），避免 LangChain 把 callback 丟到 executor
+    run_inline = True
+
+    def __init__(self, tracker: UsageTracker):
+        self.tracker = tracker
+        self._runs: Dict[UUID, Dict[str, Any]] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID,
+                            metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        metadata = metadata or {}
+        params = kwargs.get("invocation_params") or {}
+        labels = current_labels()
+        labels.setdefault("session", metadata.get("thread_id"))
+        labels.setdefault("node", metadata.get("langgraph_node"))
+        self._runs[run_id] = {
+            "start": time.perf_counter(),
+            "first_token": None,
+            "model": metadata.get("ls_model_name") or params.get("model") or params.get("model_name") or "unknown",
+            "labels": {k: v for k, v in labels.items() if v is not None},
+        }
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.get(run_id)
+        if run is not None and run["first_token"] is None:
+            run["first_token"] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        usage: Dict[str, Any] = {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or usage
+        # LangChain 在快取命中時把 total_cost 歸零作為標記
+        cached = usage.get("total_cost") == 0
+        prompt_tokens = int(usage.get("input_tokens", 0))
+        completion_tokens = int(usage.get("output_tokens", 0))
+        self.tracker.record(self._call(
+            run, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached=cached,
+            cost_usd=0.0 if cached else self.tracker.cost(run["model"], prompt_tokens, completion_tokens),
+        ))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            self.tracker.record(self._call(run, error=True))
+
+    def record_cached(self, model: str, message: BaseMessage, latency_ms: float = 0.0):
+        """記錄未經過模型的快取命中，與 on_llm_end 的 cached 呼叫相同：token 照計、不計成本"""
+        usage = getattr(message, "usage_metadata", None) or {}
+        labels = {k: v for k, v in current_labels().items() if v is not None}
+        self.tracker.record(LLMCall(
+            model=model, labels=labels, prompt_tokens=int(usage.get("input_tokens", 0)),
+            completion_tokens=int(usage.get("output_tokens", 0)), latency_ms=latency_ms, cached=True,
+        ))
+
+    @staticmethod
+    def _call(run: Dict[str, Any], **fields: Any) -> LLMCall:
+        now = time.perf_counter()
+        first = run["first_token"]
+        return LLMCall(model=run["model"], labels=run["labels"], latency_ms=(now - run["start"]) * 1000,
+                       first_token_ms=(first - run["start"]) * 1000 if first is not None else None, **fields)
+
+
+def record_cached_message(llm: BaseChatModel, message: BaseMessage, latency_ms: float = 0.0, **kwargs: Any):
+    """把自行查詢快取的命中交給模型上掛的 UsageCallbackHandler；kwargs 為 bind() 綁定的呼叫參數"""
+    callbacks = llm.callbacks
+    handlers = getattr(callbacks, "handlers", callbacks) or []
+    model = llm._get_ls_params(**kwargs).get("ls_model_name") or "unknown"
+    for handler in handlers:
+        if isinstance(handler, UsageCallbackHandler):
+            handler.record_cached(model, message, latency_ms)
+
+
+_shared_tracker: Optional[UsageTracker] = None
+_shared_handler: Optional[UsageCallbackHandler] = None
+_shared_lock = threading.Lock()
+
+
+def get_usage_tracker() -> UsageTracker:
+    """取得全程式共用的用量統計"""
+    get_usage_handler()
+    return _shared_tracker
+
+
+def get_usage_handler() -> UsageCallbackHandler:
+    """取得掛在每個聊天模型上的共用 callback"""
+    global _shared_tracker, _shared_handler
+    with _shared_lock:
+        if _shared_handler is None:
+            _shared_tracker = UsageTracker()
+            _shared_handler = UsageCallbackHandler(_shared_tracker)
+        return _shared_handler
@@ -8,19 +8,20 @@ This API provides endpoints to:
 4. GET /api/prioritization/{session_id} - Get needs prioritization results
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional
+from contextlib import asynccontextmanager
 import uuid
 import asyncio
 from datetime import datetime
 from loguru import logger
 import sys
 import json
-import time
+from os import getenv
 
 # Configure loguru logger
 logger.remove()  # Remove default handler
@@ -39,23 +40,121 @@ logger.add(
 )
 
 # Import your existing modules
-from src.agents.need_finder import MedicalReflectionSystem, run_reflection_sync
-from src.agents.need_finder_realtime import MedicalReflectionSystemWithRealtime, run_reflection_sync_realtime
+from src.agents.need_finder import MedicalReflectionSystem, get_reflection_system, run_reflection_sync, run_reflection_async
+from src.agents.need_finder_realtime import MedicalReflectionSystemWithRealtime, get_reflection_system_realtime, run_reflection_sync_realtime, run_reflection_async_realtime
 from src.agents.evaluator import NeedEvaluator
+from src.agents.checkpoint import CHECKPOINT_DB_PATH
+from src.server.event_bus import EventBus, SharedEventBus, SESSION_CLOSED, format_sse
+from src.server.session_store import ACTIVE_STATUSES, InMemorySessionStore, SharedSessionStore, SQLiteSessionStore
+from src.server.batch import BatchRegistry, SharedBatchRegistry
+from src.server.scheduler import JobScheduler
+from src.server.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, EventCounter, render_metrics
+from llm_runtime import (PRIORITY_BATCH, PRIORITY_INTERACTIVE, bypass_cache as llm_cache_bypass, get_rate_limiter,
+                         get_response_cache, get_usage_tracker, usage_labels)
 
 def evaluate_needs_list(needs_list):
     """Helper function to evaluate needs list using NeedEvaluator"""
     evaluator = NeedEvaluator()
     return evaluator.evaluate_needs(needs_list)
 
-# Global storage for sessions (in production, use a database)
-sessions: Dict[str, Dict[str, Any]] = {}
-session_streams: Dict[str, List[Dict[str, Any]]] = {}  # Store stream events
+# Shared-state mode lets several uvicorn workers serve the API behind one port: sessions,
+# event logs and batches live in SQLite files (WAL mode) and SSE streams are fed across processes
+SHARED_STATE = getenv("SHARED_STATE", "0") == "1"
+SESSION_DB_PATH = getenv("SESSION_DB_PATH", "data/sessions.db")
+SESSION_DB_TTL_SECONDS = float(getenv("SESSION_DB_TTL_SECONDS", str(7 * 24 * 3600)))
+WORKER_HEARTBEAT_SECONDS = float(getenv("WORKER_HEARTBEAT_SECONDS", "5"))
+if SHARED_STATE and not SESSION_DB_PATH:
+    raise RuntimeError("SHARED_STATE=1 requires SESSION_DB_PATH")
+
+if SHARED_STATE:
+    session_streams: Dict[str, List[Dict[str, Any]]] = {}  # unused: the shared bus logs to SQLite
+    event_bus = SharedEventBus(
+        getenv("EVENT_DB_PATH", "data/events.db"),
+        poll_interval=float(getenv("EVENT_POLL_MS", "50")) / 1000,
+    )
+    # Bounded cache of other workers' sessions; the sessions each worker runs are written through
+    sessions = SharedSessionStore(
+        SQLiteSessionStore(SESSION_DB_PATH, ttl_seconds=SESSION_DB_TTL_SECONDS),
+        stale_seconds=3 * WORKER_HEARTBEAT_SECONDS,
+        max_sessions=int(getenv("SESSION_MAX_RESIDENT", "1000")),
+        max_bytes=int(getenv("SESSION_MAX_RESIDENT_MB", "256")) * 1024 * 1024,
+        ttl_seconds=float(getenv("SESSION_MEMORY_TTL_SECONDS", "3600")),
+        on_evict=event_bus.forget,
+    )
+    batches = SharedBatchRegistry(
+        SESSION_DB_PATH,
+        max_batches=int(getenv("BATCH_MAX_RESIDENT", "1000")),
+        on_evict=event_bus.forget,
+    )
+else:
+    # Event logs live in the bus; they are dropped when their session is evicted from memory
+    session_streams: Dict[str, List[Dict[str, Any]]] = {}  # Store stream events
+    event_bus = EventBus(session_streams)
+
+    # Bounded session storage: finished sessions are evicted by TTL/LRU and spilled to SQLite
+    sessions = InMemorySessionStore(
+        max_sessions=int(getenv("SESSION_MAX_RESIDENT", "1000")),
+        max_bytes=int(getenv("SESSION_MAX_RESIDENT_MB", "256")) * 1024 * 1024,
+        ttl_seconds=float(getenv("SESSION_MEMORY_TTL_SECONDS", "3600")),
+        spill=SQLiteSessionStore(SESSION_DB_PATH, ttl_seconds=SESSION_DB_TTL_SECONDS) if SESSION_DB_PATH else None,
+        on_evict=event_bus.forget,
+    )
+
+    # Batches of sessions submitted together; each batch multiplexes its sessions' events on its own channel
+    batches = BatchRegistry(
+        max_batches=int(getenv("BATCH_MAX_RESIDENT", "1000")),
+        on_evict=event_bus.forget,
+    )
+BATCH_MAX_REQUESTS = int(getenv("BATCH_MAX_REQUESTS", "100"))
+
+# Seconds of silence after which an SSE stream sends a keep-alive comment
+SSE_HEARTBEAT_SECONDS = float(getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+# Reflection pipelines run as coroutines on the event loop; the scheduler caps how many
+# debates are in flight at once so a burst of submissions cannot flood the LLM provider,
+# starts interactive sessions ahead of batch ones and lets queued or running sessions be cancelled
+MAX_CONCURRENT_REFLECTIONS = int(getenv("MAX_CONCURRENT_REFLECTIONS", "100"))
+scheduler = JobScheduler(MAX_CONCURRENT_REFLECTIONS)
+
+# Status events emitted on this worker, exported by GET /metrics
+emitted_events = EventCounter()
+
+# Sessions left queued/processing by a previous worker are resumed on startup from their last
+# completed graph node. Without durable checkpoints (CHECKPOINT_DB_PATH) a resume would re-run and
+# re-pay every LLM turn from the start, so by default they are marked failed instead
+RESUME_INTERRUPTED_SESSIONS = getenv("RESUME_INTERRUPTED_SESSIONS", "1" if CHECKPOINT_DB_PATH else "0") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    recover_interrupted_sessions()
+    watchdog = asyncio.create_task(watch_workers()) if SHARED_STATE else None
+    yield
+    event_bus.flush()
+    if watchdog is not None:
+        watchdog.cancel()
+        sessions.shutdown()
+
+async def watch_workers():
+    """
+    Shared-state mode: heartbeat this worker, apply cancellations requested through
+    other workers, and take over the active sessions of workers that stopped
+    heartbeating (crashed, or shut down mid-run)
+    """
+    while True:
+        await asyncio.sleep(WORKER_HEARTBEAT_SECONDS)
+        try:
+            sessions.heartbeat()
+            for session_id in sessions.take_cancel_requests():
+                cancel_session(session_id)
+            recover_interrupted_sessions()
+        except Exception as e:
+            logger.error(f"Worker heartbeat failed: {e}")
 
 app = FastAPI(
     title="Biodesign Methodology with LLM Agent",
     description="API for medical needs analysis and evaluation",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -74,11 +173,34 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 class ReflectionRequest(BaseModel):
     query: str = Field(..., description="The medical query to analyze")
     max_rounds: int = Field(default=3, description="Maximum discussion rounds", ge=1, le=10)
+    bypass_cache: bool = Field(default=False, description="Skip the LLM response cache for this run")
+    priority: Literal["interactive", "batch"] = Field(default=PRIORITY_INTERACTIVE, description="Scheduling lane; interactive sessions start first")
 
 class ReflectionResponse(BaseModel):
     session_id: str
     status: str
     message: str
+    queue_position: Optional[int] = Field(default=None, description="1-based position in the job queue; 0 once running")
+
+class BatchReflectionRequest(BaseModel):
+    requests: List[ReflectionRequest] = Field(..., description="Queries to analyze", min_length=1)
+
+class BatchReflectionResponse(BaseModel):
+    batch_id: str
+    session_ids: List[str]
+    status: str
+    message: str
+
+class BatchStatus(BaseModel):
+    batch_id: str
+    status: str
+    total: int
+    finished: int
+    progress: float
+    status_counts: Dict[str, int]
+    sessions: List[Dict[str, Any]]
+    created_at: datetime
+    completed_at: Optional[datetime] = None
 
 class ReflectionResult(BaseModel):
     session_id: str
@@ -90,6 +212,9 @@ class ReflectionResult(BaseModel):
     parsed_needs: Dict[str, Any]
     final_summary: str
     full_conversation: List[str]
+    token_usage: List[Dict[str, Any]] = []
+    usage: Dict[str, Any] = {}
+    queue_position: Optional[int] = None
     created_at: datetime
     completed_at: Optional[datetime] = None
 
@@ -109,18 +234,30 @@ class PrioritizationResult(BaseModel):
     recommendations: List[str]
     created_at: datetime
 
-def process_reflection(session_id: str, query: str, max_rounds: int):
-    """Background task to process reflection"""
+async def process_reflection(session_id: str, query: str, max_rounds: int, bypass_cache: bool = False,
+                             resume: bool = False):
+    """Scheduled job to process reflection"""
+    try:
+        with llm_cache_bypass(bypass_cache), usage_labels(session=session_id):
+            await _process_reflection(session_id, query, max_rounds, resume)
+    finally:
+        record_usage(session_id)
+        discard_if_cancelled(session_id)
+        event_bus.close(session_id)
+        sessions.complete(session_id)
+
+async def _process_reflection(session_id: str, query: str, max_rounds: int, resume: bool = False):
     logger.info(f"Starting reflection processing for session {session_id} with query: '{query[:100]}{'...' if len(query) > 100 else ''}'")
     
     try:
         # Update session status
         sessions[session_id]["status"] = "processing"
+        sessions.persist(session_id)
         logger.debug(f"Updated session {session_id} status to 'processing'")
         
         # Run the reflection system
         logger.info(f"Running reflection system for session {session_id} with max_rounds={max_rounds}")
-        result = run_reflection_sync(query, max_rounds)
+        result = await run_reflection_async(query, max_rounds, thread_id=session_id, resume=resume)
         logger.success(f"Reflection completed successfully for session {session_id}")
         
         # Store the result
@@ -129,6 +266,7 @@ def process_reflection(session_id: str, query: str, max_rounds: int):
             "result": result,
             "completed_at": datetime.now()
         })
+        sessions.persist(session_id)
         logger.debug(f"Stored reflection result for session {session_id}")
         
         # Run evaluation automatically after reflection completes
@@ -136,7 +274,10 @@ def process_reflection(session_id: str, query: str, max_rounds: int):
             logger.info(f"Starting automatic evaluation for session {session_id}")
             try:
                 evaluator = NeedEvaluator()
-                evaluation_result = evaluator.evaluate_needs(result['parsed_needs']['needs'])
+                needs = result['parsed_needs']['needs']
+                evaluation_result = await evaluator.aevaluate_needs(
+                    needs, create_evaluation_callback(session_id, len(needs))
+                )
                 
                 sessions[session_id]["evaluation"] = {
                     "status": "completed",
@@ -229,7 +370,7 @@ def create_prioritization(evaluation_result) -> Dict[str, Any]:
     }
 
 # Status callback function for real-time updates
-def create_status_callback(session_id: str):
+def create_status_callback(session_id: str, batch_id: Optional[str] = None):
     """Create a status callback function for a specific session"""
     def status_callback(event_type: str, agent: str, data: Dict[str, Any]):
         timestamp = datetime.now().isoformat()
@@ -240,28 +381,158 @@ def create_status_callback(session_id: str):
             "data": data
         }
         
-        # Store event in session streams
-        if session_id not in session_streams:
-            session_streams[session_id] = []
-        session_streams[session_id].append(event)
+        # Log the event and push it to every open stream for this session
+        event_bus.publish(session_id, event)
+        emitted_events.inc(event_type, agent)
+        # Sessions in a batch also feed the batch's multiplexed stream
+        if batch_id:
+            event_bus.publish(batch_id, {**event, "session_id": session_id})
         
         logger.debug(f"Session {session_id}: {event_type} from {agent}")
     
     return status_callback
 
-def process_reflection_realtime(session_id: str, query: str, max_rounds: int):
-    """Background task to process reflection with real-time updates"""
+def create_evaluation_callback(session_id: str, total: int, status_callback=None):
+    """
+    Record per-need evaluations on the session as they finish so GET /api/evaluation
+    can report partial results, forwarding every event to the SSE stream when given.
+    The session is written through once when evaluation starts; per-need progress
+    stays in memory and on the event bus so disk I/O is not serialized on the event loop
+    """
+    partial: List[Dict[str, Any]] = []
+    sessions[session_id]["evaluation"] = {
+        "status": "processing",
+        "partial": partial,
+        "total": total,
+        "created_at": datetime.now()
+    }
+    sessions.persist(session_id)
+
+    def evaluation_callback(event_type: str, agent: str, data: Dict[str, Any]):
+        if event_type == "need_evaluated":
+            partial.append(data["evaluation"])
+        if status_callback:
+            status_callback(event_type, agent, data)
+
+    return evaluation_callback
+
+async def process_reflection_realtime(session_id: str, query: str, max_rounds: int, bypass_cache: bool = False,
+                                      batch_id: Optional[str] = None, resume: bool = False):
+    """Scheduled job to process reflection with real-time updates"""
+    try:
+        with llm_cache_bypass(bypass_cache), usage_labels(session=session_id):
+            await _process_reflection_realtime(session_id, query, max_rounds, batch_id, resume)
+    finally:
+        record_usage(session_id)
+        discard_if_cancelled(session_id)
+        event_bus.close(session_id)
+        if batch_id:
+            finish_batch_session(batch_id, session_id)
+        sessions.complete(session_id)
+
+def record_usage(session_id: str):
+    """
+    Move a finished job's LLM usage (reflection plus evaluation calls) from the
+    process-wide tracker into the session, so it is persisted with the result
+    """
+    tracker = get_usage_tracker()
+    usage = tracker.session_summary(session_id)
+    tracker.discard(session_id)
+    session = sessions.get(session_id)
+    if usage and session is not None:
+        session["usage"] = usage
+
+def session_usage(session_id: str, session: Dict[str, Any]) -> Dict[str, Any]:
+    """Usage recorded for a finished session, or the running totals of an active one"""
+    return session.get("usage") or get_usage_tracker().session_summary(session_id) or {}
+
+def discard_checkpoint(session_id: str, session: Dict[str, Any]):
+    """Drop a session's graph checkpoints so it is never resumed"""
+    system = get_reflection_system_realtime() if session.get("mode") == "realtime" else get_reflection_system()
+    system.discard_thread(session_id)
+
+def discard_if_cancelled(session_id: str):
+    # A cancelled job keeps its checkpoints like an interrupted one; drop them once its task has unwound
+    session = sessions.get(session_id)
+    if session and session.get("status") == "cancelled":
+        discard_checkpoint(session_id, session)
+
+def cancel_session(session_id: str) -> Optional[str]:
+    """
+    Cancel a session scheduled on this worker. Returns "queued" or "running"
+    (see JobScheduler.cancel), or None when this worker is not running it
+    """
+    state = scheduler.cancel(session_id)
+    if state is None:
+        return None
+    session = sessions[session_id]
+    if session.get("status") == "completed":
+        # The reflection already finished and the job was evaluating its needs: keep the result
+        for phase in ("evaluation", "prioritization"):
+            if phase in session and session[phase]["status"] != "completed":
+                session[phase] = {**session[phase], "status": "cancelled"}
+        logger.warning(f"Evaluation of session {session_id} cancelled")
+        return state
+    session.update({"status": "cancelled", "completed_at": datetime.now()})
+    logger.warning(f"Session {session_id} cancelled while {state}")
+    if state == "queued":
+        # The job never ran, so do the cleanup its finally block would have done
+        discard_checkpoint(session_id, session)
+        event_bus.close(session_id)
+        if session.get("batch_id"):
+            finish_batch_session(session["batch_id"], session_id)
+        sessions.complete(session_id)
+    return state
+
+def schedule_session(session_id: str, session: Dict[str, Any], resume: bool = False) -> int:
+    """Queue a session's reflection job; returns its queue position"""
+    if session.get("mode") == "realtime":
+        job = lambda: process_reflection_realtime(
+            session_id, session["query"], session["max_rounds"], session.get("bypass_cache", False),
+            session.get("batch_id"), resume=resume
+        )
+    else:
+        job = lambda: process_reflection(
+            session_id, session["query"], session["max_rounds"], session.get("bypass_cache", False), resume=resume
+        )
+    return scheduler.submit(session_id, job, session.get("priority", PRIORITY_INTERACTIVE))
+
+def finish_batch_session(batch_id: str, session_id: str):
+    """Announce a finished member session on the batch stream and close the stream after the last one"""
+    session = sessions.get(session_id) or {}
+    event_bus.publish(batch_id, {
+        "timestamp": datetime.now().isoformat(),
+        "event_type": "session_completed",
+        "agent": "system",
+        "session_id": session_id,
+        "data": {"status": session.get("status"), "error": session.get("error")}
+    })
+    if batches.session_finished(batch_id, session_id):
+        batch = batches.get(batch_id)
+        event_bus.publish(batch_id, {
+            "timestamp": datetime.now().isoformat(),
+            "event_type": "batch_completed",
+            "agent": "system",
+            "data": batch_progress(batch)
+        })
+        event_bus.close(batch_id)
+        logger.success(f"Batch {batch_id} completed")
+
+async def _process_reflection_realtime(session_id: str, query: str, max_rounds: int, batch_id: Optional[str] = None,
+                                       resume: bool = False):
     logger.info(f"Starting real-time reflection processing for session {session_id}")
     
     try:
         # Update session status
         sessions[session_id]["status"] = "processing"
+        sessions.persist(session_id)
         
         # Create status callback
-        status_callback = create_status_callback(session_id)
+        status_callback = create_status_callback(session_id, batch_id)
         
         # Run the reflection system with real-time updates
-        result = run_reflection_sync_realtime(query, max_rounds, status_callback)
+        result = await run_reflection_async_realtime(query, max_rounds, status_callback, thread_id=session_id,
+                                                     resume=resume)
         
         # Store the result
         sessions[session_id].update({
@@ -269,12 +540,16 @@ def process_reflection_realtime(session_id: str, query: str, max_rounds: int):
             "result": result,
             "completed_at": datetime.now()
         })
+        sessions.persist(session_id)
         
         # Run evaluation automatically after reflection completes
         if result.get('parsed_needs', {}).get('needs'):
             try:
                 evaluator = NeedEvaluator()
-                evaluation_result = evaluator.evaluate_needs(result['parsed_needs']['needs'])
+                needs = result['parsed_needs']['needs']
+                evaluation_result = await evaluator.aevaluate_needs(
+                    needs, create_evaluation_callback(session_id, len(needs), status_callback)
+                )
                 
                 sessions[session_id]["evaluation"] = {
                     "status": "completed",
@@ -322,8 +597,17 @@ async def api_info():
         "endpoints": {
             "POST /api/reflection": "Submit query for medical reflection analysis",
             "GET /api/reflection/{session_id}": "Get reflection results",
+            "DELETE /api/reflection/{session_id}": "Cancel a queued or running session",
             "GET /api/evaluation/{session_id}": "Get needs evaluation results",
             "GET /api/prioritization/{session_id}": "Get needs prioritization results",
+            "POST /api/reflection/batch": "Submit many queries at once as a batch",
+            "GET /api/reflection/batch/{batch_id}": "Get aggregate batch progress",
+            "GET /api/reflection/batch/{batch_id}/stream": "Stream events from every session in a batch",
+            "GET /api/llm-cache": "LLM response cache statistics",
+            "GET /api/llm-rate-limit": "Shared LLM rate limiter statistics",
+            "GET /api/scheduler": "Job queue depth per priority lane and running jobs",
+            "GET /api/metrics": "LLM tokens, cost and latency by node, role and model",
+            "GET /metrics": "Prometheus metrics: queue depth, sessions, SSE streams, events, LLM latency, cache, memory",
             "GET /health": "Health check endpoint"
         }
     }
@@ -335,7 +619,7 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.now()}
 
 @app.post("/api/reflection", response_model=ReflectionResponse)
-async def submit_reflection_query(request: ReflectionRequest, background_tasks: BackgroundTasks):
+async def submit_reflection_query(request: ReflectionRequest):
     """
     Submit a medical query for reflection analysis.
     This will run the MedicalReflectionSystem in the background.
@@ -346,24 +630,30 @@ async def submit_reflection_query(request: ReflectionRequest, background_tasks:
     # Initialize session
     sessions[session_id] = {
         "status": "queued",
+        "mode": "standard",
         "query": request.query,
         "max_rounds": request.max_rounds,
+        "bypass_cache": request.bypass_cache,
+        "priority": request.priority,
         "created_at": datetime.now()
     }
+    sessions.persist(session_id)
+    event_bus.open(session_id)
     logger.debug(f"Initialized session {session_id}")
     
-    # Add background task
-    background_tasks.add_task(process_reflection, session_id, request.query, request.max_rounds)
-    logger.info(f"Background task queued for session {session_id}")
+    # Queue the job
+    position = schedule_session(session_id, sessions[session_id])
+    logger.info(f"Job queued for session {session_id} at position {position}")
     
     return ReflectionResponse(
         session_id=session_id,
         status="queued",
-        message="Reflection analysis has been queued for processing"
+        message="Reflection analysis has been queued for processing",
+        queue_position=position
     )
 
 @app.post("/api/reflection-realtime", response_model=ReflectionResponse)
-async def submit_reflection_query_realtime(request: ReflectionRequest, background_tasks: BackgroundTasks):
+async def submit_reflection_query_realtime(request: ReflectionRequest):
     """
     Submit a medical query for reflection analysis with real-time updates.
     Use the /api/reflection-stream/{session_id} endpoint to get real-time updates.
@@ -374,24 +664,145 @@ async def submit_reflection_query_realtime(request: ReflectionRequest, backgroun
     # Initialize session
     sessions[session_id] = {
         "status": "queued",
+        "mode": "realtime",
         "query": request.query,
         "max_rounds": request.max_rounds,
+        "bypass_cache": request.bypass_cache,
+        "priority": request.priority,
         "created_at": datetime.now()
     }
+    sessions.persist(session_id)
     
     # Initialize stream storage
-    session_streams[session_id] = []
+    event_bus.open(session_id)
     
-    # Add background task for real-time processing
-    background_tasks.add_task(process_reflection_realtime, session_id, request.query, request.max_rounds)
+    # Queue the job for real-time processing
+    position = schedule_session(session_id, sessions[session_id])
     
-    logger.info(f"Real-time reflection processing queued for session {session_id}")
+    logger.info(f"Real-time reflection processing queued for session {session_id} at position {position}")
     return ReflectionResponse(
         session_id=session_id,
         status="queued",
-        message="Real-time reflection analysis queued successfully. Use /api/reflection-stream/{session_id} for real-time updates."
+        message="Real-time reflection analysis queued successfully. Use /api/reflection-stream/{session_id} for real-time updates.",
+        queue_position=position
     )
 
+@app.post("/api/reflection/batch", response_model=BatchReflectionResponse)
+async def submit_reflection_batch(request: BatchReflectionRequest):
+    """
+    Submit many queries at once. Each query becomes its own real-time session,
+    queued in the batch lane behind interactive submissions. Progress is at
+    /api/reflection/batch/{batch_id} and /api/reflection/batch/{batch_id}/stream
+    multiplexes the events of every session in the batch.
+    """
+    if len(request.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=413, detail=f"A batch may contain at most {BATCH_MAX_REQUESTS} requests")
+    
+    session_ids = [str(uuid.uuid4()) for _ in request.requests]
+    batch = batches.create(session_ids)
+    batch_id = batch["batch_id"]
+    event_bus.open(batch_id)
+    
+    for session_id, item in zip(session_ids, request.requests):
+        sessions[session_id] = {
+            "status": "queued",
+            "mode": "realtime",
+            "query": item.query,
+            "max_rounds": item.max_rounds,
+            "bypass_cache": item.bypass_cache,
+            "priority": PRIORITY_BATCH,
+            "batch_id": batch_id,
+            "created_at": datetime.now()
+        }
+        sessions.persist(session_id)
+        event_bus.open(session_id)
+        schedule_session(session_id, sessions[session_id])
+    
+    logger.info(f"Batch {batch_id} queued with {len(session_ids)} sessions")
+    return BatchReflectionResponse(
+        batch_id=batch_id,
+        session_ids=session_ids,
+        status="queued",
+        message=f"{len(session_ids)} reflection analyses queued. Use /api/reflection/batch/{batch_id}/stream for real-time updates."
+    )
+
+def recover_interrupted_sessions() -> List[str]:
+    """
+    Handle the sessions a previous worker left queued or processing (in
+    shared-state mode: the sessions claimed from workers that stopped
+    heartbeating). With RESUME_INTERRUPTED_SESSIONS they are restarted and the
+    graph continues from its last completed checkpoint; otherwise they are
+    marked as failed. Batch membership is not restored (the batch registry is
+    in memory), so resumed batch sessions run standalone. Returns the resumed ids
+    """
+    resumed, failed = [], []
+    for session_id, session in sessions.interrupted():
+        if not RESUME_INTERRUPTED_SESSIONS:
+            session.update({
+                "status": "error",
+                "error": "Interrupted by a worker restart (set CHECKPOINT_DB_PATH to resume interrupted sessions)",
+                "completed_at": datetime.now(),
+            })
+            sessions[session_id] = session
+            sessions.persist(session_id)
+            discard_checkpoint(session_id, session)
+            sessions.complete(session_id)
+            failed.append(session_id)
+            continue
+        session.pop("batch_id", None)
+        session.update({"status": "queued", "resumed_at": datetime.now()})
+        sessions[session_id] = session
+        sessions.persist(session_id)
+        event_bus.open(session_id)
+        schedule_session(session_id, session, resume=True)
+        resumed.append(session_id)
+    if resumed:
+        logger.warning(f"Resuming {len(resumed)} interrupted session(s): {', '.join(resumed)}")
+    if failed:
+        logger.warning(f"Marked {len(failed)} interrupted session(s) as failed: {', '.join(failed)}")
+    return resumed
+
+def batch_progress(batch: Dict[str, Any]) -> Dict[str, Any]:
+    """Aggregate the status of every session in a batch"""
+    members = []
+    status_counts: Dict[str, int] = {}
+    for session_id in batch["session_ids"]:
+        session = sessions.get(session_id)
+        status = session["status"] if session else "expired"
+        status_counts[status] = status_counts.get(status, 0) + 1
+        members.append({"session_id": session_id, "status": status})
+    total = len(batch["session_ids"])
+    finished = total - len(batch["pending"])
+    return {
+        "batch_id": batch["batch_id"],
+        "status": "completed" if finished == total else "processing",
+        "total": total,
+        "finished": finished,
+        "progress": finished / total,
+        "status_counts": status_counts,
+        "sessions": members,
+        "created_at": batch["created_at"],
+        "completed_at": batch["completed_at"]
+    }
+
+@app.get("/api/reflection/batch/{batch_id}", response_model=BatchStatus)
+async def get_batch_status(batch_id: str):
+    """Aggregate progress of a batch submission"""
+    batch = batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return BatchStatus(**batch_progress(batch))
+
+@app.get("/api/reflection/batch/{batch_id}/stream")
+async def stream_batch_updates(batch_id: str, last_event_id: Optional[str] = Header(default=None)):
+    """
+    Stream the events of every session in a batch over one SSE connection.
+    Each event carries its session_id; the stream ends with batch_completed.
+    """
+    if batches.get(batch_id) is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return sse_response(batch_id, last_event_id)
+
 @app.get("/api/reflection/{session_id}", response_model=ReflectionResult)
 async def get_reflection_result(session_id: str):
     """Get the reflection analysis results for a session"""
@@ -419,6 +830,8 @@ async def get_reflection_result(session_id: str):
             parsed_needs={},
             final_summary="",
             full_conversation=[],
+            usage=session_usage(session_id, session),
+            queue_position=scheduler.position(session_id),
             created_at=session["created_at"]
         )
     
@@ -434,10 +847,53 @@ async def get_reflection_result(session_id: str):
         parsed_needs=result["parsed_needs"],
         final_summary=result["final_summary"],
         full_conversation=result["full_conversation"],
+        token_usage=result.get("token_usage", []),
+        usage=session_usage(session_id, session) or result.get("usage") or {},
         created_at=session["created_at"],
         completed_at=session.get("completed_at")
     )
 
+@app.delete("/api/reflection/{session_id}", response_model=ReflectionResponse)
+async def cancel_reflection(session_id: str):
+    """
+    Cancel a queued or running session. A running session stops at its current
+    graph node (the in-flight LLM call is aborted) and its slot goes to the next queued job.
+    The status turns "completed" when the reflection phase ends while the same job goes on
+    to evaluate the needs, so cancellability follows the scheduler job, not the status
+    """
+    if session_id not in sessions:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    state = cancel_session(session_id)
+    session = sessions[session_id]
+    status = session["status"]
+    if state is None:
+        # Active sessions may be waiting for another worker to claim them after a crash
+        running_elsewhere = SHARED_STATE and (status in ACTIVE_STATUSES or sessions.owner(session_id) is not None)
+        if not running_elsewhere:
+            if status in ACTIVE_STATUSES:
+                raise HTTPException(status_code=409, detail="Session is not scheduled on this server")
+            raise HTTPException(status_code=409, detail=f"Session is already {status}")
+        # Another worker runs it; that worker picks the request up on its next heartbeat
+        sessions.request_cancel(session_id)
+        return ReflectionResponse(
+            session_id=session_id,
+            status="cancelling",
+            message="Cancellation requested from the worker running this session"
+        )
+    
+    if status == "completed":
+        return ReflectionResponse(
+            session_id=session_id,
+            status="completed",
+            message="Evaluation cancelled; the reflection result is kept"
+        )
+    return ReflectionResponse(
+        session_id=session_id,
+        status="cancelled",
+        message=f"Session cancelled while {state}"
+    )
+
 @app.get("/api/evaluation/{session_id}", response_model=EvaluationResult)
 async def get_evaluation_result(session_id: str):
     """Get the needs evaluation results for a session"""
@@ -459,9 +915,17 @@ async def get_evaluation_result(session_id: str):
         logger.error(f"Evaluation error for session {session_id}: {evaluation.get('error')}")
         raise HTTPException(status_code=500, detail=f"Evaluation failed: {evaluation.get('error')}")
     
+    if evaluation["status"] == "cancelled":
+        raise HTTPException(status_code=409, detail="Evaluation was cancelled")
+    
     if evaluation["status"] != "completed":
         logger.debug(f"Evaluation still processing for session {session_id}")
-        raise HTTPException(status_code=202, detail="Evaluation is still processing")
+        raise HTTPException(status_code=202, detail={
+            "message": "Evaluation is still processing",
+            "completed": len(evaluation.get("partial", [])),
+            "total": evaluation.get("total"),
+            "evaluations": evaluation.get("partial", [])
+        })
     
     logger.success(f"Returning evaluation result for session {session_id}")
     result = evaluation["result"]
@@ -495,6 +959,9 @@ async def get_prioritization_result(session_id: str):
         logger.error(f"Prioritization error for session {session_id}: {prioritization.get('error')}")
         raise HTTPException(status_code=500, detail=f"Prioritization failed: {prioritization.get('error')}")
     
+    if prioritization["status"] == "cancelled":
+        raise HTTPException(status_code=409, detail="Prioritization was cancelled")
+    
     if prioritization["status"] != "completed":
         logger.debug(f"Prioritization still processing for session {session_id}")
         raise HTTPException(status_code=202, detail="Prioritization is still processing")
@@ -526,49 +993,122 @@ async def list_sessions():
     logger.debug(f"Returning summary for {len(session_summaries)} sessions")
     return session_summaries
 
+@app.get("/api/llm-cache")
+async def llm_cache_stats():
+    """LLM response cache hit/miss counters"""
+    cache = get_response_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@app.get("/api/llm-rate-limit")
+async def llm_rate_limit_stats():
+    """Shared LLM rate limiter state: available budget, waits, 429s and retries"""
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return {"enabled": False}
+    return {"enabled": True, **limiter.stats()}
+
+@app.get("/api/scheduler")
+async def scheduler_stats():
+    """Reflection job queue: running jobs, queue depth per priority lane, cancellations"""
+    return scheduler.stats()
+
+@app.get("/api/metrics")
+async def usage_metrics():
+    """LLM calls, tokens, estimated cost and latency aggregated by node, role and model (this worker)"""
+    return get_usage_tracker().summary()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text exposition for this worker (sessions per status are shared in multi-worker mode)"""
+    cache = get_response_cache()
+    body = render_metrics(scheduler, sessions, event_bus, emitted_events, get_usage_tracker(),
+                          cache.stats() if cache is not None else None)
+    return Response(body, media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/api/reflection-stream/{session_id}")
-async def stream_reflection_updates(session_id: str):
+async def stream_reflection_updates(session_id: str, last_event_id: Optional[str] = Header(default=None)):
     """
     Stream real-time updates for a reflection session using Server-Sent Events (SSE).
+    Events are pushed as soon as they are emitted; reconnecting clients send
+    Last-Event-ID and only receive the events they missed.
     """
     if session_id not in sessions:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    def generate_events():
-        last_event_index = 0
-        
-        while True:
-            # Check if session is still active
-            session = sessions.get(session_id)
-            if not session:
-                yield f"data: {json.dumps({'type': 'error', 'message': 'Session not found'})}\n\n"
-                break
-            
-            # Get new events
-            events = session_streams.get(session_id, [])
-            new_events = events[last_event_index:]
+    def final_event():
+        session = sessions.get(session_id)
+        if not session:
+            return None
+        status = session.get("status")
+        if status == "completed":
+            message = "Session completed"
+        elif status == "cancelled":
+            message = "Session cancelled"
+        else:
+            message = f"Session failed: {session.get('error', 'Unknown error')}"
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "event_type": "session_completed",
+            "agent": "system",
+            "data": {
+                "status": status,
+                "message": message
+            }
+        }
+    
+    return sse_response(session_id, last_event_id, final_event)
+
+def sse_response(channel_id: str, last_event_id: Optional[str], final_event=None) -> StreamingResponse:
+    """
+    SSE stream over one event-bus channel (a session or a batch): replays events
+    after Last-Event-ID, then pushes live events until the channel closes
+    """
+    try:
+        resume_after = int(last_event_id) if last_event_id is not None else -1
+    except ValueError:
+        resume_after = -1
+    
+    async def generate_events():
+        # Subscribe before replaying the log so nothing emitted in between is lost
+        subscription = event_bus.subscribe(channel_id)
+        try:
+            last_sent = resume_after
+            for event in event_bus.events_after(channel_id, last_sent):
+                yield format_sse(event)
+                last_sent = event["id"]
             
-            # Send new events
-            for event in new_events:
-                yield f"data: {json.dumps(event)}\n\n"
-                last_event_index += 1
+            # Read the queue until the close marker itself is dequeued: close() runs right after
+            # the last publish(), so polling is_closed() would drop events still queued.
+            # A channel already closed (or never opened) when we subscribed gets no marker
+            if not event_bus.is_closed(channel_id):
+                while True:
+                    try:
+                        item = await subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield ": heartbeat\n\n"
+                        continue
+                    if item is SESSION_CLOSED:
+                        break
+                    if item["id"] <= last_sent:
+                        continue
+                    yield format_sse(item)
+                    last_sent = item["id"]
             
-            # Check if session is completed or errored
-            if session.get("status") in ["completed", "error"]:
-                final_event = {
-                    "timestamp": datetime.now().isoformat(),
-                    "event_type": "session_completed",
-                    "agent": "system",
-                    "data": {
-                        "status": session.get("status"),
-                        "message": "Session completed" if session.get("status") == "completed" else f"Session failed: {session.get('error', 'Unknown error')}"
-                    }
-                }
-                yield f"data: {json.dumps(final_event)}\n\n"
-                break
+            # Events published between the replay and a close that preceded the check above
+            for event in event_bus.events_after(channel_id, last_sent):
+                yield format_sse(event)
+                last_sent = event["id"]
             
-            # Wait before checking for new events
-            time.sleep(1)
+            if final_event is not None:
+                event = final_event()
+                if event is None:
+                    yield f"data: {json.dumps({'type': 'error', 'message': 'Session not found'})}\n\n"
+                    return
+                yield format_sse(event)
+        finally:
+            subscription.close()
     
     return StreamingResponse(
         generate_events(),
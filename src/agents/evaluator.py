@@ -1,9 +1,11 @@
-from typing import List, Dict, Any
+import asyncio
+from os import getenv
+from typing import List, Dict, Any, Optional
 from pydantic import BaseModel, Field
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from src.agents.need_finder import NeedItem
+from src.agents.need_finder import NeedItem, StatusCallback
+from llm_runtime import astream_message, create_chat_model, usage_labels
 
 # 定義評估結果結構
 class NeedEvaluation(BaseModel):
@@ -23,17 +25,45 @@ class NeedsEvaluationOutput(BaseModel):
     summary: str = Field(description="整體評估總結")
     top_priority_needs: List[str] = Field(description="前三優先需求的標題")
 
+EVALUATION_SYSTEM_PROMPT = """你是一位專業的醫療創新項目評估專家，具備豐富的醫療技術、市場分析和項目管理經驗。
+            請對提供的醫療需求項目進行全面評估。
+            
+            評估維度說明：
+            1. 可行性分數 (feasibility_score): 評估技術實現的可能性和現實性
+            2. 影響力分數 (impact_score): 評估對醫療系統和患者的潛在影響
+            3. 創新性分數 (innovation_score): 評估解決方案的創新程度和差異化
+            4. 資源需求分數 (resource_score): 評估所需資源的合理性 (10分表示資源需求很低)
+            5. 總體分數 (overall_score): 綜合考慮所有因素的整體評估
+            
+            評估原則：
+            - 所有分數範圍為 0-10 分
+            - 考慮醫療行業的特殊性和監管要求
+            - 關注實際可操作性和商業價值
+            - 提供具體、可行的改進建議
+            
+            {format_instructions}
+            """
+
 class NeedEvaluator:
-    def __init__(self, model: str = "gpt-4.1-mini", temperature: float = 0.3):
+    def __init__(self, model: str = "gpt-4.1-mini", temperature: float = 0.3, mode: Optional[str] = None,
+                 max_concurrency: Optional[int] = None):
         """
         初始化需求評估器
         
         Args:
             model: 使用的 LLM 模型
             temperature: 模型創造性參數
+            mode: per_need（每個需求各自並行評估）或 batch（所有需求一次評估）；
+                  未指定時讀取環境變數 EVALUATION_MODE（預設 per_need）
+            max_concurrency: per_need 模式同時進行的評估數；未指定時讀取 EVALUATION_MAX_CONCURRENCY（預設 4）
         """
-        self.llm = ChatOpenAI(model=model, temperature=temperature)
+        self.llm = create_chat_model(model, temperature)
         self.parser = PydanticOutputParser(pydantic_object=NeedsEvaluationOutput)
+        self.need_parser = PydanticOutputParser(pydantic_object=NeedEvaluation)
+        self.mode = mode or getenv("EVALUATION_MODE", "per_need")
+        if self.mode not in ("per_need", "batch"):
+            raise ValueError(f"未知的評估模式: {self.mode}")
+        self.max_concurrency = max_concurrency or int(getenv("EVALUATION_MAX_CONCURRENCY", "4"))
     
     def evaluate_needs(self, needs: List[NeedItem]) -> NeedsEvaluationOutput:
         """
@@ -46,32 +76,131 @@ class NeedEvaluator:
             NeedsEvaluationOutput: 評估結果
         """
         if not needs:
-            return NeedsEvaluationOutput(
-                evaluations=[],
-                summary="沒有需求項目需要評估",
-                top_priority_needs=[]
-            )
+            return self._create_empty_evaluation()
+        
+        if self.mode == "per_need":
+            return asyncio.run(self._aevaluate_per_need(needs))
+        
+        chain = self._build_prompt() | self.llm | self.parser
+        
+        try:
+            with usage_labels(node="evaluator", role="evaluator"):
+                result = chain.invoke({
+                    "needs_content": self._format_needs_for_evaluation(needs)
+                })
+            return result
+        except Exception as e:
+            print(f"評估過程發生錯誤: {e}")
+            # 提供默認評估結果
+            return self._create_default_evaluation(needs)
+    
+    async def aevaluate_needs(self, needs: List[NeedItem], status_callback: Optional[StatusCallback] = None) -> NeedsEvaluationOutput:
+        """
+        評估需求列表（非同步版本，不佔用 worker thread）
+        
+        Args:
+            needs: 需求項目列表
+            status_callback: per_need 模式下每完成一個需求送出 need_evaluated 事件；
+                             batch 模式下以串流方式生成，並將 token 增量以 token_delta 事件送出
+            
+        Returns:
+            NeedsEvaluationOutput: 評估結果
+        """
+        if not needs:
+            return self._create_empty_evaluation()
+        
+        if self.mode == "per_need":
+            return await self._aevaluate_per_need(needs, status_callback)
+        
+        on_delta = None
+        if status_callback:
+            def on_delta(delta: str, seq: int):
+                status_callback("token_delta", "evaluator", {"delta": delta, "seq": seq})
+        
+        try:
+            with usage_labels(node="evaluator", role="evaluator"):
+                message = await astream_message(self._build_prompt() | self.llm, {
+                    "needs_content": self._format_needs_for_evaluation(needs)
+                }, on_delta)
+            return self.parser.parse(message.content)
+        except Exception as e:
+            print(f"評估過程發生錯誤: {e}")
+            # 提供默認評估結果
+            return self._create_default_evaluation(needs)
+    
+    async def _aevaluate_per_need(self, needs: List[NeedItem], status_callback: Optional[StatusCallback] = None) -> NeedsEvaluationOutput:
+        """
+        每個需求各自一次 LLM 呼叫並行評估，完成一個就送出一個；
+        單一需求失敗只會讓該需求使用預設評估。最後以一次精簡呼叫產生整體總結。
+        """
+        chain = self._build_need_prompt() | self.llm | self.need_parser
+        semaphore = asyncio.Semaphore(self.max_concurrency)
         
+        async def evaluate(index: int, need: NeedItem) -> NeedEvaluation:
+            fallback = False
+            async with semaphore:
+                try:
+                    with usage_labels(node="evaluator", role="evaluator"):
+                        evaluation = await chain.ainvoke({"need_content": self._format_need(index + 1, need)})
+                    # 標題以輸入需求為準，確保與需求清單一一對應
+                    evaluation = evaluation.model_copy(update={"need_title": need['need']})
+                except Exception as e:
+                    print(f"需求「{need['need']}」評估失敗: {e}")
+                    evaluation = self._create_default_need_evaluation(need)
+                    fallback = True
+            if status_callback:
+                status_callback("need_evaluated", "evaluator", {
+                    "message": f"完成需求評估 ({index + 1}/{len(needs)})：{need['need']}",
+                    "index": index,
+                    "total": len(needs),
+                    "fallback": fallback,
+                    "evaluation": evaluation.model_dump()
+                })
+            return evaluation
+        
+        evaluations = list(await asyncio.gather(*(evaluate(i, need) for i, need in enumerate(needs))))
+        ranked = sorted(evaluations, key=lambda evaluation: evaluation.overall_score, reverse=True)
+        return NeedsEvaluationOutput(
+            evaluations=evaluations,
+            summary=await self._asummarize(ranked),
+            top_priority_needs=[evaluation.need_title for evaluation in ranked[:3]]
+        )
+    
+    async def _asummarize(self, ranked: List[NeedEvaluation]) -> str:
+        """以各需求的分數與要點產生整體總結（輸入精簡，成本遠低於完整評估）"""
+        digest = "\n".join(
+            f"- {evaluation.need_title}：總體 {evaluation.overall_score:.1f}，可行性 {evaluation.feasibility_score:.1f}，"
+            f"影響力 {evaluation.impact_score:.1f}；優勢：{'、'.join(evaluation.strengths[:2])}；"
+            f"劣勢：{'、'.join(evaluation.weaknesses[:2])}"
+            for evaluation in ranked
+        )
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", "你是一位醫療創新項目評估專家。請根據各需求的評估結果，以 150 字內撰寫整體評估總結與優先順序建議。"),
+            ("human", "各需求評估結果（依總體分數排序）：\n{digest}")
+        ])
+        try:
+            with usage_labels(node="evaluator", role="evaluation_summary"):
+                return (await (prompt | self.llm).ainvoke({"digest": digest})).content
+        except Exception as e:
+            print(f"評估總結產生失敗: {e}")
+            return f"共評估 {len(ranked)} 個需求，總體分數最高者為「{ranked[0].need_title}」。"
+    
+    def _build_need_prompt(self):
+        """建立單一需求評估用的 prompt（已帶入 parser 格式指示）"""
+        return ChatPromptTemplate.from_messages([
+            ("system", EVALUATION_SYSTEM_PROMPT),
+            ("human", """請評估以下醫療需求項目：
+
+{need_content}
+
+請提供詳細的評估，包括各維度分數、優劣勢分析和改進建議。""")
+        ]).partial(format_instructions=self.need_parser.get_format_instructions())
+    
+    def _build_prompt(self):
+        """建立評估用的 prompt（已帶入 parser 格式指示）"""
         # 構建評估 prompt
         evaluation_prompt = ChatPromptTemplate.from_messages([
-            ("system", """你是一位專業的醫療創新項目評估專家，具備豐富的醫療技術、市場分析和項目管理經驗。
-            請對提供的醫療需求項目進行全面評估。
-            
-            評估維度說明：
-            1. 可行性分數 (feasibility_score): 評估技術實現的可能性和現實性
-            2. 影響力分數 (impact_score): 評估對醫療系統和患者的潛在影響
-            3. 創新性分數 (innovation_score): 評估解決方案的創新程度和差異化
-            4. 資源需求分數 (resource_score): 評估所需資源的合理性 (10分表示資源需求很低)
-            5. 總體分數 (overall_score): 綜合考慮所有因素的整體評估
-            
-            評估原則：
-            - 所有分數範圍為 0-10 分
-            - 考慮醫療行業的特殊性和監管要求
-            - 關注實際可操作性和商業價值
-            - 提供具體、可行的改進建議
-            
-            {format_instructions}
-            """),
+            ("system", EVALUATION_SYSTEM_PROMPT),
             ("human", """請評估以下醫療需求項目：
 
 {needs_content}
@@ -80,64 +209,56 @@ class NeedEvaluator:
 同時提供整體總結和優先順序排序。""")
         ])
         
-        # 格式化需求內容
-        needs_content = self._format_needs_for_evaluation(needs)
-        
         # 格式化 prompt
         formatted_prompt = evaluation_prompt.partial(
             format_instructions=self.parser.get_format_instructions()
         )
         
-        # 執行評估
-        chain = formatted_prompt | self.llm | self.parser
-        
-        try:
-            result = chain.invoke({
-                "needs_content": needs_content
-            })
-            return result
-        except Exception as e:
-            print(f"評估過程發生錯誤: {e}")
-            # 提供默認評估結果
-            return self._create_default_evaluation(needs)
+        return formatted_prompt
+    
+    def _create_empty_evaluation(self) -> NeedsEvaluationOutput:
+        """創建空的評估結果（沒有需求可評估時使用）"""
+        return NeedsEvaluationOutput(
+            evaluations=[],
+            summary="沒有需求項目需要評估",
+            top_priority_needs=[]
+        )
     
     def _format_needs_for_evaluation(self, needs: List[NeedItem]) -> str:
         """格式化需求項目為評估用的文本"""
-        formatted_content = []
-        for i, need in enumerate(needs, 1):
-            content = f"""
-需求 {i}: {need['need']}
+        return "\n".join(self._format_need(i, need) for i, need in enumerate(needs, 1))
+    
+    def _format_need(self, index: int, need: NeedItem) -> str:
+        """格式化單一需求項目"""
+        return f"""
+需求 {index}: {need['need']}
 摘要: {need['summary']}
 醫療觀點: {need['medical_insights']}
 技術觀點: {need['tech_insights']}
 實施策略: {need['strategy']}
 ---
 """
-            formatted_content.append(content)
-        
-        return "\n".join(formatted_content)
+    
+    def _create_default_need_evaluation(self, need: NeedItem) -> NeedEvaluation:
+        """創建單一需求的默認評估結果（當該需求評估失敗時使用）"""
+        return NeedEvaluation(
+            need_title=need['need'],
+            feasibility_score=5.0,
+            impact_score=5.0,
+            innovation_score=5.0,
+            resource_score=5.0,
+            overall_score=5.0,
+            strengths=["需要進一步分析"],
+            weaknesses=["評估過程失敗"],
+            recommendations=["重新執行評估"]
+        )
     
     def _create_default_evaluation(self, needs: List[NeedItem]) -> NeedsEvaluationOutput:
         """創建默認評估結果（當評估失敗時使用）"""
-        evaluations = []
-        for need in needs:
-            evaluation = NeedEvaluation(
-                need_title=need.need,
-                feasibility_score=5.0,
-                impact_score=5.0,
-                innovation_score=5.0,
-                resource_score=5.0,
-                overall_score=5.0,
-                strengths=["需要進一步分析"],
-                weaknesses=["評估過程失敗"],
-                recommendations=["重新執行評估"]
-            )
-            evaluations.append(evaluation)
-        
         return NeedsEvaluationOutput(
-            evaluations=evaluations,
+            evaluations=[self._create_default_need_evaluation(need) for need in needs],
             summary="評估過程遇到問題，請檢查輸入數據或重新執行評估",
-            top_priority_needs=[need.need for need in needs[:3]]
+            top_priority_needs=[need['need'] for need in needs[:3]]
         )
     
     def print_evaluation_results(self, evaluation: NeedsEvaluationOutput):
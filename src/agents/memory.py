@@ -0,0 +1,181 @@
+"""
+對話記憶策略
+
+醫療專家與工程師節點每一輪都會把對話送給 LLM；若直接送出完整的
+state["messages"]，prompt token 會隨討論輪數呈二次成長。這裡提供可設定的
+記憶策略，決定每一輪實際送出的對話視窗：
+
+- full:          完整歷史（原始行為）
+- last_k:        原始問題 + 最近 K 則訊息
+- summary:       原始問題 + 滾動摘要 + 最近 K 則訊息
+- token_budget:  原始問題 + 在 token 預算內能放入的最近訊息
+
+原始問題（第一則 HumanMessage）在所有策略中都會保留。
+"""
+
+from functools import lru_cache
+from os import getenv
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """載入 tokenizer；tiktoken 不可用（或無法下載編碼檔）時回傳 None"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def count_text_tokens(text: str) -> int:
+    """計算文字的 token 數；沒有 tokenizer 時以字元數粗估"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # 中文約 1 字 1 token，英文約 4 字元 1 token，取保守估計
+    return max(1, len(text) // 2)
+
+
+def count_message_tokens(messages: Sequence[BaseMessage]) -> int:
+    """計算訊息列表的 token 數（每則訊息另加少量格式開銷）"""
+    return sum(count_text_tokens(str(message.content)) + 4 for message in messages)
+
+
+class MemoryPolicy:
+    """完整歷史：每一輪送出全部訊息"""
+
+    name = "full"
+
+    async def build_window(self, state: Dict[str, Any], llm) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+        """
+        建立本輪要送給 LLM 的對話視窗
+
+        Returns:
+            (訊息視窗, 需要寫回 state 的欄位)
+        """
+        return list(state["messages"]), {}
+
+
+class LastKMemoryPolicy(MemoryPolicy):
+    """原始問題 + 最近 K 則訊息"""
+
+    name = "last_k"
+
+    def __init__(self, k: int = 4):
+        self.k = k
+
+    async def build_window(self, state: Dict[str, Any], llm) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+        messages = state["messages"]
+        if len(messages) <= self.k + 1:
+            return list(messages), {}
+        return [messages[0]] + list(messages[-self.k:]), {}
+
+
+class TokenBudgetMemoryPolicy(MemoryPolicy):
+    """原始問題 + 在 token 預算內能放入的最近訊息（至少保留最近一則）"""
+
+    name = "token_budget"
+
+    def __init__(self, max_tokens: int = 4000):
+        self.max_tokens = max_tokens
+
+    async def build_window(self, state: Dict[str, Any], llm) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+        messages = state["messages"]
+        if len(messages) <= 2:
+            return list(messages), {}
+
+        budget = self.max_tokens - count_message_tokens(messages[:1])
+        recent: List[BaseMessage] = []
+        for message in reversed(messages[1:]):
+            cost = count_message_tokens([message])
+            if recent and cost > budget:
+                break
+            recent.append(message)
+            budget -= cost
+        return [messages[0]] + list(reversed(recent)), {}
+
+
+class RollingSummaryMemoryPolicy(MemoryPolicy):
+    """原始問題 + 滾動摘要 + 最近 K 則訊息；移出視窗的訊息會增量併入摘要"""
+
+    name = "summary"
+
+    def __init__(self, k: int = 4):
+        self.k = k
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", """你是醫療需求討論的記錄員。請將「既有摘要」與「新增對話」整合為一份更新後的摘要，
+            保留醫療專家與工程師提出的關鍵需求、解決方案與尚未解決的爭點。摘要需精簡，不超過 300 字。"""),
+            ("human", "既有摘要：\n{summary}\n\n新增對話：\n{new_messages}")
+        ])
+
+    async def build_window(self, state: Dict[str, Any], llm) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+        messages = state["messages"]
+        summary = state.get("conversation_summary", "")
+        summarized_until = state.get("summarized_until", 1)
+        window_start = max(1, len(messages) - self.k)
+
+        updates: Dict[str, Any] = {}
+        if window_start > summarized_until:
+            new_messages = "\n".join(
+                f"{_speaker(message)}：{message.content}" for message in messages[summarized_until:window_start]
+            )
+            response = await (self.prompt | llm).ainvoke({
+                "summary": summary or "（無）",
+                "new_messages": new_messages
+            })
+            summary = response.content
+            updates = {"conversation_summary": summary, "summarized_until": window_start}
+
+        window: List[BaseMessage] = [messages[0]]
+        if summary:
+            window.append(SystemMessage(content=f"先前討論摘要：\n{summary}"))
+        window.extend(messages[window_start:])
+        return window, updates
+
+
+def _speaker(message: BaseMessage) -> str:
+    if isinstance(message, HumanMessage):
+        return "使用者"
+    if isinstance(message, AIMessage):
+        return "專家"
+    return message.type
+
+
+def create_memory_policy(mode: Optional[str] = None, **kwargs) -> MemoryPolicy:
+    """
+    依名稱建立記憶策略；未指定時讀取環境變數
+
+    環境變數：
+        REFLECTION_MEMORY_POLICY: full | last_k | summary | token_budget（預設 token_budget）
+        REFLECTION_MEMORY_K: last_k / summary 保留的最近訊息數（預設 4）
+        REFLECTION_MEMORY_MAX_TOKENS: token_budget 的預算（預設 4000）
+    """
+    mode = mode or getenv("REFLECTION_MEMORY_POLICY", "token_budget")
+    if mode == "full":
+        return MemoryPolicy()
+    if mode == "last_k":
+        return LastKMemoryPolicy(k=kwargs.get("k", int(getenv("REFLECTION_MEMORY_K", "4"))))
+    if mode == "summary":
+        return RollingSummaryMemoryPolicy(k=kwargs.get("k", int(getenv("REFLECTION_MEMORY_K", "4"))))
+    if mode == "token_budget":
+        return TokenBudgetMemoryPolicy(
+            max_tokens=kwargs.get("max_tokens", int(getenv("REFLECTION_MEMORY_MAX_TOKENS", "4000")))
+        )
+    raise ValueError(f"未知的記憶策略: {mode}")
+
+
+def turn_usage(round_number: int, agent: str, window: Sequence[BaseMessage], response: BaseMessage) -> Dict[str, Any]:
+    """記錄單輪的 token 使用量；優先採用供應商回傳的 usage_metadata"""
+    usage = getattr(response, "usage_metadata", None) or {}
+    return {
+        "round": round_number,
+        "agent": agent,
+        "window_messages": len(window),
+        "input_tokens": usage.get("input_tokens") or count_message_tokens(window),
+        "output_tokens": usage.get("output_tokens") or count_text_tokens(str(response.content)),
+        "estimated": not usage,
+    }
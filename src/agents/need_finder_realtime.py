@@ -1,28 +1,22 @@
+import asyncio
+import uuid
 from typing import List, Literal, Sequence, TypedDict, Dict, Any, Callable, Optional
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END, START
-from langchain_core.output_parsers import PydanticOutputParser
-from pydantic import BaseModel, Field
-from os import getenv
+from langchain_core.runnables import RunnableConfig
 from dotenv import load_dotenv
+from src.agents.need_finder import (
+    CHECKPOINT_SERDE, COLLECTOR_PROMPT, NEEDS_RESPONSE_FORMAT, NeedItem, NeedsOutput,
+    collector_inputs, fallback_needs_output, status_callback_from_config
+)
+from src.agents.checkpoint import create_checkpointer, resume_or_start
+from src.agents.memory import MemoryPolicy, create_memory_policy, turn_usage
+from src.agents.router import DiscussionRouter, create_router
+from llm_runtime import astream_message, create_chat_model, get_usage_tracker, usage_labels
 load_dotenv()
 
 
-# 定義需求項目的結構
-class NeedItem(BaseModel):
-    need: str = Field(description="需求的名稱或標題")
-    summary: str = Field(description="需求的簡要總結")
-    medical_insights: str = Field(description="醫療專家的洞察和建議")
-    tech_insights: str = Field(description="技術專家的洞察和解決方案")
-    strategy: str = Field(description="綜合實施策略")
-
-# 定義整體需求輸出結構
-class NeedsOutput(BaseModel):
-    needs: List[NeedItem] = Field(description="識別出的需求列表")
-
 # 定義狀態結構
 class ReflectionState(TypedDict):
     messages: List[BaseMessage]
@@ -31,34 +25,51 @@ class ReflectionState(TypedDict):
     discussion_round: int
     max_rounds: int
     final_summary: str
+    needs_output: Optional[NeedsOutput]
+    conversation_summary: str
+    summarized_until: int
+    token_usage: List[Dict[str, Any]]
+    last_speaker: str
 
 # 定義狀態更新回調類型
 StatusCallback = Callable[[str, str, Dict[str, Any]], None]
 
 # 初始化 LLM
-llm = ChatOpenAI(
-    model="gpt-4.1-mini",
-    api_key=getenv("OPENAI_API_KEY"),
-    temperature=0.7)
+llm = create_chat_model("gpt-4.1-mini", temperature=0.7)
 
 class MedicalReflectionSystemWithRealtime:
-    def __init__(self, max_discussion_rounds: int = 5, status_callback: Optional[StatusCallback] = None):
+    def __init__(self, max_discussion_rounds: int = 5, status_callback: Optional[StatusCallback] = None, memory_policy: Optional[MemoryPolicy] = None, router: Optional[DiscussionRouter] = None):
         self.max_rounds = max_discussion_rounds
         self.status_callback = status_callback
+        # 醫療專家 / 工程師節點送給 LLM 的對話視窗策略
+        self.memory_policy = memory_policy or create_memory_policy()
+        # 每輪發言後決定下一位發言者的路由策略
+        self.router = router or create_router()
         self.graph = self._build_graph()
     
-        
-        # 初始化 parser
-        self.parser = PydanticOutputParser(pydantic_object=NeedsOutput)
-    
-    def _emit_status(self, event_type: str, agent: str, data: Dict[str, Any]):
-        """發送狀態更新"""
-        if self.status_callback:
+    def _emit_status(self, event_type: str, agent: str, data: Dict[str, Any], config: Optional[RunnableConfig] = None):
+        """發送狀態更新（優先使用本次呼叫 config 中的 status_callback）"""
+        status_callback = status_callback_from_config(config) or self.status_callback
+        if status_callback:
             try:
-                self.status_callback(event_type, agent, data)
+                status_callback(event_type, agent, data)
             except Exception as e:
                 print(f"Status callback error: {e}")
 
+    def _delta_emitter(self, agent: str, round_number: int, config: Optional[RunnableConfig] = None):
+        """有狀態回調時，回傳將 token 增量轉成 token_delta 事件的函數"""
+        if not (status_callback_from_config(config) or self.status_callback):
+            return None
+        
+        def on_delta(delta: str, seq: int):
+            self._emit_status("token_delta", agent, {
+                "round": round_number,
+                "delta": delta,
+                "seq": seq
+            }, config)
+        
+        return on_delta
+
     def _build_graph(self):
         """建立 LangGraph 工作流程"""
         builder = StateGraph(ReflectionState)
@@ -96,9 +107,8 @@ class MedicalReflectionSystemWithRealtime:
         
         builder.add_edge("collector", END)
 
-        # 設置檢查點保存器以支援狀態持久化  
-        memory = MemorySaver()
-        return builder.compile(checkpointer=memory)
+        # 設置檢查點保存器以支援狀態持久化（設定 CHECKPOINT_DB_PATH 時寫入 SQLite，重啟後可接續）
+        return builder.compile(checkpointer=create_checkpointer(CHECKPOINT_SERDE))
     
     def get_current_state(self, thread_id: str = "default"):
         """獲取當前 graph 狀態"""
@@ -124,14 +134,14 @@ class MedicalReflectionSystemWithRealtime:
             }
         return None
 
-    def medical_staff_node(self, state: ReflectionState) -> ReflectionState:
+    async def medical_staff_node(self, state: ReflectionState, config: RunnableConfig) -> ReflectionState:
         """醫療專家 Agent"""
         # 發送思考開始狀態
         self._emit_status("thinking_started", "medical_expert", {
             "round": state["discussion_round"] + 1,
             "message": "醫療專家正在分析醫療需求和流程問題...",
             "agent_name": "醫療專家"
-        })
+        }, config)
         
         medical_prompt = ChatPromptTemplate.from_messages([
             ("system", """你是一位資深的醫療專家，專精於醫療系統管理和資源配置。
@@ -147,35 +157,46 @@ class MedicalReflectionSystemWithRealtime:
         ])
         
         chain = medical_prompt | llm
-        response = chain.invoke({"messages": state["messages"]})
+        with usage_labels(node="medical_staff_agent", role="medical_expert", round=state["discussion_round"] + 1):
+            window, memory_updates = await self.memory_policy.build_window(state, llm)
+            response = await astream_message(
+                chain, {"messages": window},
+                self._delta_emitter("medical_expert", state["discussion_round"] + 1, config)
+            )
         
         # 更新狀態
         new_messages = state["messages"] + [response]
         medical_insights = state["medical_insights"] + [response.content]
         
+        usage = turn_usage(state["discussion_round"] + 1, "medical_expert", window, response)
+        
         # 發送思考完成狀態
         self._emit_status("thinking_completed", "medical_expert", {
             "round": state["discussion_round"] + 1,
             "response": response.content,
             "insight_count": len(medical_insights),
+            "token_usage": usage,
             "agent_name": "醫療專家"
-        })
+        }, config)
         
         return {
             **state,
+            **memory_updates,
             "messages": new_messages,
             "medical_insights": medical_insights,
-            "discussion_round": state["discussion_round"] + 1
+            "discussion_round": state["discussion_round"] + 1,
+            "token_usage": state.get("token_usage", []) + [usage],
+            "last_speaker": "medical_expert"
         }
     
-    def engineer_node(self, state: ReflectionState) -> ReflectionState:
+    async def engineer_node(self, state: ReflectionState, config: RunnableConfig) -> ReflectionState:
         """工程師 Agent"""
         # 發送思考開始狀態
         self._emit_status("thinking_started", "engineer", {
             "round": state["discussion_round"] + 1,
             "message": "工程師正在分析技術解決方案和系統優化...",
             "agent_name": "系統工程師"
-        })
+        }, config)
         
         engineer_prompt = ChatPromptTemplate.from_messages([
             ("system", """你是一位資深的系統工程師，專精於醫療資訊系統、流程優化和技術解決方案。
@@ -191,112 +212,81 @@ class MedicalReflectionSystemWithRealtime:
         ])
         
         chain = engineer_prompt | llm
-        response = chain.invoke({"messages": state["messages"]})
+        with usage_labels(node="engineer_agent", role="engineer", round=state["discussion_round"] + 1):
+            window, memory_updates = await self.memory_policy.build_window(state, llm)
+            response = await astream_message(
+                chain, {"messages": window},
+                self._delta_emitter("engineer", state["discussion_round"] + 1, config)
+            )
         
         # 更新狀態
         new_messages = state["messages"] + [response]
         engineering_insights = state["engineering_insights"] + [response.content]
         
+        usage = turn_usage(state["discussion_round"] + 1, "engineer", window, response)
+        
         # 發送思考完成狀態
         self._emit_status("thinking_completed", "engineer", {
             "round": state["discussion_round"] + 1,
             "response": response.content,
             "insight_count": len(engineering_insights),
+            "token_usage": usage,
             "agent_name": "系統工程師"
-        })
+        }, config)
         
         return {
             **state,
+            **memory_updates,
             "messages": new_messages,
             "engineering_insights": engineering_insights,
-            "discussion_round": state["discussion_round"] + 1
+            "discussion_round": state["discussion_round"] + 1,
+            "token_usage": state.get("token_usage", []) + [usage],
+            "last_speaker": "engineer"
         }
     
-    def collector_node(self, state: ReflectionState) -> ReflectionState:
+    async def collector_node(self, state: ReflectionState, config: RunnableConfig) -> ReflectionState:
         """收集者 Agent - 統整各方需求"""
         self._emit_status("collecting_started", "collector", {
             "message": "正在統整討論結果並生成需求分析...",
             "agent_name": "需求收集器"
-        })
-        
-        collector_prompt = ChatPromptTemplate.from_messages([
-            ("system", """你是一位專案協調者，負責統整醫療專家和工程師的討論結果。
-            請分析整個對話過程，提取關鍵洞察，並識別出具體的需求項目。
-            
-            任務：
-            1. 從討論中識別出不同的需求項目（可能有多個）
-            2. 為每個需求項目提供：
-               - need: 需求的名稱或標題
-               - summary: 該需求的簡要總結
-               - medical_insights: 醫療專家對此需求的洞察和建議
-               - tech_insights: 工程師對此需求的技術解決方案
-               - strategy: 針對此需求的綜合實施策略
-            3. 每個需求都應該是獨立且具體的
-            4. 輸出格式必須是一個包含需求項目的列表
-            
-            {format_instructions}
-            """),
-            ("human", f"""
-            醫療專家洞察：
-            {chr(10).join(state['medical_insights'])}
-            
-            工程師洞察：
-            {chr(10).join(state['engineering_insights'])}
-            
-            完整對話記錄：
-            {chr(10).join([msg.content if hasattr(msg, 'content') else str(msg) for msg in state['messages'] if isinstance(msg, (AIMessage, HumanMessage))])}
-            
-            請分析並識別出具體的需求項目，以列表格式輸出。
-            """)
-        ])
-        
-        # 格式化 prompt 包含 parser 指示
-        formatted_prompt = collector_prompt.partial(
-            format_instructions=self.parser.get_format_instructions()
-        )
+        }, config)
         
-        chain = formatted_prompt | llm | self.parser
+        chain = COLLECTOR_PROMPT | llm.bind(response_format=NEEDS_RESPONSE_FORMAT)
         
         try:
-            response = chain.invoke({})
-            
-            # 將解析後的結果轉換為字符串以便存儲
-            parsed_output = response.model_dump()
+            with usage_labels(node="collector", role="collector", round=state["discussion_round"]):
+                message = await astream_message(
+                    chain, collector_inputs(state), self._delta_emitter("collector", state["discussion_round"], config)
+                )
+            needs_output = NeedsOutput.model_validate_json(message.content)
             
             self._emit_status("collecting_completed", "collector", {
-                "needs_count": len(parsed_output.get("needs", [])),
+                "needs_count": len(needs_output.needs),
                 "message": "需求分析完成",
                 "agent_name": "需求收集器"
-            })
+            }, config)
             
         except Exception as e:
             print(f"解析錯誤: {e}")
             # 如果解析失敗，提供默認結構
-            parsed_output = {
-                "needs": [
-                    {
-                        "need": "解析失敗的需求",
-                        "summary": "解析失敗，請檢查輸出格式",
-                        "medical_insights": "無法解析醫療洞察",
-                        "tech_insights": "無法解析技術洞察",
-                        "strategy": "無法解析策略"
-                    }
-                ]
-            }
+            needs_output = fallback_needs_output()
             
             self._emit_status("collecting_error", "collector", {
                 "error": str(e),
                 "message": "需求分析解析失敗",
                 "agent_name": "需求收集器"
-            })
+            }, config)
         
+        # 狀態中保留型別化的結果；JSON 只在此序列化一次（pydantic-core 編碼器）
+        final_summary = needs_output.model_dump_json()
         return {
             **state,
-            "messages": state["messages"] + [AIMessage(content=str(parsed_output))],
-            "final_summary": str(parsed_output)
+            "messages": state["messages"] + [AIMessage(content=final_summary)],
+            "final_summary": final_summary,
+            "needs_output": needs_output
         }
 
-    def _should_continue_discussion(self, state: ReflectionState) -> str:
+    async def _should_continue_discussion(self, state: ReflectionState, config: RunnableConfig) -> str:
         """決定是否繼續討論"""
         current_round = state.get("discussion_round", 0)
         max_rounds = state.get("max_rounds", self.max_rounds)
@@ -308,82 +298,47 @@ class MedicalReflectionSystemWithRealtime:
         last_message = state["messages"][-1] if state["messages"] else None
         
         if last_message and isinstance(last_message, AIMessage):
-            # 根據最後一條訊息的來源決定下一個 agent
-            judge_prompt = ChatPromptTemplate.from_messages([
-                ("system", """你是一個討論主題判斷器。請分析最近的對話內容，判斷討論的重點是偏向醫療專業領域還是技術工程領域。
-
-                判斷標準：
-                - 如果討論重點是醫療流程、臨床經驗、病患照護、醫療政策等，回答 "medical"
-                - 如果討論重點是技術解決方案、系統架構、軟體開發、數據分析等，回答 "engineering"
-                
-                請只回答 "medical" 或 "engineering"，不要添加其他文字。"""),
-                ("human", f"最近的對話內容：\n{last_message.content if hasattr(last_message, 'content') else str(last_message)}")
-            ])
-            
-            chain = judge_prompt | llm
-            try:
-                judgment_response = chain.invoke({})
-                judgment = judgment_response.content.strip().lower()
-                
-                # 根據判斷結果決定下一個 agent
-                if "medical" in judgment:
-                    return "engineer_agent"  # 如果當前是醫療主題，下一個應該是工程師
-                elif "engineering" in judgment:
-                    return "medical"  # 如果當前是工程主題，下一個應該是醫療專家
-                else:
-                    # 如果判斷不明確，預設交替進行
-                    return "engineer_agent" if current_round % 2 == 0 else "medical"
-            except Exception as e:
-                print(f"判斷錯誤: {e}")
-                # 如果 LLM 判斷失敗，回到簡單的交替邏輯
-                return "engineer_agent" if current_round % 2 == 0 else "medical"
+            # 交由路由策略決定下一個 agent，並記錄到事件流
+            with usage_labels(node="router", role="router", round=current_round):
+                decision = await self.router.route(state, llm)
+            self._emit_status("routing_decision", "router", {
+                "round": current_round,
+                **decision
+            }, config)
+            return decision["next"]
         else:
             # 如果是人類訊息，預設從醫療專家開始
             return "medical"
     
-    async def run_reflection_stream(self, user_query: str, thread_id: str = "default") -> dict:
-        """執行完整的 reflection 流程，提供實時狀態更新"""
-        initial_state = {
+    def make_config(self, thread_id: str, status_callback: Optional[StatusCallback] = None) -> RunnableConfig:
+        """建立單次執行的 config：每個 session 使用獨立 thread_id，回調隨 config 傳入"""
+        return {"configurable": {"thread_id": thread_id, "status_callback": status_callback}}
+    
+    def discard_thread(self, thread_id: str):
+        """會話完成後丟棄該 thread 的檢查點歷史，避免共用的 checkpointer 無限增長"""
+        checkpointer = self.graph.checkpointer
+        if checkpointer is not None:
+            checkpointer.delete_thread(thread_id)
+    
+    def _initial_state(self, user_query: str, max_rounds: int) -> ReflectionState:
+        return {
             "messages": [HumanMessage(content=user_query)],
             "medical_insights": [],
             "engineering_insights": [],
             "discussion_round": 0,
-            "max_rounds": self.max_rounds,
-            "final_summary": ""
+            "max_rounds": max_rounds,
+            "final_summary": "",
+            "needs_output": None,
+            "conversation_summary": "",
+            "summarized_until": 1,
+            "token_usage": [],
+            "last_speaker": ""
         }
-        
-        config = {"configurable": {"thread_id": thread_id}}
-        
-        # 發送開始狀態
-        self._emit_status("reflection_started", "system", {
-            "message": "開始醫療需求反思分析",
-            "query": user_query,
-            "max_rounds": self.max_rounds
-        })
-        
-        # 執行工作流程並監控每個步驟
-        result = None
-        async for event in self.graph.astream(initial_state, config):
-            for node_name, node_output in event.items():
-                self._emit_status("node_completed", node_name, {
-                    "node": node_name,
-                    "round": node_output.get("discussion_round", 0),
-                    "message": f"{node_name} 節點完成"
-                })
-        
-        # 獲取最終結果
-        final_state = self.get_current_state(thread_id)
-        if final_state and final_state.values:
-            result = final_state.values
-        else:
-            result = initial_state
-        
-        # 嘗試解析最終結果
-        try:
-            import ast
-            parsed_needs = ast.literal_eval(result["final_summary"])
-        except:
-            parsed_needs = {"needs": []}
+    
+    def _build_result(self, user_query: str, result: ReflectionState, config: RunnableConfig) -> dict:
+        """整理最終結果並發送完成狀態"""
+        needs_output = result.get("needs_output")
+        parsed_needs = needs_output.model_dump() if needs_output else {"needs": []}
         
         final_result = {
             "original_query": user_query,
@@ -392,7 +347,9 @@ class MedicalReflectionSystemWithRealtime:
             "engineering_insights": result["engineering_insights"],
             "parsed_needs": parsed_needs,
             "final_summary": result["final_summary"],
-            "full_conversation": [msg.content if hasattr(msg, 'content') else str(msg) for msg in result["messages"]]
+            "full_conversation": [msg.content if hasattr(msg, 'content') else str(msg) for msg in result["messages"]],
+            "token_usage": result.get("token_usage", []),
+            "usage": get_usage_tracker().session_summary(config["configurable"]["thread_id"])
         }
         
         # 發送完成狀態
@@ -400,65 +357,105 @@ class MedicalReflectionSystemWithRealtime:
             "message": "醫療需求反思分析完成",
             "needs_count": len(parsed_needs.get("needs", [])),
             "discussion_rounds": result["discussion_round"]
-        })
+        }, config)
         
         return final_result
     
-    def run_reflection_sync_stream(self, user_query: str, thread_id: str = "default") -> dict:
+    async def run_reflection_stream(self, user_query: str, thread_id: Optional[str] = None, max_rounds: Optional[int] = None, status_callback: Optional[StatusCallback] = None, resume: bool = False) -> dict:
+        """執行完整的 reflection 流程，提供實時狀態更新；resume=True 時從該 thread 最後完成的節點接續"""
+        max_rounds = max_rounds or self.max_rounds
+        initial_state = self._initial_state(user_query, max_rounds)
+        
+        thread_id = thread_id or str(uuid.uuid4())
+        config = self.make_config(thread_id, status_callback)
+        
+        graph_input = await resume_or_start(self.graph, initial_state, config, resume)
+        if graph_input is None:
+            snapshot = await self.graph.aget_state(config)
+            self._emit_status("reflection_resumed", "system", {
+                "message": "從上次完成的節點接續醫療需求反思分析",
+                "query": user_query,
+                "max_rounds": max_rounds,
+                "round": snapshot.values.get("discussion_round", 0),
+                "next": list(snapshot.next)
+            }, config)
+        else:
+            # 發送開始狀態
+            self._emit_status("reflection_started", "system", {
+                "message": "開始醫療需求反思分析",
+                "query": user_query,
+                "max_rounds": max_rounds
+            }, config)
+        
+        # 完成或失敗後丟棄檢查點，被取消（worker 關閉）時保留以便重啟後接續
+        try:
+            # 執行工作流程並監控每個步驟
+            with usage_labels(session=thread_id):
+                async for event in self.graph.astream(graph_input, config):
+                    for node_name, node_output in event.items():
+                        self._emit_status("node_completed", node_name, {
+                            "node": node_name,
+                            "round": node_output.get("discussion_round", 0),
+                            "message": f"{node_name} 節點完成"
+                        }, config)
+            
+            # 獲取最終結果
+            final_state = self.get_current_state(thread_id)
+            if final_state and final_state.values:
+                result = final_state.values
+            else:
+                result = initial_state
+        except Exception:
+            self.discard_thread(thread_id)
+            raise
+        self.discard_thread(thread_id)
+        
+        return self._build_result(user_query, result, config)
+    
+    def run_reflection_sync_stream(self, user_query: str, thread_id: Optional[str] = None, max_rounds: Optional[int] = None, status_callback: Optional[StatusCallback] = None) -> dict:
         """同步版本的 reflection 執行，帶有狀態更新"""
-        initial_state = {
-            "messages": [HumanMessage(content=user_query)],
-            "medical_insights": [],
-            "engineering_insights": [],
-            "discussion_round": 0,
-            "max_rounds": self.max_rounds,
-            "final_summary": ""
-        }
+        max_rounds = max_rounds or self.max_rounds
+        initial_state = self._initial_state(user_query, max_rounds)
         
-        config = {"configurable": {"thread_id": thread_id}}
+        thread_id = thread_id or str(uuid.uuid4())
+        config = self.make_config(thread_id, status_callback)
         
         # 發送開始狀態
         self._emit_status("reflection_started", "system", {
             "message": "開始醫療需求反思分析",
             "query": user_query,
-            "max_rounds": self.max_rounds
-        })
-        
-        # 同步執行
-        result = self.graph.invoke(initial_state, config)
+            "max_rounds": max_rounds
+        }, config)
         
-        # 嘗試解析最終結果
+        # 同步執行（節點皆為 async，透過 asyncio.run 驅動）
         try:
-            import ast
-            parsed_needs = ast.literal_eval(result["final_summary"])
-        except:
-            parsed_needs = {"needs": []}
+            with usage_labels(session=thread_id):
+                result = asyncio.run(self.graph.ainvoke(initial_state, config))
+        finally:
+            self.discard_thread(thread_id)
         
-        final_result = {
-            "original_query": user_query,
-            "discussion_rounds": result["discussion_round"],
-            "medical_insights": result["medical_insights"],
-            "engineering_insights": result["engineering_insights"],
-            "parsed_needs": parsed_needs,
-            "final_summary": result["final_summary"],
-            "full_conversation": [msg.content if hasattr(msg, 'content') else str(msg) for msg in result["messages"]]
-        }
-        
-        # 發送完成狀態
-        self._emit_status("reflection_completed", "system", {
-            "message": "醫療需求反思分析完成",
-            "needs_count": len(parsed_needs.get("needs", [])),
-            "discussion_rounds": result["discussion_round"]
-        })
-        
-        return final_result
+        return self._build_result(user_query, result, config)
+
+# 整個 process 共用一個已編譯的 graph；max_rounds、thread_id 與回調皆在每次執行時傳入
+_shared_system: Optional[MedicalReflectionSystemWithRealtime] = None
+
+def get_reflection_system_realtime() -> MedicalReflectionSystemWithRealtime:
+    """取得 process 共用的 MedicalReflectionSystemWithRealtime"""
+    global _shared_system
+    if _shared_system is None:
+        _shared_system = MedicalReflectionSystemWithRealtime()
+    return _shared_system
+
+# 非同步執行函數（供 FastAPI 的 event loop 直接 await）
+async def run_reflection_async_realtime(user_query: str, max_rounds: int = 3, status_callback: Optional[StatusCallback] = None, thread_id: Optional[str] = None, resume: bool = False) -> dict:
+    """帶實時狀態更新的非同步版本 reflection 執行"""
+    return await get_reflection_system_realtime().run_reflection_stream(
+        user_query, thread_id=thread_id, max_rounds=max_rounds, status_callback=status_callback, resume=resume
+    )
 
 # 簡化的同步執行函數，維持兼容性
 def run_reflection_sync_realtime(user_query: str, max_rounds: int = 3, status_callback: Optional[StatusCallback] = None) -> dict:
     """帶實時狀態更新的同步版本 reflection 執行"""
-    reflection_system = MedicalReflectionSystemWithRealtime(
-        max_discussion_rounds=max_rounds,
-        status_callback=status_callback
+    return get_reflection_system_realtime().run_reflection_sync_stream(
+        user_query, max_rounds=max_rounds, status_callback=status_callback
     )
-    
-    return reflection_system.run_reflection_sync_stream(user_query)
@@ -0,0 +1,172 @@
+"""
+討論路由策略
+
+每一輪 agent 發言後，需要決定下一位發言者。原本的做法是額外呼叫一次 LLM
+判斷主題偏向醫療或工程，等於每輪多一次串行的網路往返。這裡提供三種策略：
+
+- alternate: 醫療專家與工程師嚴格輪流
+- local:     以兩位 agent system prompt 中的領域詞彙做本地詞彙分類（零延遲，預設）
+- llm:       原本的 LLM 主題判斷器
+
+路由規則與原本相同：主題偏醫療時交給工程師回應，偏工程時交給醫療專家。
+"""
+
+import re
+from os import getenv
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+
+MEDICAL_NEXT = "medical"
+ENGINEER_NEXT = "engineer_agent"
+
+# 取自醫療專家 system prompt 與主題判斷標準中的醫療領域詞彙
+MEDICAL_VOCABULARY = (
+    "醫療", "醫療流程", "臨床", "病患", "病人", "患者", "照護", "護理", "醫師", "醫生", "護理師",
+    "人力配置", "設備管理", "資源配置", "急診", "病床", "門診", "住院", "手術", "診斷", "治療",
+    "用藥", "醫療政策", "醫療品質", "病歷", "檢查", "轉診", "醫護",
+    "clinical", "patient", "nurse", "physician", "care", "treatment", "diagnosis", "hospital", "medical",
+)
+
+# 取自工程師 system prompt 與主題判斷標準中的技術領域詞彙
+ENGINEERING_VOCABULARY = (
+    "系統", "系統架構", "技術", "工程", "資訊系統", "數據", "資料", "數據分析", "演算法", "算法",
+    "自動化", "軟體", "硬體", "平台", "介面", "整合", "雲端", "感測器", "物聯網", "模型",
+    "資料庫", "部署", "架構", "串接", "開發", "AI", "人工智慧", "機器學習", "API",
+    "system", "architecture", "software", "data", "algorithm", "automation", "platform", "integration",
+    "sensor", "iot", "model", "database", "api", "cloud",
+)
+
+
+class DiscussionRouter:
+    """嚴格輪流：上一位是醫療專家就換工程師，反之亦然"""
+
+    name = "alternate"
+
+    async def route(self, state: Dict[str, Any], llm) -> Dict[str, Any]:
+        """
+        決定下一位發言者
+
+        Returns:
+            路由決策，包含 next（下一個節點）、topic 與判斷依據
+        """
+        return {"mode": self.name, "topic": None, "next": _alternate(state)}
+
+
+class LexicalRouter(DiscussionRouter):
+    """
+    本地詞彙分類器：計算最後一則訊息中兩個領域詞彙的出現次數
+
+    詞彙小寫後去重；所有詞彙合成一個 regex，同一位置優先匹配最長的詞且匹配不重疊，
+    因此「醫療流程」只算一次，不會再加上其中的「醫療」。英文詞彙需位於單字邊界
+    （允許複數 s），避免 "ai" 命中 explain、"care" 命中 healthcare。
+    """
+
+    name = "local"
+
+    def __init__(self, medical_vocabulary=MEDICAL_VOCABULARY, engineering_vocabulary=ENGINEERING_VOCABULARY):
+        self.medical_vocabulary = _unique_lower(medical_vocabulary)
+        self.engineering_vocabulary = _unique_lower(engineering_vocabulary)
+        self._domains: Dict[str, Tuple[str, ...]] = {}
+        for domain, vocabulary in (("medical", self.medical_vocabulary), ("engineering", self.engineering_vocabulary)):
+            for term in vocabulary:
+                self._domains[term] = self._domains.get(term, ()) + (domain,)
+        self._pattern = _vocabulary_pattern(self._domains)
+
+    def classify(self, text: str) -> Tuple[Optional[str], Dict[str, int]]:
+        scores = {"medical": 0, "engineering": 0}
+        for match in self._pattern.finditer(text.lower()):
+            for domain in self._domains[match.group("latin") or match.group("cjk")]:
+                scores[domain] += 1
+        if scores["medical"] == scores["engineering"]:
+            return None, scores
+        return ("medical" if scores["medical"] > scores["engineering"] else "engineering"), scores
+
+    async def route(self, state: Dict[str, Any], llm) -> Dict[str, Any]:
+        topic, scores = self.classify(str(state["messages"][-1].content))
+        if topic is None:
+            # 無法判斷時退回輪流
+            next_node = _alternate(state)
+        else:
+            next_node = ENGINEER_NEXT if topic == "medical" else MEDICAL_NEXT
+        return {"mode": self.name, "topic": topic, "next": next_node, "scores": scores}
+
+
+class LLMJudgeRouter(DiscussionRouter):
+    """原本的 LLM 主題判斷器"""
+
+    name = "llm"
+
+    def __init__(self):
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", """你是一個討論主題判斷器。請分析最近的對話內容，判斷討論的重點是偏向醫療專業領域還是技術工程領域。
+
+            判斷標準：
+            - 如果討論重點是醫療流程、臨床經驗、病患照護、醫療政策等，回答 "medical"
+            - 如果討論重點是技術解決方案、系統架構、軟體開發、數據分析等，回答 "engineering"
+
+            請只回答 "medical" 或 "engineering"，不要添加其他文字。"""),
+            ("human", "最近的對話內容：\n{content}")
+        ])
+
+    async def route(self, state: Dict[str, Any], llm) -> Dict[str, Any]:
+        current_round = state.get("discussion_round", 0)
+        try:
+            judgment = (await (self.prompt | llm).ainvoke({
+                "content": str(state["messages"][-1].content)
+            })).content.strip().lower()
+        except Exception as e:
+            print(f"判斷錯誤: {e}")
+            # 如果 LLM 判斷失敗，回到簡單的交替邏輯
+            return {"mode": self.name, "topic": None, "next": _parity(current_round), "error": str(e)}
+
+        # 根據判斷結果決定下一個 agent
+        if "medical" in judgment:
+            topic, next_node = "medical", ENGINEER_NEXT  # 如果當前是醫療主題，下一個應該是工程師
+        elif "engineering" in judgment:
+            topic, next_node = "engineering", MEDICAL_NEXT  # 如果當前是工程主題，下一個應該是醫療專家
+        else:
+            # 如果判斷不明確，預設交替進行
+            topic, next_node = None, _parity(current_round)
+        return {"mode": self.name, "topic": topic, "next": next_node, "judgment": judgment}
+
+
+def _unique_lower(vocabulary: Iterable[str]) -> Tuple[str, ...]:
+    return tuple(dict.fromkeys(term.lower() for term in vocabulary))
+
+
+def _vocabulary_pattern(terms: Iterable[str]) -> "re.Pattern[str]":
+    """長詞優先的交替式；英文詞以 ASCII 英數判斷邊界（\\b 會把中文字視為單字字元，「導入ai系統」便無法命中）"""
+    ordered = sorted(terms, key=len, reverse=True)
+    latin = "|".join(re.escape(term) for term in ordered if term.isascii())
+    cjk = "|".join(re.escape(term) for term in ordered if not term.isascii())
+    return re.compile(rf"(?<![a-z0-9])(?P<latin>{latin})s?(?![a-z0-9])|(?P<cjk>{cjk})")
+
+
+def _alternate(state: Dict[str, Any]) -> str:
+    last_speaker = state.get("last_speaker")
+    if last_speaker == "medical_expert":
+        return ENGINEER_NEXT
+    if last_speaker == "engineer":
+        return MEDICAL_NEXT
+    return ENGINEER_NEXT if isinstance(state["messages"][-1], AIMessage) else MEDICAL_NEXT
+
+
+def _parity(current_round: int) -> str:
+    return ENGINEER_NEXT if current_round % 2 == 0 else MEDICAL_NEXT
+
+
+def create_router(mode: Optional[str] = None) -> DiscussionRouter:
+    """
+    依名稱建立路由策略；未指定時讀取環境變數 REFLECTION_ROUTER（alternate | local | llm，預設 local）
+    """
+    mode = mode or getenv("REFLECTION_ROUTER", "local")
+    if mode == "alternate":
+        return DiscussionRouter()
+    if mode == "local":
+        return LexicalRouter()
+    if mode == "llm":
+        return LLMJudgeRouter()
+    raise ValueError(f"未知的路由策略: {mode}")
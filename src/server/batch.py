@@ -0,0 +1,165 @@
+"""
+Registry of batch reflection submissions.
+
+A batch groups the sessions submitted together through POST /api/reflection/batch.
+Every batch also owns an event-bus channel keyed by its batch id: member sessions
+republish their events there, tagged with their session_id, so a single SSE
+stream can follow the whole batch and resume with Last-Event-ID like any session.
+
+`SharedBatchRegistry` keeps the same records in the sessions SQLite file so that
+any worker process can report a batch's progress.
+"""
+
+import os
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from src.server.session_store import dumps_session, loads_session
+
+
+class BatchRegistry:
+    """Bounded map of batch id -> member sessions and completion state"""
+
+    def __init__(self, max_batches: int = 1000, on_evict: Optional[Callable[[str], None]] = None):
+        self.max_batches = max_batches
+        self.on_evict = on_evict
+        self._batches: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, session_ids: List[str]) -> Dict[str, Any]:
+        batch = {
+            "batch_id": str(uuid.uuid4()),
+            "session_ids": list(session_ids),
+            "pending": set(session_ids),
+            "created_at": datetime.now(),
+            "completed_at": None,
+        }
+        with self._lock:
+            self._batches[batch["batch_id"]] = batch
+            evicted = self._evict()
+        for batch_id in evicted:
+            if self.on_evict:
+                self.on_evict(batch_id)
+        return batch
+
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def session_finished(self, batch_id: str, session_id: str) -> bool:
+        """Record that a member session finished; returns True when it was the last one"""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None or session_id not in batch["pending"]:
+                return False
+            batch["pending"].discard(session_id)
+            if batch["pending"]:
+                return False
+            batch["completed_at"] = datetime.now()
+            return True
+
+    def __len__(self) -> int:
+        return len(self._batches)
+
+    def _evict(self) -> List[str]:
+        # Only finished batches are dropped; running ones stay until they complete
+        evicted = []
+        for batch_id in list(self._batches):
+            if len(self._batches) <= self.max_batches:
+                break
+            if not self._batches[batch_id]["pending"]:
+                del self._batches[batch_id]
+                evicted.append(batch_id)
+        return evicted
+
+
+class SharedBatchRegistry(BatchRegistry):
+    """Batch registry stored in a SQLite file shared by several worker processes"""
+
+    def __init__(self, path: str, max_batches: int = 1000, on_evict: Optional[Callable[[str], None]] = None):
+        super().__init__(max_batches=max_batches, on_evict=on_evict)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS batches (
+                batch_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                completed INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def create(self, session_ids: List[str]) -> Dict[str, Any]:
+        batch = {
+            "batch_id": str(uuid.uuid4()),
+            "session_ids": list(session_ids),
+            "pending": set(session_ids),
+            "created_at": datetime.now(),
+            "completed_at": None,
+        }
+        with self._lock:
+            self._conn.execute("INSERT INTO batches (batch_id, data, completed, created_at) VALUES (?, ?, 0, ?)",
+                               (batch["batch_id"], self._dumps(batch), batch["created_at"].timestamp()))
+            self._conn.commit()
+            evicted = self._evict()
+        for batch_id in evicted:
+            if self.on_evict:
+                self.on_evict(batch_id)
+        return batch
+
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        return self._loads(row[0]) if row else None
+
+    def session_finished(self, batch_id: str, session_id: str) -> bool:
+        with self._lock:
+            # Read-modify-write under a write lock so members finishing in other processes are not lost
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+                batch = self._loads(row[0]) if row else None
+                if batch is None or session_id not in batch["pending"]:
+                    return False
+                batch["pending"].discard(session_id)
+                if not batch["pending"]:
+                    batch["completed_at"] = datetime.now()
+                self._conn.execute("UPDATE batches SET data = ?, completed = ? WHERE batch_id = ?",
+                                   (self._dumps(batch), int(not batch["pending"]), batch_id))
+                return not batch["pending"]
+            finally:
+                self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
+
+    def _evict(self) -> List[str]:
+        count = self._conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
+        if count <= self.max_batches:
+            return []
+        evicted = [batch_id for batch_id, in self._conn.execute(
+            "SELECT batch_id FROM batches WHERE completed = 1 ORDER BY created_at LIMIT ?",
+            (count - self.max_batches,),
+        )]
+        self._conn.executemany("DELETE FROM batches WHERE batch_id = ?", [(batch_id,) for batch_id in evicted])
+        self._conn.commit()
+        return evicted
+
+    @staticmethod
+    def _dumps(batch: Dict[str, Any]) -> str:
+        return dumps_session({**batch, "pending": sorted(batch["pending"])})
+
+    @staticmethod
+    def _loads(payload: str) -> Dict[str, Any]:
+        batch = loads_session(payload)
+        batch["pending"] = set(batch["pending"])
+        return batch
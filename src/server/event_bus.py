@@ -0,0 +1,344 @@
+"""
+Push-based event bus for reflection session streams.
+
+Status callbacks publish events into the bus, which appends them to the
+session's event log and fans them out to one asyncio.Queue per open SSE
+subscriber. Subscribers wait on their queue, so an idle stream costs nothing
+and every event reaches the client as soon as it is emitted.
+
+`SharedEventBus` keeps the log in a SQLite file instead, so several uvicorn
+workers can serve the same session's stream.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import sqlite3
+import threading
+import uuid
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+
+# Sentinel pushed to subscriber queues when a session stops producing events
+SESSION_CLOSED = object()
+
+
+class Subscription:
+    """A single SSE subscriber attached to one session"""
+
+    def __init__(self, bus: "EventBus", session_id: str):
+        self.bus = bus
+        self.session_id = session_id
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.loop = asyncio.get_running_loop()
+
+    async def get(self, timeout: Optional[float] = None):
+        """Wait for the next event; raises asyncio.TimeoutError after `timeout` seconds"""
+        if timeout is None:
+            return await self.queue.get()
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """Per-session event log with fan-out to live subscribers"""
+
+    def __init__(self, event_log: Optional[Dict[str, List[Dict[str, Any]]]] = None):
+        # session_id -> ordered list of events; an event's "id" is its index
+        self.event_log: Dict[str, List[Dict[str, Any]]] = event_log if event_log is not None else {}
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._closed: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def open(self, session_id: str):
+        """Start a session's event log, or reopen it when a session is resumed so event ids keep increasing"""
+        with self._lock:
+            self.event_log.setdefault(session_id, [])
+            self._closed.discard(session_id)
+
+    def publish(self, session_id: str, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Append an event to the session log and push it to every subscriber.
+
+        Safe to call from the event loop or from a worker thread.
+        """
+        with self._lock:
+            events = self.event_log.setdefault(session_id, [])
+            event = {"id": len(events), **event}
+            events.append(event)
+            subscribers = list(self._subscribers.get(session_id, ()))
+        for subscription in subscribers:
+            self._deliver(subscription, event)
+        return event
+
+    def close(self, session_id: str):
+        """Mark a session as finished and wake all of its subscribers"""
+        with self._lock:
+            self._closed.add(session_id)
+            subscribers = list(self._subscribers.get(session_id, ()))
+        for subscription in subscribers:
+            self._deliver(subscription, SESSION_CLOSED)
+
+    def is_closed(self, session_id: str) -> bool:
+        """True once a session is finished, or if its log was never opened or has been forgotten"""
+        return session_id in self._closed or session_id not in self.event_log
+
+    def forget(self, session_id: str):
+        """Drop the event log and closed marker for a session"""
+        with self._lock:
+            self.event_log.pop(session_id, None)
+            self._closed.discard(session_id)
+
+    def subscribe(self, session_id: str) -> Subscription:
+        """Attach a new subscriber; must be called from within the event loop"""
+        subscription = Subscription(self, session_id)
+        with self._lock:
+            self._subscribers.setdefault(session_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.session_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.session_id]
+
+    def events_after(self, session_id: str, last_event_id: int) -> List[Dict[str, Any]]:
+        """Return logged events with an id greater than `last_event_id`"""
+        with self._lock:
+            return list(self.event_log.get(session_id, [])[last_event_id + 1:])
+
+    def subscriber_count(self, session_id: Optional[str] = None) -> int:
+        with self._lock:
+            if session_id is not None:
+                return len(self._subscribers.get(session_id, ()))
+            return sum(len(subs) for subs in self._subscribers.values())
+
+    def flush(self):
+        """Block until every published event is in the log; the in-memory log is always up to date"""
+
+    @staticmethod
+    def _deliver(subscription: Subscription, item: Any):
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is subscription.loop:
+            subscription.queue.put_nowait(item)
+            return
+        try:
+            subscription.loop.call_soon_threadsafe(subscription.queue.put_nowait, item)
+        except RuntimeError:
+            # The subscriber's loop has already shut down
+            pass
+
+
+class SharedEventBus(EventBus):
+    """
+    Event bus shared by several worker processes through one SQLite file (WAL mode)
+
+    publish/close/forget only enqueue the change: a writer thread with its own
+    connection drains the queue, appends everything pending to the `events`
+    table in one transaction and then hands the events to the subscribers of
+    this process, so a burst of token deltas costs one commit and never blocks
+    the event loop on disk I/O. Event ids are allocated per session inside
+    that transaction, so they stay dense across processes. Each process also
+    runs one tailer task while it has subscribers: it polls for rows appended
+    by other processes and fans them out to its local queues, so the polling
+    cost scales with the number of workers, not of SSE clients.
+    """
+
+    # Upper bound on queued changes written in one transaction
+    WRITE_BATCH_SIZE = 256
+
+    def __init__(self, path: str, poll_interval: float = 0.05):
+        super().__init__()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.poll_interval = poll_interval
+        # Rows this process appended are skipped by its own tailer
+        self.origin = uuid.uuid4().hex
+        self._db_lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS streams (
+                session_id TEXT PRIMARY KEY,
+                next_id INTEGER NOT NULL,
+                closed INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                event_id INTEGER,
+                origin TEXT NOT NULL,
+                data TEXT
+            );
+            CREATE INDEX IF NOT EXISTS events_session ON events (session_id, event_id);"""
+        )
+        self._conn.commit()
+        self._last_seq = 0
+        self._tailer: Optional[asyncio.Task] = None
+        # (operation, session_id, event) tuples waiting for the writer thread
+        self._writes: "queue.Queue[Tuple[str, str, Optional[Dict[str, Any]]]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="event-bus-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def open(self, session_id: str):
+        """Written synchronously so a stream subscribed right after submission sees the channel as open.
+
+        A resumed session keeps its log and id counter, so clients reconnecting
+        with Last-Event-ID continue where they left off.
+        """
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT INTO streams (session_id, next_id, closed) VALUES (?, 0, 0) "
+                "ON CONFLICT (session_id) DO UPDATE SET closed = 0",
+                (session_id,),
+            )
+            self._conn.commit()
+
+    def publish(self, session_id: str, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue an event for the writer thread; its "id" is filled in once the row is written"""
+        event = dict(event)
+        self._writes.put(("publish", session_id, event))
+        return event
+
+    def close(self, session_id: str):
+        # Queued behind the session's pending events, so subscribers get the marker last
+        self._writes.put(("close", session_id, None))
+
+    def forget(self, session_id: str):
+        self._writes.put(("forget", session_id, None))
+
+    def flush(self):
+        self._writes.join()
+
+    def is_closed(self, session_id: str) -> bool:
+        with self._db_lock:
+            row = self._conn.execute("SELECT closed FROM streams WHERE session_id = ?", (session_id,)).fetchone()
+        return row is None or bool(row[0])
+
+    def subscribe(self, session_id: str) -> Subscription:
+        subscription = super().subscribe(session_id)
+        if self._tailer is None or self._tailer.done():
+            # Rows appended before this point are covered by the caller's events_after replay
+            with self._db_lock:
+                self._last_seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM events").fetchone()[0]
+            self._tailer = asyncio.get_running_loop().create_task(self._tail())
+        return subscription
+
+    def events_after(self, session_id: str, last_event_id: int) -> List[Dict[str, Any]]:
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT data FROM events WHERE session_id = ? AND event_id > ? ORDER BY event_id",
+                (session_id, last_event_id),
+            ).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    async def _tail(self):
+        """Forward rows appended by other processes to local subscribers until none are left"""
+        while self.subscriber_count():
+            with self._db_lock:
+                rows = self._conn.execute(
+                    "SELECT seq, session_id, data FROM events WHERE seq > ? AND origin != ? ORDER BY seq",
+                    (self._last_seq, self.origin),
+                ).fetchall()
+            for seq, session_id, data in rows:
+                self._last_seq = seq
+                subscribers = self._local_subscribers(session_id)
+                if not subscribers:
+                    continue
+                item = SESSION_CLOSED if data is None else json.loads(data)
+                for subscription in subscribers:
+                    self._deliver(subscription, item)
+            await asyncio.sleep(self.poll_interval)
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._writes.get()]
+            while len(batch) < self.WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(conn, batch)
+            except Exception as e:
+                logger.error(f"Event bus write of {len(batch)} change(s) failed: {e}")
+            else:
+                for operation, session_id, event in batch:
+                    if operation == "forget":
+                        continue
+                    item = event if operation == "publish" else SESSION_CLOSED
+                    for subscription in self._local_subscribers(session_id):
+                        self._deliver(subscription, item)
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[Tuple[str, str, Optional[Dict[str, Any]]]]):
+        """Apply queued changes in one transaction; ids come from `streams.next_id` read under the write lock"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            next_ids: Dict[str, int] = {}
+            for operation, session_id, event in batch:
+                if operation == "publish":
+                    if session_id not in next_ids:
+                        row = conn.execute("SELECT next_id FROM streams WHERE session_id = ?",
+                                           (session_id,)).fetchone()
+                        next_ids[session_id] = row[0] if row else 0
+                    event["id"] = next_ids[session_id]
+                    next_ids[session_id] += 1
+                    conn.execute(
+                        "INSERT INTO events (session_id, event_id, origin, data) VALUES (?, ?, ?, ?)",
+                        (session_id, event["id"], self.origin, json.dumps(event, default=str)),
+                    )
+                elif operation == "close":
+                    self._store_next_ids(conn, next_ids)
+                    conn.execute("UPDATE streams SET closed = 1 WHERE session_id = ?", (session_id,))
+                    # A row without event_id tells other processes' subscribers that the stream ended
+                    conn.execute("INSERT INTO events (session_id, event_id, origin, data) VALUES (?, NULL, ?, NULL)",
+                                 (session_id, self.origin))
+                else:
+                    next_ids.pop(session_id, None)
+                    conn.execute("DELETE FROM events WHERE session_id = ?", (session_id,))
+                    conn.execute("DELETE FROM streams WHERE session_id = ?", (session_id,))
+            self._store_next_ids(conn, next_ids)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    @staticmethod
+    def _store_next_ids(conn: sqlite3.Connection, next_ids: Dict[str, int]):
+        conn.executemany(
+            "INSERT INTO streams (session_id, next_id, closed) VALUES (?, ?, 0) "
+            "ON CONFLICT (session_id) DO UPDATE SET next_id = excluded.next_id",
+            next_ids.items(),
+        )
+
+    def _local_subscribers(self, session_id: str) -> List[Subscription]:
+        with self._lock:
+            return list(self._subscribers.get(session_id, ()))
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Serialize an event as an SSE frame carrying its id for Last-Event-ID resume"""
+    frame = f"data: {json.dumps(event, default=str)}\n\n"
+    if "id" in event:
+        frame = f"id: {event['id']}\n" + frame
+    return frame
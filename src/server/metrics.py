@@ -0,0 +1,157 @@
+"""
+Prometheus text exposition for the reflection API.
+
+The only metric updated on a hot path is `EventCounter`, bumped from every
+status callback. It is a plain dict increment without a lock: status
+callbacks run on the event loop thread, and a lost increment from a rare
+cross-thread race is acceptable for monitoring. Everything else is read from
+the component that already tracks it when `/metrics` is scraped: queue depth
+from the scheduler, sessions per status from the session store, open SSE
+streams from the event bus, LLM latency histograms and token/cost counters
+from the usage tracker, cache hit ratio from the response cache and resident
+memory from /proc.
+"""
+
+import math
+import resource
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from llm_runtime.usage import LatencyHistogram, UsageTracker
+from src.server.event_bus import EventBus
+from src.server.scheduler import JobScheduler
+from src.server.session_store import ACTIVE_STATUSES, SessionStore
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Dict[str, Any]
+
+
+class EventCounter:
+    """Status events emitted per (event_type, agent); cheap enough for every status callback"""
+
+    def __init__(self):
+        self._counts: Dict[Tuple[str, str], int] = {}
+
+    def inc(self, event_type: str, agent: str):
+        key = (event_type, agent)
+        self._counts[key] = self._counts.get(key, 0) + 1
+
+    def snapshot(self) -> Dict[Tuple[str, str], int]:
+        return dict(self._counts)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Exposition:
+    """Builds a scrape body one metric family at a time"""
+
+    def __init__(self):
+        self._lines: List[str] = []
+
+    def add(self, name: str, kind: str, help_text: str, samples: Iterable[Tuple[Labels, float]]):
+        self._lines.append(f"# HELP {name} {help_text}")
+        self._lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            self._sample(name, labels, value)
+
+    def add_histogram(self, name: str, help_text: str, series: Iterable[Tuple[Labels, LatencyHistogram]],
+                      scale: float = 1.0):
+        """`scale` converts the histogram's unit (e.g. 0.001 for milliseconds to seconds)"""
+        self._lines.append(f"# HELP {name} {help_text}")
+        self._lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in series:
+            cumulative = 0
+            for bound, count in zip((*histogram.bounds, math.inf), histogram.counts):
+                cumulative += count
+                self._sample(f"{name}_bucket", {**labels, "le": _format_value(bound * scale)}, cumulative)
+            self._sample(f"{name}_sum", labels, histogram.sum_ms * scale)
+            self._sample(f"{name}_count", labels, histogram.count)
+
+    def render(self) -> str:
+        return "\n".join(self._lines) + "\n"
+
+    def _sample(self, name: str, labels: Labels, value: float):
+        if labels:
+            rendered = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+            self._lines.append(f"{name}{{{rendered}}} {_format_value(value)}")
+        else:
+            self._lines.append(f"{name} {_format_value(value)}")
+
+
+def resident_memory_bytes() -> int:
+    """Current RSS from /proc; elsewhere the peak RSS reported by getrusage"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def render_metrics(scheduler: JobScheduler, sessions: SessionStore, event_bus: EventBus, events: EventCounter,
+                   usage: UsageTracker, cache_stats: Optional[Dict[str, Any]] = None) -> str:
+    """Collect every metric family into one text exposition body"""
+    out = Exposition()
+
+    jobs = scheduler.stats()
+    out.add("reflection_jobs_queued", "gauge", "Reflection jobs waiting for a slot, per priority lane",
+            (({"priority": priority}, depth) for priority, depth in jobs["queued"].items()))
+    out.add("reflection_jobs_running", "gauge", "Reflection jobs running on this worker", [({}, jobs["running"])])
+    out.add("reflection_jobs_max_concurrent", "gauge", "Reflection job slots on this worker",
+            [({}, jobs["max_concurrent"])])
+    for outcome in ("started", "finished", "cancelled"):
+        out.add(f"reflection_jobs_{outcome}_total", "counter", f"Reflection jobs {outcome} on this worker",
+                [({}, jobs[outcome])])
+
+    by_status = sessions.status_counts()
+    out.add("reflection_sessions", "gauge", "Stored sessions per status",
+            (({"status": status}, count) for status, count in sorted(by_status.items())))
+    out.add("reflection_sessions_active", "gauge", "Sessions queued or processing",
+            [({}, sum(by_status.get(status, 0) for status in ACTIVE_STATUSES))])
+
+    out.add("reflection_sse_streams", "gauge", "Open SSE subscriptions on this worker",
+            [({}, event_bus.subscriber_count())])
+    out.add("reflection_events_total", "counter", "Status events emitted by agents on this worker",
+            (({"event_type": event_type, "agent": agent}, count)
+             for (event_type, agent), count in sorted(events.snapshot().items())))
+
+    out.add_histogram("llm_call_duration_seconds", "LLM call latency per agent role",
+                      (({"agent": role}, histogram) for role, histogram in sorted(usage.latency_histograms().items())),
+                      scale=0.001)
+    by_role = usage.summary()["by_role"]
+    out.add("llm_calls_total", "counter", "LLM calls per agent role",
+            (({"agent": role}, totals["calls"]) for role, totals in sorted(by_role.items())))
+    out.add("llm_call_errors_total", "counter", "Failed LLM calls per agent role",
+            (({"agent": role}, totals["errors"]) for role, totals in sorted(by_role.items())))
+    out.add("llm_cached_calls_total", "counter", "LLM calls answered by the model cache per agent role",
+            (({"agent": role}, totals["cached_calls"]) for role, totals in sorted(by_role.items())))
+    out.add("llm_tokens_total", "counter", "LLM tokens per agent role and direction",
+            (({"agent": role, "direction": direction}, totals[f"{direction}_tokens"])
+             for role, totals in sorted(by_role.items()) for direction in ("prompt", "completion")))
+    out.add("llm_cost_usd_total", "counter", "Estimated LLM cost in USD per agent role",
+            (({"agent": role}, totals["cost_usd"]) for role, totals in sorted(by_role.items())))
+
+    if cache_stats is not None:
+        out.add("llm_cache_lookups_total", "counter", "LLM response cache lookups by result",
+                (({"result": result}, cache_stats[key])
+                 for result, key in (("memory_hit", "memory_hits"), ("disk_hit", "disk_hits"), ("miss", "misses"))))
+        out.add("llm_cache_hit_ratio", "gauge", "Share of LLM response cache lookups that hit",
+                [({}, cache_stats["hit_ratio"])])
+        out.add("llm_cache_memory_entries", "gauge", "Entries in the in-memory LLM response cache",
+                [({}, cache_stats["memory_entries"])])
+
+    out.add("process_resident_memory_bytes", "gauge", "Resident memory of this worker process",
+            [({}, resident_memory_bytes())])
+    return out.render()
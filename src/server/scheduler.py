@@ -0,0 +1,124 @@
+"""
+Priority job scheduler for reflection sessions.
+
+Submissions are queued in one FIFO lane per priority (interactive ahead of
+batch, the same lanes the LLM rate limiter uses) and started as asyncio tasks
+while fewer than `max_concurrent` jobs are running. Queued jobs report their
+position; any job can be cancelled. Cancelling a running job cancels its task,
+which aborts the in-flight LLM call, leaves the graph's checkpoint at the last
+completed node, and frees the slot at once for the next queued job.
+"""
+
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+from llm_runtime import PRIORITIES, llm_priority
+
+JobFactory = Callable[[], Awaitable[Any]]
+
+
+class JobScheduler:
+    """Bounded-concurrency job runner with priority lanes, queue positions and cancellation"""
+
+    def __init__(self, max_concurrent: int, priorities: Sequence[str] = PRIORITIES):
+        self.max_concurrent = max_concurrent
+        self.priorities = tuple(priorities)
+        # priority -> job_id -> factory, in submission order
+        self._lanes: Dict[str, "OrderedDict[str, JobFactory]"] = {p: OrderedDict() for p in self.priorities}
+        self._priority_of: Dict[str, str] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._started = 0
+        self._finished = 0
+        self._cancelled = 0
+
+    def submit(self, job_id: str, factory: JobFactory, priority: Optional[str] = None) -> int:
+        """
+        Queue a job; `factory` creates its coroutine once a slot is free.
+        Returns the job's queue position (0 when it started right away).
+        Must be called from within the event loop
+        """
+        priority = priority or self.priorities[0]
+        if priority not in self._lanes:
+            raise ValueError(f"Unknown priority {priority!r}; expected one of {self.priorities}")
+        self._lanes[priority][job_id] = factory
+        self._priority_of[job_id] = priority
+        self._dispatch()
+        return self.position(job_id) or 0
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based position among queued jobs, 0 if running, None if unknown or finished"""
+        if job_id in self._running:
+            return 0
+        priority = self._priority_of.get(job_id)
+        if priority is None:
+            return None
+        ahead = 0
+        for lane_priority in self.priorities:
+            lane = self._lanes[lane_priority]
+            if lane_priority == priority:
+                for index, queued_id in enumerate(lane):
+                    if queued_id == job_id:
+                        return ahead + index + 1
+            ahead += len(lane)
+        return None
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancel a job. Returns "queued" if it was removed before starting (its
+        coroutine never runs), "running" if its task was cancelled, None if unknown
+        """
+        priority = self._priority_of.pop(job_id, None)
+        if priority is not None:
+            del self._lanes[priority][job_id]
+            self._cancelled += 1
+            return "queued"
+        task = self._running.pop(job_id, None)
+        if task is None:
+            return None
+        task.cancel()
+        self._cancelled += 1
+        # The task unwinds on its own; its slot goes to the next job now
+        self._dispatch()
+        return "running"
+
+    def queued(self) -> int:
+        return len(self._priority_of)
+
+    def running(self) -> int:
+        return len(self._running)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": len(self._running),
+            "queued": {priority: len(lane) for priority, lane in self._lanes.items()},
+            "started": self._started,
+            "finished": self._finished,
+            "cancelled": self._cancelled,
+        }
+
+    def _dispatch(self):
+        while len(self._running) < self.max_concurrent:
+            lane = next((self._lanes[p] for p in self.priorities if self._lanes[p]), None)
+            if lane is None:
+                return
+            job_id, factory = lane.popitem(last=False)
+            priority = self._priority_of.pop(job_id)
+            task = asyncio.get_running_loop().create_task(self._run(factory, priority))
+            self._running[job_id] = task
+            self._started += 1
+            task.add_done_callback(lambda t, job_id=job_id: self._done(job_id, t))
+
+    @staticmethod
+    async def _run(factory: JobFactory, priority: str):
+        # The job's LLM calls queue in the rate limiter's lane of the same priority
+        with llm_priority(priority):
+            return await factory()
+
+    def _done(self, job_id: str, task: asyncio.Task):
+        if self._running.get(job_id) is task:
+            del self._running[job_id]
+        if not task.cancelled():
+            self._finished += 1
+        self._dispatch()
@@ -0,0 +1,586 @@
+"""
+Bounded session storage for the reflection API.
+
+`SessionStore` is a dict-like interface so request handlers can keep using
+`sessions[session_id]`. Two implementations are provided:
+
+- `InMemorySessionStore`: LRU-ordered, evicts finished sessions once they
+  exceed the TTL or push the store past its session/byte budget. Evicted
+  sessions are spilled to an optional persistent backend and loaded back
+  lazily on the next lookup.
+- `SQLiteSessionStore`: a local SQLite file, used as the spill tier (or on
+  its own) with TTL-based purging.
+- `SharedSessionStore`: the in-memory store in write-through mode, for
+  several uvicorn workers sharing one SQLite file. Each worker owns the
+  sessions it runs; reads of other workers' sessions go to SQLite.
+
+Active sessions can also be written through to the spill tier with
+`persist()` so that a worker restart can find and resume them.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import abstractmethod
+from collections import Counter, OrderedDict
+from collections.abc import Collection, MutableMapping
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+
+# Sessions in these states are still being written by a background task and are never evicted
+ACTIVE_STATUSES = ("queued", "processing")
+
+
+def _encode_default(value: Any):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return str(value)
+
+
+def _decode_hook(obj: Dict[str, Any]):
+    if len(obj) == 1 and "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+def dumps_session(session: Dict[str, Any]) -> str:
+    """Serialize a session dict, preserving datetimes"""
+    return json.dumps(session, default=_encode_default, ensure_ascii=False)
+
+
+def loads_session(payload: str) -> Dict[str, Any]:
+    return json.loads(payload, object_hook=_decode_hook)
+
+
+class SessionStore(MutableMapping):
+    """Dict-like session storage keyed by session ID"""
+
+    @abstractmethod
+    def complete(self, session_id: str):
+        """Signal that a session's background work has finished and it may be evicted"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """Return counters describing the store's current footprint"""
+
+    def status_counts(self) -> Dict[str, int]:
+        """Number of stored sessions per status"""
+        return dict(Counter(str(self[session_id].get("status")) for session_id in self))
+
+
+class SQLiteSessionStore(SessionStore):
+    """Persistent session storage in a local SQLite file"""
+
+    def __init__(self, path: str, ttl_seconds: Optional[float] = None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # WAL lets readers in other worker processes proceed while one of them writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                status TEXT,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                pid INTEGER,
+                heartbeat REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cancel_requests (
+                session_id TEXT PRIMARY KEY
+            );"""
+        )
+        # Owning worker of an active session (shared mode); added to files created before it existed
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")]
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE sessions ADD COLUMN owner TEXT")
+        self._conn.commit()
+
+    def __getitem__(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None or self._expired(row[1]):
+            raise KeyError(session_id)
+        return loads_session(row[0])
+
+    def __setitem__(self, session_id: str, session: Dict[str, Any]):
+        self.put(session_id, session)
+
+    def put(self, session_id: str, session: Dict[str, Any], owner: Optional[str] = None) -> float:
+        """Write a session, recording its owning worker; returns the row version (updated_at)"""
+        payload = dumps_session(session)
+        updated_at = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, status, data, updated_at, owner) VALUES (?, ?, ?, ?, ?)",
+                (session_id, session.get("status"), payload, updated_at, owner),
+            )
+            self._conn.commit()
+        return updated_at
+
+    def load_if_changed(self, session_id: str, version: Optional[float]) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        Return (session, version) when the row differs from `version`, or None when
+        the caller's copy is current (the payload is then not decoded)
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT updated_at, CASE WHEN updated_at = ? THEN NULL ELSE data END FROM sessions "
+                "WHERE session_id = ?", (version, session_id)
+            ).fetchone()
+        if row is None or self._expired(row[0]):
+            raise KeyError(session_id)
+        if row[1] is None:
+            return None
+        return loads_session(row[1]), row[0]
+
+    def __delitem__(self, session_id: str):
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+        if cursor.rowcount == 0:
+            raise KeyError(session_id)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT session_id, updated_at FROM sessions").fetchall()
+        return iter([session_id for session_id, updated_at in rows if not self._expired(updated_at)])
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def complete(self, session_id: str):
+        self.purge_expired()
+
+    def status_counts(self, exclude: Collection[str] = ()) -> Dict[str, int]:
+        """Unexpired sessions per status, skipping ids in `exclude`; payloads are not decoded"""
+        cutoff = time.time() - self.ttl_seconds if self.ttl_seconds is not None else float("-inf")
+        with self._lock:
+            if not exclude:
+                rows = self._conn.execute(
+                    "SELECT status, COUNT(*) FROM sessions WHERE updated_at >= ? GROUP BY status", (cutoff,)
+                ).fetchall()
+                return {str(status): count for status, count in rows}
+            rows = self._conn.execute(
+                "SELECT session_id, status FROM sessions WHERE updated_at >= ?", (cutoff,)
+            ).fetchall()
+        return dict(Counter(str(status) for session_id, status in rows if session_id not in exclude))
+
+    def with_status(self, *statuses: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """Unexpired sessions whose status is one of `statuses`"""
+        placeholders = ", ".join("?" for _ in statuses)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT session_id, data, updated_at FROM sessions WHERE status IN ({placeholders})", statuses
+            ).fetchall()
+        return [(session_id, loads_session(data)) for session_id, data, updated_at in rows
+                if not self._expired(updated_at)]
+
+    def heartbeat(self, worker_id: str):
+        """Record that a worker is alive; sessions it owns are not claimed by others"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO workers (worker_id, pid, heartbeat) VALUES (?, ?, ?)",
+                (worker_id, os.getpid(), time.time()),
+            )
+            self._conn.commit()
+
+    def owner(self, session_id: str) -> Optional[str]:
+        """Worker running the session's job; None once the job has finished"""
+        with self._lock:
+            row = self._conn.execute("SELECT owner FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def remove_worker(self, worker_id: str):
+        """Deregister a worker so the sessions it still owns can be claimed right away"""
+        with self._lock:
+            self._conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+            self._conn.commit()
+
+    def claim_orphans(self, worker_id: str, stale_seconds: float) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Take ownership of active sessions whose owner is unset or has not sent a
+        heartbeat within `stale_seconds`. The claim is a compare-and-set on the
+        owner column, so concurrent workers never claim the same session twice
+        """
+        placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+        claimed = []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT session_id, data, updated_at, owner FROM sessions WHERE status IN ({placeholders}) "
+                "AND (owner IS NULL OR owner NOT IN (SELECT worker_id FROM workers WHERE heartbeat >= ?))",
+                (*ACTIVE_STATUSES, time.time() - stale_seconds),
+            ).fetchall()
+            for session_id, data, updated_at, owner in rows:
+                if self._expired(updated_at):
+                    continue
+                cursor = self._conn.execute(
+                    "UPDATE sessions SET owner = ? WHERE session_id = ? AND owner IS ?", (worker_id, session_id, owner)
+                )
+                if cursor.rowcount:
+                    claimed.append((session_id, loads_session(data)))
+            self._conn.commit()
+        return claimed
+
+    def request_cancel(self, session_id: str):
+        """Ask whichever worker owns a session to cancel it"""
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO cancel_requests (session_id) VALUES (?)", (session_id,))
+            self._conn.commit()
+
+    def take_cancel_requests(self, worker_id: str) -> List[str]:
+        """Remove and return the cancellation requests for sessions owned by `worker_id`"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT c.session_id FROM cancel_requests c JOIN sessions s ON s.session_id = c.session_id "
+                "WHERE s.owner = ?", (worker_id,)
+            ).fetchall()
+            self._conn.executemany("DELETE FROM cancel_requests WHERE session_id = ?", rows)
+            # Requests for sessions that finished before any worker picked them up; a completed
+            # session still owned by a worker is evaluating its needs and can still be cancelled
+            self._conn.execute(
+                "DELETE FROM cancel_requests WHERE session_id NOT IN (SELECT session_id FROM sessions "
+                f"WHERE status IN ({', '.join('?' for _ in ACTIVE_STATUSES)}) OR owner IS NOT NULL)",
+                ACTIVE_STATUSES,
+            )
+            self._conn.commit()
+        return [session_id for session_id, in rows]
+
+    def purge_expired(self) -> int:
+        """Delete rows older than the TTL; returns the number removed"""
+        if self.ttl_seconds is None:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_seconds,)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM sessions"
+            ).fetchone()
+        return {"backend": "sqlite", "path": self.path, "sessions": count, "bytes": size}
+
+    def _expired(self, updated_at: float) -> bool:
+        return self.ttl_seconds is not None and updated_at < time.time() - self.ttl_seconds
+
+
+class InMemorySessionStore(SessionStore):
+    """LRU + TTL bounded in-process session storage with optional spill tier"""
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: Optional[float] = 24 * 3600,
+        spill: Optional[SessionStore] = None,
+        on_evict: Optional[Callable[[str], None]] = None,
+    ):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.spill = spill
+        self.on_evict = on_evict
+        self._data: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._sizes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._evictions = 0
+        self._spill_loads = 0
+        # Active sessions written through to the spill tier; their final state is written on completion
+        self._persisted: Set[str] = set()
+        self._lock = threading.RLock()
+
+    def __getitem__(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            session = self._data.get(session_id)
+            if session is not None:
+                self._touch(session_id)
+                return session
+        if self.spill is None:
+            raise KeyError(session_id)
+        # Lazily bring a spilled session back into memory
+        session = self.spill[session_id]
+        with self._lock:
+            self._spill_loads += 1
+            self._insert(session_id, session)
+            self._evict()
+        return session
+
+    def __setitem__(self, session_id: str, session: Dict[str, Any]):
+        with self._lock:
+            self._insert(session_id, session)
+            self._evict()
+
+    def __delitem__(self, session_id: str):
+        found = False
+        with self._lock:
+            if session_id in self._data:
+                self._remove(session_id)
+                found = True
+        if self.spill is not None:
+            try:
+                del self.spill[session_id]
+                found = True
+            except KeyError:
+                pass
+        if not found:
+            raise KeyError(session_id)
+
+    def __iter__(self) -> Iterator[str]:
+        # Only resident sessions; spilled ones are loaded on demand
+        with self._lock:
+            return iter(list(self._data.keys()))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def complete(self, session_id: str):
+        with self._lock:
+            if session_id in self._data:
+                self._account(session_id)
+                if session_id in self._persisted:
+                    # Overwrite the spilled active snapshot so a restart does not resume a finished session
+                    self._persisted.discard(session_id)
+                    if self.spill is not None:
+                        self.spill[session_id] = self._data[session_id]
+            self._evict()
+        if self.spill is not None:
+            self.spill.complete(session_id)
+
+    def persist(self, session_id: str):
+        """Write a resident session through to the spill tier so it survives a worker restart"""
+        if self.spill is None:
+            return
+        with self._lock:
+            session = self._data.get(session_id)
+            if session is None:
+                return
+            self._persisted.add(session_id)
+            self.spill[session_id] = session
+
+    def interrupted(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Sessions a previous process left queued or processing: active in the spill
+        tier but not resident here. Empty without a spill tier that can be queried
+        """
+        if not isinstance(self.spill, SQLiteSessionStore):
+            return []
+        with self._lock:
+            resident = set(self._data)
+        return [(session_id, session) for session_id, session in self.spill.with_status(*ACTIVE_STATUSES)
+                if session_id not in resident]
+
+    def status_counts(self) -> Dict[str, int]:
+        """Resident sessions per status, plus spilled ones when the spill tier can count without decoding"""
+        with self._lock:
+            counts = Counter(str(session.get("status")) for session in self._data.values())
+            resident = set(self._data)
+        if isinstance(self.spill, SQLiteSessionStore):
+            counts.update(self.spill.status_counts(exclude=resident))
+        return dict(counts)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "backend": "memory",
+                "sessions": len(self._data),
+                "bytes": self._total_bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "evictions": self._evictions,
+                "spill_loads": self._spill_loads,
+            }
+        if self.spill is not None:
+            stats["spill"] = self.spill.stats()
+        return stats
+
+    def _touch(self, session_id: str):
+        self._data.move_to_end(session_id)
+        self._last_access[session_id] = time.monotonic()
+
+    def _insert(self, session_id: str, session: Dict[str, Any]):
+        self._data[session_id] = session
+        self._touch(session_id)
+        self._account(session_id)
+
+    def _account(self, session_id: str):
+        size = len(dumps_session(self._data[session_id]).encode("utf-8"))
+        self._total_bytes += size - self._sizes.get(session_id, 0)
+        self._sizes[session_id] = size
+
+    def _remove(self, session_id: str) -> Dict[str, Any]:
+        session = self._data.pop(session_id)
+        self._last_access.pop(session_id, None)
+        self._persisted.discard(session_id)
+        self._total_bytes -= self._sizes.pop(session_id, 0)
+        return session
+
+    def _evict(self):
+        """Drop expired sessions, then least recently used ones until within budget"""
+        if self.ttl_seconds is not None:
+            # Entries are in access order, so stop at the first one still within the TTL
+            cutoff = time.monotonic() - self.ttl_seconds
+            victims = []
+            for session_id in self._data:
+                if self._last_access[session_id] > cutoff:
+                    break
+                if self._data[session_id].get("status") not in ACTIVE_STATUSES:
+                    victims.append(session_id)
+            for session_id in victims:
+                self._spill_out(session_id)
+
+        if len(self._data) <= self.max_sessions and self._total_bytes <= self.max_bytes:
+            return
+        for session_id in list(self._data.keys()):
+            if len(self._data) <= self.max_sessions and self._total_bytes <= self.max_bytes:
+                break
+            if self._data[session_id].get("status") in ACTIVE_STATUSES:
+                continue
+            self._spill_out(session_id)
+
+    def _spill_out(self, session_id: str):
+        session = self._remove(session_id)
+        self._evictions += 1
+        if self.spill is not None:
+            self.spill[session_id] = session
+        if self.on_evict is not None:
+            self.on_evict(session_id)
+
+
+class SharedSessionStore(InMemorySessionStore):
+    """
+    Session storage shared by several worker processes through one SQLite file.
+
+    A worker owns the sessions it creates or resumes: they stay resident, every
+    `__setitem__`/`persist()`/`complete()` writes them through, and the row
+    records the owner. Sessions owned elsewhere are re-read on every lookup,
+    decoding the payload only when the row has changed since the cached copy,
+    so a client polling any worker sees the latest persisted state. Workers
+    heartbeat into the file; active sessions of a worker that stops
+    heartbeating are claimed by `interrupted()` in another one.
+    """
+
+    def __init__(self, spill: SQLiteSessionStore, stale_seconds: float = 15, **kwargs):
+        super().__init__(spill=spill, **kwargs)
+        self.spill: SQLiteSessionStore = spill
+        self.stale_seconds = stale_seconds
+        self.worker_id = uuid.uuid4().hex
+        # Row version (updated_at) of each resident copy
+        self._versions: Dict[str, float] = {}
+        self.heartbeat()
+
+    def __getitem__(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            if session_id in self._persisted:
+                self._touch(session_id)
+                return self._data[session_id]
+            cached = self._data.get(session_id)
+            version = self._versions.get(session_id) if cached is not None else None
+        loaded = self.spill.load_if_changed(session_id, version)
+        with self._lock:
+            if loaded is None:
+                if session_id in self._data:
+                    self._touch(session_id)
+                return cached
+            session, self._versions[session_id] = loaded
+            self._spill_loads += 1
+            self._insert(session_id, session)
+            self._evict()
+        return session
+
+    def __setitem__(self, session_id: str, session: Dict[str, Any]):
+        with self._lock:
+            self._insert(session_id, session)
+            self._persisted.add(session_id)
+            self._write(session_id)
+            self._evict()
+
+    def __iter__(self) -> Iterator[str]:
+        # Every worker's sessions, not only the resident ones
+        return iter(self.spill)
+
+    def __len__(self) -> int:
+        return len(self.spill)
+
+    def persist(self, session_id: str):
+        with self._lock:
+            if session_id in self._data:
+                self._persisted.add(session_id)
+                self._write(session_id)
+
+    def complete(self, session_id: str):
+        with self._lock:
+            if session_id in self._persisted:
+                self._account(session_id)
+                self._persisted.discard(session_id)
+                self._write(session_id, owned=False)
+            self._evict()
+        self.spill.complete(session_id)
+
+    def heartbeat(self):
+        self.spill.heartbeat(self.worker_id)
+
+    def shutdown(self):
+        """Deregister this worker; sessions it leaves active become claimable immediately"""
+        self.spill.remove_worker(self.worker_id)
+
+    def request_cancel(self, session_id: str):
+        self.spill.request_cancel(session_id)
+
+    def owner(self, session_id: str) -> Optional[str]:
+        return self.spill.owner(session_id)
+
+    def take_cancel_requests(self) -> List[str]:
+        """Cancellations other workers recorded for sessions this worker runs"""
+        return self.spill.take_cancel_requests(self.worker_id)
+
+    def interrupted(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Claim the active sessions of workers that stopped heartbeating (or of a previous run)"""
+        return self.spill.claim_orphans(self.worker_id, self.stale_seconds)
+
+    def status_counts(self) -> Dict[str, int]:
+        # Owned sessions are written through, so the file is current for every worker's sessions
+        return self.spill.status_counts()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update({"backend": "shared", "worker_id": self.worker_id, "owned": len(self._persisted)})
+        return stats
+
+    def _write(self, session_id: str, owned: bool = True):
+        owner = self.worker_id if owned else None
+        self._versions[session_id] = self.spill.put(session_id, self._data[session_id], owner=owner)
+
+    def _remove(self, session_id: str) -> Dict[str, Any]:
+        self._versions.pop(session_id, None)
+        return super()._remove(session_id)
+
+    def _spill_out(self, session_id: str):
+        # Rows are already written through; writing a cached copy back could overwrite a newer one
+        owned = session_id in self._persisted
+        session = self._remove(session_id)
+        self._evictions += 1
+        if owned:
+            self.spill.put(session_id, session, owner=self.worker_id)
+        if self.on_evict is not None:
+            self.on_evict(session_id)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+測試 SQLite 檢查點：session 中斷後由新的 process（新的連線）從最後完成的節點接續
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DB_PATH = os.path.join(tempfile.mkdtemp(), "checkpoints.db")
+os.environ.update({
+    "LLM_BACKEND": "fake",
+    "LLM_CACHE": "0",
+    "FAKE_LLM_LATENCY": "fixed:0",
+    "FAKE_LLM_TOKENS_PER_SECOND": "0",
+    "CHECKPOINT_DB_PATH": DB_PATH,
+})
+
+from src.agents import checkpoint
+from src.agents.checkpoint import SQLiteCheckpointSaver
+from src.agents.need_finder import MedicalReflectionSystem
+
+# 與其他測試同一個 process 執行時模組可能已先載入，直接指定路徑
+checkpoint.CHECKPOINT_DB_PATH = DB_PATH
+
+QUERY = "急診室病床壅塞"
+
+
+def test_resume_from_last_completed_node():
+    started = []
+
+    def interrupt_on_second_round(event_type, agent, data):
+        if event_type == "thinking_started":
+            started.append(data["round"])
+            if data["round"] == 2:
+                # 模擬 worker 在第二輪進行中被關閉
+                asyncio.current_task().cancel()
+
+    async def crash():
+        try:
+            await MedicalReflectionSystem().run_reflection(
+                QUERY, thread_id="s1", max_rounds=3, status_callback=interrupt_on_second_round)
+        except asyncio.CancelledError:
+            return
+        raise AssertionError("應在第二輪被中斷")
+
+    asyncio.run(crash())
+    assert started == [1, 2]
+    saver = SQLiteCheckpointSaver(DB_PATH)
+    assert saver.thread_ids() == ["s1"]
+
+    resumed = []
+    result = asyncio.run(MedicalReflectionSystem().run_reflection(
+        QUERY, thread_id="s1", max_rounds=3, resume=True,
+        status_callback=lambda event_type, agent, data: event_type == "thinking_started" and resumed.append(data["round"])))
+
+    # 第一輪不重跑；第二輪因未完成而重新執行
+    assert resumed == [2, 3]
+    assert result["discussion_rounds"] == 3
+    assert len(result["medical_insights"]) + len(result["engineering_insights"]) == 3
+    assert result["parsed_needs"]["needs"]
+    assert saver.thread_ids() == []
+    print("✅ 中斷後接續測試通過")
+
+
+def test_resume_without_checkpoint_starts_over():
+    rounds = []
+    result = asyncio.run(MedicalReflectionSystem().run_reflection(
+        QUERY, thread_id="s2", max_rounds=2, resume=True,
+        status_callback=lambda event_type, agent, data: event_type == "thinking_started" and rounds.append(data["round"])))
+    assert rounds == [1, 2] and result["discussion_rounds"] == 2
+    print("✅ 無檢查點時從頭執行測試通過")
+
+
+def test_async_interface_does_not_block_event_loop():
+    saver = SQLiteCheckpointSaver(os.path.join(tempfile.mkdtemp(), "checkpoints.db"))
+    config = {"configurable": {"thread_id": "s3", "checkpoint_ns": ""}}
+
+    async def scenario():
+        # 模擬另一個 session 正在寫入：鎖被佔用期間 event loop 仍要能處理其他工作
+        saver._lock.acquire()
+        release = threading.Timer(1.0, saver._lock.release)
+        release.start()
+        pending = asyncio.ensure_future(saver.aget_tuple(config))
+        ticks = 0
+        while not pending.done() and ticks < 5:
+            await asyncio.sleep(0.01)
+            ticks += 1
+        release.cancel()
+        if not pending.done():
+            saver._lock.release()
+        assert await pending is None
+        return ticks
+
+    assert asyncio.run(scenario()) == 5
+    print("✅ 非同步檢查點不阻塞 event loop 測試通過")
+
+
+if __name__ == "__main__":
+    test_resume_from_last_completed_node()
+    test_resume_without_checkpoint_starts_over()
+    test_async_interface_does_not_block_event_loop()
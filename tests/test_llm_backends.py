@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+測試 LLM 後端登錄與離線假模型：腳本化 JSON 符合各 schema、確定性、延遲與串流速率
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LLM_BACKEND", "fake")
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from llm_runtime import FakeChatModel, available_backends, create_chat_model
+from src.agents.evaluator import NeedEvaluator, NeedsEvaluationOutput
+from src.agents.need_finder import COLLECTOR_PROMPT, NEEDS_RESPONSE_FORMAT, NeedsOutput, collector_inputs
+
+NEEDS = [
+    {"need": "術後傷口遠距監測", "summary": "s", "medical_insights": "m", "tech_insights": "t", "strategy": "x"},
+    {"need": "急診檢傷分級輔助", "summary": "s", "medical_insights": "m", "tech_insights": "t", "strategy": "x"},
+]
+
+
+def _fake(**kwargs):
+    params = {"cache": None, "latency": "fixed:0", "tokens_per_second": 0, **kwargs}
+    return create_chat_model("gpt-4.1-mini", 0.3, backend="fake", **params)
+
+
+def test_registry():
+    assert {"openai", "fake"} <= set(available_backends())
+    assert isinstance(_fake(), FakeChatModel)
+    try:
+        create_chat_model(backend="missing")
+    except ValueError:
+        print("✅ 後端登錄測試通過")
+    else:
+        raise AssertionError("未知後端應拋出 ValueError")
+
+
+def test_scripted_outputs_match_schemas():
+    llm = _fake()
+    state = {"medical_insights": ["m"], "engineering_insights": ["e"], "messages": [HumanMessage(content="q")]}
+    chain = COLLECTOR_PROMPT | llm.bind(response_format=NEEDS_RESPONSE_FORMAT)
+    needs = NeedsOutput.model_validate_json(chain.invoke(collector_inputs(state)).content)
+    assert len(needs.needs) == 3
+
+    evaluator = NeedEvaluator(mode="per_need")
+    evaluator.llm = llm
+    result = evaluator.evaluate_needs(NEEDS)
+    assert [e.need_title for e in result.evaluations] == [n["need"] for n in NEEDS]
+
+    batch = NeedEvaluator(mode="batch")
+    batch.llm = llm
+    message = (batch._build_prompt() | llm).invoke({"needs_content": batch._format_needs_for_evaluation(NEEDS)})
+    assert len(NeedsEvaluationOutput.model_validate_json(message.content).evaluations) == 2
+
+    vote_prompt = "- 概念A: 批評重點=x\n- 概念B: 批評重點=y\n輸出 JSON 陣列：[{\"concept_title\":\"...\", \"revisions\":[...]}]"
+    votes = json.loads(llm.invoke(vote_prompt).content)
+    assert [v["concept_title"] for v in votes] == ["概念A", "概念B"]
+    assert all(len(v["scores"]) == 8 and 0 <= s["score"] <= 5 for v in votes for s in v["scores"])
+    print("✅ 腳本化 JSON 輸出測試通過")
+
+
+def test_deterministic_latency_and_stream_rate():
+    messages = [SystemMessage(content="你是醫療專家"), HumanMessage(content="討論術後照護")]
+    first = _fake(seed=7).invoke(messages)
+    assert first.content == _fake(seed=7).invoke(messages).content
+    assert first.usage_metadata["output_tokens"] > 0
+
+    llm = _fake(seed=7, latency="fixed:0.1", tokens_per_second=200)
+
+    async def stream():
+        started = time.monotonic()
+        chunks = [chunk async for chunk in llm.astream(messages)]
+        return chunks, time.monotonic() - started
+
+    chunks, elapsed = asyncio.run(stream())
+    message = sum(chunks[1:], chunks[0])
+    tokens = message.usage_metadata["output_tokens"]
+    assert message.content == first.content
+    assert elapsed >= 0.1 + tokens / 200 * 0.9
+    print("✅ 確定性、延遲與串流速率測試通過")
+
+
+if __name__ == "__main__":
+    test_registry()
+    test_scripted_outputs_match_schemas()
+    test_deterministic_latency_and_stream_rate()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+測試 LLM 回應快取的記憶體/SQLite 兩層命中、略過旗標與串流路徑
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.prompts import ChatPromptTemplate
+
+from llm_runtime import LLMResponseCache, SQLiteResponseStore, bypass_cache
+from llm_runtime import astream_message
+
+
+PROMPT = ChatPromptTemplate.from_messages([("human", "評估需求：{need}")])
+
+
+def _model(cache, responses):
+    return FakeListChatModel(responses=responses, cache=cache)
+
+
+def test_memory_and_disk_tiers():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "llm_cache.db")
+        # 假模型的 responses 會納入 llm_string，重啟後需使用相同設定才會對應同一個鍵
+        responses = ["第一次", "第二次"]
+        cache = LLMResponseCache(disk=SQLiteResponseStore(path))
+        chain = PROMPT | _model(cache, responses)
+
+        assert chain.invoke({"need": "透析低血壓"}).content == "第一次"
+        assert chain.invoke({"need": "透析低血壓"}).content == "第一次"
+        assert cache.stats()["memory_hits"] == 1
+
+        # 新的快取實例（模擬重啟）從 SQLite 載回
+        restarted = LLMResponseCache(disk=SQLiteResponseStore(path))
+        chain = PROMPT | _model(restarted, responses)
+        assert chain.invoke({"need": "透析低血壓"}).content == "第一次"
+        assert restarted.stats()["disk_hits"] == 1
+    print("✅ 記憶體與 SQLite 兩層快取測試通過")
+
+
+def test_async_disk_tier_runs_off_the_event_loop():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "llm_cache.db")
+        responses = ["回應"]
+        asyncio.run((PROMPT | _model(LLMResponseCache(disk=SQLiteResponseStore(path)), responses)).ainvoke({"need": "x"}))
+
+        restarted = LLMResponseCache(disk=SQLiteResponseStore(path))
+        threads = []
+        disk_get = restarted.disk.get
+
+        def recording_get(key):
+            threads.append(threading.current_thread())
+            return disk_get(key)
+
+        restarted.disk.get = recording_get
+        chain = PROMPT | _model(restarted, responses)
+
+        async def run():
+            first = await chain.ainvoke({"need": "x"})
+            second = await chain.ainvoke({"need": "x"})
+            return first, second
+
+        first, second = asyncio.run(run())
+        assert first.content == second.content == "回應"
+        # SQLite 命中（含更新存取時間的 commit）在 worker thread 執行，之後由記憶體層命中
+        assert len(threads) == 1 and threads[0] is not threading.main_thread()
+        stats = restarted.stats()
+        assert stats["disk_hits"] == 1 and stats["memory_hits"] == 1
+    print("✅ 非同步 SQLite 快取層測試通過")
+
+
+def test_bypass_and_lru_eviction():
+    cache = LLMResponseCache(max_entries=1)
+    chain = PROMPT | _model(cache, ["a", "b", "c", "d"])
+
+    chain.invoke({"need": "x"})
+    with bypass_cache():
+        assert chain.invoke({"need": "x"}).content == "b"
+    chain.invoke({"need": "y"})
+    stats = cache.stats()
+    assert stats["bypassed"] == 1
+    assert stats["memory_entries"] == 1
+    assert stats["memory_evictions"] == 1
+    print("✅ 略過旗標與 LRU 淘汰測試通過")
+
+
+def test_streaming_path_shares_cache():
+    cache = LLMResponseCache()
+    chain = PROMPT | _model(cache, ["串流回應", "不應被呼叫"])
+    deltas = []
+
+    async def run():
+        await astream_message(chain, {"need": "x"}, on_delta=lambda text, seq: deltas.append(text), interval_ms=0)
+        return await chain.ainvoke({"need": "x"})
+
+    assert asyncio.run(run()).content == "串流回應"
+    assert "".join(deltas) == "串流回應"
+    assert cache.stats()["memory_hits"] == 1
+    print("✅ 串流路徑快取測試通過")
+
+
+if __name__ == "__main__":
+    test_memory_and_disk_tiers()
+    test_async_disk_tier_runs_off_the_event_loop()
+    test_bypass_and_lru_eviction()
+    test_streaming_path_shares_cache()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+測試 Prometheus 指標輸出：排程佇列、session 狀態、SSE 訂閱、事件計數與 LLM 延遲 histogram
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_runtime import UsageTracker
+from llm_runtime.usage import LLMCall
+from src.server.event_bus import EventBus
+from src.server.metrics import EventCounter, render_metrics
+from src.server.scheduler import JobScheduler
+from src.server.session_store import InMemorySessionStore, SQLiteSessionStore
+
+
+def _samples(body: str):
+    """指標行 -> 數值（略過 HELP / TYPE）"""
+    samples = {}
+    for line in body.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_status_counts_include_spilled_sessions():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = InMemorySessionStore(max_sessions=1, spill=SQLiteSessionStore(os.path.join(tmp, "s.db")))
+        store["s1"] = {"status": "completed", "query": "急診壅塞", "created_at": datetime.now()}
+        store["s2"] = {"status": "processing", "query": "急診壅塞", "created_at": datetime.now()}
+        store.persist("s2")
+        store["s2"]["status"] = "completed"
+        # s1 已溢出到 SQLite；s2 常駐且其 SQLite 副本已過時，以常駐狀態為準
+        assert store.status_counts() == {"completed": 2}
+    print("✅ session 狀態計數測試通過")
+
+
+def test_render_metrics():
+    async def scenario():
+        scheduler = JobScheduler(max_concurrent=1)
+        gate = asyncio.Event()
+        scheduler.submit("s1", gate.wait)
+        scheduler.submit("s2", gate.wait, "batch")
+        await asyncio.sleep(0)
+
+        sessions = InMemorySessionStore()
+        sessions["s1"] = {"status": "processing", "query": "q", "created_at": datetime.now()}
+        sessions["s2"] = {"status": "queued", "query": "q", "created_at": datetime.now()}
+        sessions["s0"] = {"status": "completed", "query": "q", "created_at": datetime.now()}
+
+        bus = EventBus()
+        subscription = bus.subscribe("s1")
+        events = EventCounter()
+        for _ in range(3):
+            events.inc("token_delta", "medical_expert")
+        events.inc("thinking_started", 'say "hi"')
+
+        usage = UsageTracker(prices={"m": (1.0, 1.0)}, latency_buckets_ms=(100, 1000))
+        for latency in (50, 100, 500, 5000):
+            usage.record(LLMCall(model="m", labels={"role": "engineer"}, prompt_tokens=10,
+                                 completion_tokens=5, latency_ms=latency))
+
+        body = render_metrics(scheduler, sessions, bus, events, usage,
+                              {"memory_hits": 3, "disk_hits": 1, "misses": 4, "hit_ratio": 0.5, "memory_entries": 3})
+        subscription.close()
+        gate.set()
+        return body
+
+    body = asyncio.run(scenario())
+    samples = _samples(body)
+    assert samples['reflection_jobs_queued{priority="interactive"}'] == 0
+    assert samples['reflection_jobs_queued{priority="batch"}'] == 1
+    assert samples["reflection_jobs_running"] == 1
+    assert samples['reflection_sessions{status="completed"}'] == 1
+    assert samples["reflection_sessions_active"] == 2
+    assert samples["reflection_sse_streams"] == 1
+    assert samples['reflection_events_total{event_type="token_delta",agent="medical_expert"}'] == 3
+    # 標籤值跳脫雙引號
+    assert samples['reflection_events_total{event_type="thinking_started",agent="say \\"hi\\""}'] == 1
+
+    # 桶為累計值，上限含等於；毫秒轉為秒
+    assert samples['llm_call_duration_seconds_bucket{agent="engineer",le="0.1"}'] == 2
+    assert samples['llm_call_duration_seconds_bucket{agent="engineer",le="1.0"}'] == 3
+    assert samples['llm_call_duration_seconds_bucket{agent="engineer",le="+Inf"}'] == 4
+    assert samples['llm_call_duration_seconds_count{agent="engineer"}'] == 4
+    assert abs(samples['llm_call_duration_seconds_sum{agent="engineer"}'] - 5.65) < 1e-9
+    assert samples['llm_tokens_total{agent="engineer",direction="prompt"}'] == 40
+    assert samples["llm_cache_hit_ratio"] == 0.5
+    assert samples['llm_cache_lookups_total{result="miss"}'] == 4
+    assert samples["process_resident_memory_bytes"] > 0
+    assert "# TYPE llm_call_duration_seconds histogram" in body
+    print("✅ Prometheus 指標輸出測試通過")
+
+
+if __name__ == "__main__":
+    test_status_counts_include_spilled_sessions()
+    test_render_metrics()
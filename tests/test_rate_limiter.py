@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+測試共用限流器：對本機假 LLM 伺服器的 429 重試、bucket 節流與優先等級
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_openai import ChatOpenAI
+
+from llm_runtime import PRIORITY_BATCH, ProviderRateLimiter, llm_priority, rate_limited_client_kwargs
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """前 rate_limited 次請求回 429，之後回傳正常的 chat completion"""
+
+    # keep-alive，連線會留在 client 的連線池中重用
+    protocol_version = "HTTP/1.1"
+    rate_limited = 0
+    calls = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        type(self).calls += 1
+        if type(self).calls <= type(self).rate_limited:
+            self._send(429, {"error": {"message": "rate limited", "type": "requests"}}, {"retry-after-ms": "50"})
+            return
+        self._send(200, {
+            "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "fake",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+        }, {"x-ratelimit-remaining-requests": "99"})
+
+    def _send(self, status, body, headers):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_retries_429_against_fake_server():
+    server = _serve()
+    FakeOpenAIHandler.calls, FakeOpenAIHandler.rate_limited = 0, 2
+    limiter = ProviderRateLimiter(max_retries=3, base_delay=0.01)
+    llm = ChatOpenAI(model="fake", api_key="x", base_url=f"http://127.0.0.1:{server.server_port}/v1",
+                     **rate_limited_client_kwargs(limiter))
+    try:
+        assert llm.invoke("hi").content == "ok"
+        FakeOpenAIHandler.calls = 0
+        assert asyncio.run(llm.ainvoke("hi")).content == "ok"
+    finally:
+        server.shutdown()
+    stats = limiter.stats()
+    assert stats["rate_limited"] == 4
+    assert stats["retries"] == 4
+    # 供應商回報的剩餘請求數會校正本地 bucket
+    assert stats["requests_available"] < limiter.requests.capacity
+    print("✅ 429 退避重試測試通過")
+
+
+def test_async_client_survives_new_event_loops():
+    server = _serve()
+    FakeOpenAIHandler.calls, FakeOpenAIHandler.rate_limited = 0, 0
+    limiter = ProviderRateLimiter(max_retries=0)
+    llm = ChatOpenAI(model="fake", api_key="x", base_url=f"http://127.0.0.1:{server.server_port}/v1",
+                     **rate_limited_client_kwargs(limiter))
+    try:
+        # 同步入口各自以 asyncio.run 建立新的 event loop，連線池不可沿用已關閉 loop 的連線
+        for _ in range(3):
+            assert asyncio.run(llm.ainvoke("hi")).content == "ok"
+    finally:
+        server.shutdown()
+    assert FakeOpenAIHandler.calls == 3
+    print("✅ 多個 event loop 共用限流 client 測試通過")
+
+
+def test_bucket_throttles_requests():
+    limiter = ProviderRateLimiter(requests_per_minute=600)  # 每 0.1 秒補充一次
+    limiter.requests.level = 0
+    started = time.monotonic()
+    asyncio.run(limiter.acquire(1))
+    assert time.monotonic() - started >= 0.09
+    assert limiter.stats()["throttled"] == 1
+    print("✅ RPM 節流測試通過")
+
+
+def test_interactive_served_before_batch():
+    limiter = ProviderRateLimiter(requests_per_minute=600)
+    limiter.requests.level = 0
+    order = []
+
+    async def request(name, priority=None):
+        if priority:
+            with llm_priority(priority):
+                await limiter.acquire(1)
+        else:
+            await limiter.acquire(1)
+        order.append(name)
+
+    async def run():
+        batch = asyncio.create_task(request("batch", PRIORITY_BATCH))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(batch, request("interactive"))
+
+    asyncio.run(run())
+    assert order == ["interactive", "batch"]
+    print("✅ 優先等級測試通過")
+
+
+if __name__ == "__main__":
+    test_retries_429_against_fake_server()
+    test_async_client_survives_new_event_loops()
+    test_bucket_throttles_requests()
+    test_interactive_served_before_batch()
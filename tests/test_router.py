@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+測試本地詞彙路由：英文單字邊界、詞彙去重、中文長詞優先與路由決策
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+
+from src.agents.router import ENGINEER_NEXT, MEDICAL_NEXT, LexicalRouter
+
+
+def test_latin_terms_match_whole_words():
+    router = LexicalRouter()
+    # "ai" 不應命中 explain / maintain / again / detail，"care" 不應命中 healthcare
+    assert router.classify("We need to explain and maintain the clinical detail again for the patient") == (
+        "medical", {"medical": 2, "engineering": 0})
+    assert router.classify("healthcare") == (None, {"medical": 0, "engineering": 0})
+    # 複數與緊鄰中文的英文詞仍會命中
+    assert router.classify("patients and nurses")[1]["medical"] == 2
+    assert router.classify("導入AI系統")[1]["engineering"] == 2
+    print("✅ 英文單字邊界測試通過")
+
+
+def test_duplicate_and_nested_terms_count_once():
+    router = LexicalRouter()
+    # AI/ai、API/api 小寫後重複，各只計一次
+    assert router.classify("AI API")[1] == {"medical": 0, "engineering": 2}
+    # 長詞優先，「醫療流程」不再加計其中的「醫療」
+    assert router.classify("醫療流程")[1] == {"medical": 1, "engineering": 0}
+    assert router.classify("資料庫與系統架構")[1] == {"medical": 0, "engineering": 2}
+    print("✅ 詞彙去重與長詞優先測試通過")
+
+
+def test_route_answers_the_other_domain():
+    router = LexicalRouter()
+
+    def route(text, last_speaker):
+        state = {"messages": [AIMessage(content=text)], "last_speaker": last_speaker}
+        return asyncio.run(router.route(state, llm=None))
+
+    assert route("病患在急診等待病床", "engineer")["next"] == ENGINEER_NEXT
+    assert route("以雲端平台串接資料庫", "medical_expert")["next"] == MEDICAL_NEXT
+    # 無法判斷時退回輪流
+    decision = route("We should explain this again", "medical_expert")
+    assert decision["topic"] is None and decision["next"] == ENGINEER_NEXT
+    print("✅ 路由決策測試通過")
+
+
+if __name__ == "__main__":
+    test_latin_terms_match_whole_words()
+    test_duplicate_and_nested_terms_count_once()
+    test_route_answers_the_other_domain()
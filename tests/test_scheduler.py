@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+測試 reflection 工作排程：並行上限、優先通道、排隊位置與取消
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_runtime import PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from llm_runtime.ratelimit import current_priority
+from src.server.scheduler import JobScheduler
+
+
+def test_priority_lanes_and_positions():
+    async def scenario():
+        scheduler = JobScheduler(max_concurrent=1)
+        started, gates = [], {}
+
+        def job(name):
+            async def run():
+                started.append((name, current_priority()))
+                gates[name] = asyncio.Event()
+                await gates[name].wait()
+            return run
+
+        assert scheduler.submit("a", job("a")) == 0
+        assert scheduler.submit("b1", job("b1"), PRIORITY_BATCH) == 1
+        assert scheduler.submit("b2", job("b2"), PRIORITY_BATCH) == 2
+        # 互動請求插到批次請求之前
+        assert scheduler.submit("i", job("i"), PRIORITY_INTERACTIVE) == 1
+        assert [scheduler.position(j) for j in ("a", "i", "b1", "b2")] == [0, 1, 2, 3]
+
+        for expected in ("a", "i", "b1", "b2"):
+            await asyncio.sleep(0.01)
+            assert started[-1][0] == expected
+            gates[expected].set()
+        await asyncio.sleep(0.01)
+        assert started == [("a", "interactive"), ("i", "interactive"), ("b1", "batch"), ("b2", "batch")]
+        assert scheduler.stats()["finished"] == 4 and scheduler.running() == 0
+
+    asyncio.run(scenario())
+    print("✅ 優先通道與排隊位置測試通過")
+
+
+def test_cancel_queued_and_running_jobs():
+    async def scenario():
+        scheduler = JobScheduler(max_concurrent=1)
+        ran, cancelled = [], []
+
+        async def slow():
+            ran.append("slow")
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.append("slow")
+                raise
+
+        async def quick(name):
+            ran.append(name)
+
+        scheduler.submit("slow", slow)
+        scheduler.submit("queued", lambda: quick("queued"))
+        scheduler.submit("next", lambda: quick("next"))
+        await asyncio.sleep(0)
+
+        assert scheduler.cancel("queued") == "queued"
+        assert scheduler.position("next") == 1
+        # 取消執行中的工作後名額立即釋出給下一個
+        assert scheduler.cancel("slow") == "running"
+        assert scheduler.position("next") == 0
+        await asyncio.sleep(0.01)
+        assert ran == ["slow", "next"] and cancelled == ["slow"]
+        assert scheduler.cancel("slow") is None
+        assert scheduler.stats()["cancelled"] == 2
+
+    asyncio.run(scenario())
+    print("✅ 取消工作測試通過")
+
+
+if __name__ == "__main__":
+    test_priority_lanes_and_positions()
+    test_cancel_queued_and_running_jobs()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+測試 session store 的 LRU/TTL 淘汰與 SQLite 溢寫
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.server.session_store import InMemorySessionStore, SQLiteSessionStore
+
+
+def _session(status: str = "completed"):
+    return {"status": status, "query": "急診壅塞", "created_at": datetime.now()}
+
+
+def test_lru_spills_finished_sessions_and_reloads_lazily():
+    with tempfile.TemporaryDirectory() as tmp:
+        spill = SQLiteSessionStore(os.path.join(tmp, "sessions.db"))
+        evicted = []
+        store = InMemorySessionStore(max_sessions=2, spill=spill, on_evict=evicted.append)
+
+        store["a"] = _session()
+        store["b"] = _session("processing")
+        store["c"] = _session()
+
+        # "a" 是最久未使用且已完成的 session；"b" 仍在處理中不可被淘汰
+        assert evicted == ["a"]
+        assert len(store) == 2
+        assert "a" in spill
+
+        reloaded = store["a"]
+        assert isinstance(reloaded["created_at"], datetime)
+        assert store.stats()["spill_loads"] == 1
+    print("✅ LRU 淘汰與延遲載入測試通過")
+
+
+def test_ttl_evicts_idle_sessions():
+    store = InMemorySessionStore(ttl_seconds=0.01)
+    store["a"] = _session()
+    time.sleep(0.02)
+    store["b"] = _session()
+    assert "a" not in store
+    assert "b" in store
+    print("✅ TTL 淘汰測試通過")
+
+
+def test_persisted_active_sessions_are_found_after_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.db")
+        store = InMemorySessionStore(spill=SQLiteSessionStore(path))
+        store["a"] = _session("processing")
+        store["b"] = _session("processing")
+        store.persist("a")
+        store.persist("b")
+        store["b"]["status"] = "completed"
+        store.complete("b")
+
+        # 模擬 worker 重啟：新的 store 只從 SQLite 找回仍在處理中的 session
+        restarted = InMemorySessionStore(spill=SQLiteSessionStore(path))
+        assert [session_id for session_id, _ in restarted.interrupted()] == ["a"]
+        assert restarted["b"]["status"] == "completed"
+        restarted["a"] = _session("processing")
+        assert restarted.interrupted() == []
+    print("✅ 中斷 session 持久化測試通過")
+
+
+if __name__ == "__main__":
+    test_lru_spills_finished_sessions_and_reloads_lazily()
+    test_ttl_evicts_idle_sessions()
+    test_persisted_active_sessions_are_found_after_restart()
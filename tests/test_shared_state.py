@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+測試多 worker 共用狀態：兩個 store / event bus 實例共用同一個 SQLite 檔，模擬兩個 worker process
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.server.batch import SharedBatchRegistry
+from src.server.event_bus import SESSION_CLOSED, SharedEventBus
+from src.server.session_store import SharedSessionStore, SQLiteSessionStore
+
+
+def _worker(path: str, **kwargs) -> SharedSessionStore:
+    return SharedSessionStore(SQLiteSessionStore(path), **kwargs)
+
+
+def test_sessions_are_visible_across_workers():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.db")
+        a, b = _worker(path), _worker(path)
+
+        a["s1"] = {"status": "queued", "query": "急診壅塞", "created_at": datetime.now()}
+        assert b["s1"]["status"] == "queued"
+
+        a["s1"]["status"] = "processing"
+        a.persist("s1")
+        assert b["s1"]["status"] == "processing"
+        # 內容未變時沿用快取，不重新解碼
+        loads = b.stats()["spill_loads"]
+        assert b["s1"]["status"] == "processing"
+        assert b.stats()["spill_loads"] == loads
+
+        a["s1"]["status"] = "completed"
+        a.complete("s1")
+        assert b["s1"]["status"] == "completed"
+        assert "s1" in b and "missing" not in b
+        assert list(b) == ["s1"]
+    print("✅ 跨 worker session 可見性測試通過")
+
+
+def test_orphaned_sessions_are_claimed_once():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.db")
+        a, b, c = _worker(path), _worker(path), _worker(path)
+        a["s1"] = {"status": "processing", "query": "急診壅塞", "created_at": datetime.now()}
+
+        # a 仍在 heartbeat 時其他 worker 不接手
+        assert b.interrupted() == []
+
+        a.shutdown()
+        claimed = [session_id for session_id, _ in b.interrupted()]
+        assert claimed == ["s1"]
+        assert c.interrupted() == []
+    print("✅ 孤兒 session 接手測試通過")
+
+
+def test_cancel_requests_reach_the_owning_worker():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.db")
+        a, b = _worker(path), _worker(path)
+        a["s1"] = {"status": "processing", "query": "急診壅塞", "created_at": datetime.now()}
+        b.request_cancel("s1")
+        assert b.take_cancel_requests() == []
+        assert a.take_cancel_requests() == ["s1"]
+        assert a.take_cancel_requests() == []
+
+        # 反思已完成但仍在評估需求的 session 仍由 a 執行，取消請求不應被清掉
+        a["s1"]["status"] = "completed"
+        a.persist("s1")
+        assert b.owner("s1") == a.worker_id
+        b.request_cancel("s1")
+        assert a.take_cancel_requests() == ["s1"]
+
+        # 工作結束後不再有 owner，殘留的請求被清除
+        a.complete("s1")
+        assert b.owner("s1") is None
+        b.request_cancel("s1")
+        assert a.take_cancel_requests() == []
+        assert a.spill._conn.execute("SELECT COUNT(*) FROM cancel_requests").fetchone()[0] == 0
+    print("✅ 跨 worker 取消請求測試通過")
+
+
+def test_events_reach_subscribers_in_other_workers():
+    async def scenario(path):
+        publisher = SharedEventBus(path, poll_interval=0.01)
+        reader = SharedEventBus(path, poll_interval=0.01)
+        publisher.open("s1")
+        publisher.publish("s1", {"event_type": "reflection_started"})
+        publisher.flush()
+
+        subscription = reader.subscribe("s1")
+        assert [e["id"] for e in reader.events_after("s1", -1)] == [0]
+        publisher.publish("s1", {"event_type": "thinking_started"})
+        publisher.close("s1")
+
+        first = await subscription.get(timeout=2)
+        second = await subscription.get(timeout=2)
+        subscription.close()
+        assert first["id"] == 1 and first["event_type"] == "thinking_started"
+        assert second is SESSION_CLOSED
+        assert reader.is_closed("s1")
+        # 兩個 process 交錯發布時 id 仍連續
+        reader.open("s2")
+        publisher.publish("s2", {})
+        publisher.flush()
+        reader.publish("s2", {})
+        reader.flush()
+        assert [e["id"] for e in publisher.events_after("s2", -1)] == [0, 1]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(scenario(os.path.join(tmp, "events.db")))
+    print("✅ 跨 worker SSE 事件通知測試通過")
+
+
+def test_local_events_are_written_off_the_event_loop():
+    async def scenario(path):
+        bus = SharedEventBus(path)
+        bus.open("s1")
+        subscription = bus.subscribe("s1")
+        for index in range(50):
+            bus.publish("s1", {"event_type": "token_delta", "data": {"seq": index}})
+        bus.close("s1")
+
+        received = []
+        while True:
+            item = await subscription.get(timeout=2)
+            if item is SESSION_CLOSED:
+                break
+            received.append(item["id"])
+        subscription.close()
+        # 寫入執行緒依發布順序配號，關閉標記在所有事件之後送達
+        assert received == list(range(50))
+        assert [e["id"] for e in bus.events_after("s1", 47)] == [48, 49]
+
+        # session 恢復時重新開啟，id 接續而非歸零，Last-Event-ID 重連不會收到重複 id
+        bus.open("s1")
+        assert not bus.is_closed("s1")
+        bus.publish("s1", {"event_type": "reflection_resumed"})
+        bus.flush()
+        assert [e["id"] for e in bus.events_after("s1", 49)] == [50]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(scenario(os.path.join(tmp, "events.db")))
+    print("✅ 事件批次寫入與恢復後 id 接續測試通過")
+
+
+def test_batches_are_shared():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.db")
+        a, b = SharedBatchRegistry(path), SharedBatchRegistry(path)
+        batch = a.create(["s1", "s2"])
+        assert b.get(batch["batch_id"])["pending"] == {"s1", "s2"}
+        assert b.session_finished(batch["batch_id"], "s1") is False
+        assert a.session_finished(batch["batch_id"], "s2") is True
+        assert b.get(batch["batch_id"])["completed_at"] is not None
+    print("✅ 共用 batch 登錄測試通過")
+
+
+if __name__ == "__main__":
+    test_sessions_are_visible_across_workers()
+    test_orphaned_sessions_are_claimed_once()
+    test_cancel_requests_reach_the_owning_worker()
+    test_events_reach_subscribers_in_other_workers()
+    test_local_events_are_written_off_the_event_loop()
+    test_batches_are_shared()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+測試 LLM 用量統計：依 session / node / role / round 歸屬、成本估算、快取命中與錯誤
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from llm_runtime import FakeChatModel, LLMResponseCache, UsageCallbackHandler, UsageTracker, astream_message, usage_labels
+
+
+PROMPT = ChatPromptTemplate.from_messages([("human", "分析需求：{need}")])
+PRICES = {"fake-llm": (1.0, 2.0)}
+
+
+def _chain(tracker, **kwargs):
+    return PROMPT | FakeChatModel(callbacks=[UsageCallbackHandler(tracker)], **kwargs)
+
+
+def test_labels_attribute_calls():
+    async def scenario():
+        tracker = UsageTracker(prices=PRICES)
+        chain = _chain(tracker)
+        with usage_labels(session="s1"):
+            for round_no, (node, role) in enumerate([("medical_staff_agent", "medical_expert"),
+                                                     ("engineer_agent", "engineer")], start=1):
+                with usage_labels(node=node, role=role, round=round_no):
+                    # 串流呼叫亦記錄首字延遲
+                    await astream_message(chain, {"need": f"急診壅塞 {round_no}"}, lambda delta, seq: None)
+            with usage_labels(node="collector", role="collector"):
+                await chain.ainvoke({"need": "統整"})
+        # 未標記 session 的呼叫只計入 process 總計
+        await chain.ainvoke({"need": "背景呼叫"})
+        return tracker
+
+    tracker = asyncio.run(scenario())
+    session = tracker.session_summary("s1")
+    assert session["totals"]["calls"] == 3
+    assert set(session["by_node"]) == {"medical_staff_agent", "engineer_agent", "collector"}
+    assert set(session["by_role"]) == {"medical_expert", "engineer", "collector"}
+    assert set(session["by_round"]) == {"1", "2", "unlabeled"}
+
+    summary = tracker.summary()
+    assert summary["totals"]["calls"] == 4 and summary["sessions_tracked"] == 1
+    assert summary["by_node"]["unlabeled"]["calls"] == 1
+    assert summary["by_model"]["fake-llm"]["prompt_tokens"] > 0
+
+    tracker.discard("s1")
+    assert tracker.session_summary("s1") is None
+    print("✅ 用量標籤歸屬測試通過")
+
+
+def test_cost_estimate():
+    tracker = UsageTracker(prices=PRICES)
+    assert tracker.cost("fake-llm", 1_000_000, 500_000) == 2.0
+    # 帶日期版本沿用基礎型號單價；未知型號不計成本
+    assert tracker.cost("fake-llm-2025-04-14", 1_000_000, 0) == 1.0
+    assert tracker.cost("other", 1_000_000, 1_000_000) == 0.0
+
+    _chain(tracker).invoke({"need": "透析低血壓"})
+    totals = tracker.summary()["totals"]
+    expected = (totals["prompt_tokens"] * 1.0 + totals["completion_tokens"] * 2.0) / 1_000_000
+    assert abs(totals["cost_usd"] - round(expected, 6)) < 1e-9
+    print("✅ 成本估算測試通過")
+
+
+def test_cached_and_failed_calls():
+    tracker = UsageTracker(prices=PRICES)
+    chain = _chain(tracker, cache=LLMResponseCache())
+    with usage_labels(session="s1"):
+        chain.invoke({"need": "透析低血壓"})
+        chain.invoke({"need": "透析低血壓"})
+    totals = tracker.session_summary("s1")["totals"]
+    assert totals["calls"] == 2 and totals["cached_calls"] == 1
+    # 快取命中不計成本
+    first = tracker.cost("fake-llm", totals["prompt_tokens"] // 2, totals["completion_tokens"] // 2)
+    assert abs(totals["cost_usd"] - round(first, 6)) < 1e-9
+
+    # 串流路徑自行查詢快取，命中時同樣記為 cached 呼叫
+    async def stream():
+        with usage_labels(session="s1", role="engineer"):
+            return await astream_message(chain, {"need": "透析低血壓"}, lambda delta, seq: None)
+    asyncio.run(stream())
+    totals = tracker.session_summary("s1")["totals"]
+    assert totals["calls"] == 3 and totals["cached_calls"] == 2
+    assert tracker.session_summary("s1")["by_role"]["engineer"]["prompt_tokens"] > 0
+    assert tracker.summary()["by_model"]["fake-llm"]["cached_calls"] == 2
+
+    failing = _chain(tracker, latency="invalid")
+    try:
+        with usage_labels(session="s1"):
+            failing.invoke({"need": "錯誤"})
+    except Exception:
+        pass
+    assert tracker.session_summary("s1")["totals"]["errors"] == 1
+    print("✅ 快取命中與錯誤呼叫測試通過")
+
+
+if __name__ == "__main__":
+    test_labels_attribute_calls()
+    test_cost_estimate()
+    test_cached_and_failed_calls()